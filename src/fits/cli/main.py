@@ -1,17 +1,70 @@
 from __future__ import annotations
+from importlib import import_module
+from typing import TYPE_CHECKING, cast
 
 import typer
+from typer.core import TyperCommand, TyperGroup
+from typer.main import get_command
+if TYPE_CHECKING:
+    import click
+
+# Subcommands are imported when invoked, so `fits --help` (or a light command) does not pay for the imports of the
+# others (fits_io, pydantic models, the step registry...): name -> ("module:attribute", help shown by `fits --help`)
+LAZY_COMMANDS: dict[str, tuple[str, str]] = {
+    "metadata": ("fits.cli.metadata:metadata_app", "Change the channel labels or status of converted experiments."),
+    "pipeline": ("fits.cli.pipeline:pipeline_app", "Run, watch or plan the pipeline of a run."),
+    "worker": ("fits.cli.worker:worker", "Run distributed tasks from the broker of a run."),
+}
+
+
+def _load_command(name: str) -> click.Command:
+    module_name, attr = LAZY_COMMANDS[name][0].split(":")
+    obj = getattr(import_module(module_name), attr)
+    # Registered as app.add_typer / app.command would, in a throwaway group without shell completion options
+    parent = typer.Typer(add_completion=False)
+    parent.callback()(_no_options)
+    if isinstance(obj, typer.Typer):
+        parent.add_typer(obj, name=name)
+    else:
+        parent.command(name)(obj)
+    return cast("click.Group", get_command(parent)).commands[name]
+
+
+def _no_options() -> None:
+    pass
+
+
+class LazyGroup(TyperGroup):
+    """
+    Top-level group importing the module of a subcommand only when it is invoked.
+    """
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return [*super().list_commands(ctx), *(name for name in LAZY_COMMANDS if name not in self.commands)]
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name in LAZY_COMMANDS and cmd_name not in self.commands:
+            # Only listed (e.g. in the help of the group): a placeholder carrying the help is enough
+            return TyperCommand(cmd_name, help=LAZY_COMMANDS[cmd_name][1])
+        return super().get_command(ctx, cmd_name)
+
+    def resolve_command(self, ctx: click.Context, args: list[str]) -> tuple[str | None, click.Command | None, list[str]]:
+        if args and args[0] in LAZY_COMMANDS and args[0] not in self.commands:
+            self.add_command(_load_command(args[0]), args[0])
+        return super().resolve_command(ctx, args)
 
-from fits.cli.metadata import metadata_app
-from fits.cli.pipeline import pipeline_app
 
 app = typer.Typer(
+    cls=LazyGroup,
     no_args_is_help=True,
     help="FITS pipeline command line interface.",
 )
 
-app.add_typer(metadata_app, name="metadata")
-app.add_typer(pipeline_app, name="pipeline")
+
+@app.callback()
+def cli() -> None:
+    # Makes app a group whatever the number of eagerly registered commands (subcommands are in LAZY_COMMANDS)
+    pass
 
 
 def main() -> None:
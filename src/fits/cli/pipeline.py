@@ -1,21 +1,62 @@
+import json
 from pathlib import Path
 import typer
 
-from fits.pipeline import start_pipeline
-
+# Commands import the pipeline (fits_io, settings models, step registry) when they run, so `--help` stays fast
 pipeline_app = typer.Typer(no_args_is_help=True)
 
+def _settings_path(settings: Path | None) -> Path | None:
+    if settings is None:
+        return None
+    settings = settings.expanduser().resolve()
+    if not settings.exists():
+        raise typer.BadParameter(f"Settings file {settings} does not exist.")
+    if not settings.is_file():
+        raise typer.BadParameter(f"Settings path {settings} is not a file.")
+    return settings
+
 
 @pipeline_app.command("start")
 def start(
     settings: Path | None = typer.Option(None, "--settings", "-s", help="Path to user_settings.toml. If omitted, uses the default packaged settings.")
 ) -> None:
-    
-    if settings is not None:
-        settings = settings.expanduser().resolve()
-        if not settings.exists():
-            raise typer.BadParameter(f"Settings file {settings} does not exist.")
-        if not settings.is_file():
-            raise typer.BadParameter(f"Settings path {settings} is not a file.")
-
-    start_pipeline(settings_path=settings)
+    settings = _settings_path(settings)
+
+    from fits.pipeline import start_pipeline
+
+    if not start_pipeline(settings_path=settings):
+        raise typer.Exit(code=130)
+
+
+@pipeline_app.command("watch")
+def watch(
+    settings: Path | None = typer.Option(None, "--settings", "-s", help="Path to user_settings.toml. If omitted, uses the default packaged settings."),
+    interval: float = typer.Option(10.0, "--interval", "-i", min=0.1, help="Seconds between two polls of the run directory."),
+    settle: float = typer.Option(30.0, "--settle", min=0.0, help="Seconds a new file must stay unchanged (fully written) before it is processed."),
+) -> None:
+    settings = _settings_path(settings)
+
+    from fits.watch import watch_pipeline
+
+    watch_pipeline(settings_path=settings, interval=interval, settle=settle)
+
+
+
+@pipeline_app.command("plan")
+def plan(
+    settings: Path | None = typer.Option(None, "--settings", "-s", help="Path to user_settings.toml. If omitted, uses the default packaged settings."),
+    details: bool = typer.Option(False, "--details", "-d", help="List the decision and reason of every experiment."),
+    as_json: bool = typer.Option(False, "--json", help="Print the plan as JSON (e.g. to size a cluster job)."),
+) -> None:
+    """
+    Report what a run would do, without running it, writing anything or opening image data.
+
+    Lists the experiments to run or skip and why, the bytes to read and write and the projected wall time (from past
+    telemetry).
+    """
+    settings = _settings_path(settings)
+
+    from fits.plan import format_plan, plan_pipeline
+
+    run_plan = plan_pipeline(settings_path=settings)
+    typer.echo(json.dumps(run_plan.to_dict(details=details), indent=2) if as_json else format_plan(run_plan, details=details))
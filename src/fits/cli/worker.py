@@ -0,0 +1,24 @@
+from pathlib import Path
+import typer
+
+from fits.environment.log import configure_logging
+
+
+def worker(
+    broker: Path = typer.Option(..., "--broker", "-b", help="Broker database of the run (or the run directory holding .fits_broker.sqlite), on the shared storage."),
+    name: str | None = typer.Option(None, "--name", help="Worker name shown in the logs. Defaults to host:pid."),
+    poll: float = typer.Option(1.0, "--poll", min=0.1, help="Seconds between two looks at an empty queue."),
+    idle_exit: float | None = typer.Option(None, "--idle-exit", min=0.0, help="Exit after this many seconds without tasks. By default, the worker runs until Ctrl+C."),
+    log_dir: Path | None = typer.Option(None, "--log-dir", help="Optional directory for the worker log file."),
+) -> None:
+    """
+    Run distributed tasks (execution = "distributed") from the broker of a run.
+    """
+    broker = broker.expanduser().resolve()
+    if not broker.exists() and not broker.parent.is_dir():
+        raise typer.BadParameter(f"Neither the broker {broker} nor its directory exist.")
+
+    from fits.workflows.broker import run_worker
+
+    configure_logging(log_dir=log_dir, mode="cli")
+    run_worker(broker, name=name, poll=poll, idle_exit=idle_exit)
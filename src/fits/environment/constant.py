@@ -3,6 +3,7 @@ from typing import Literal
 
 
 STEP_CONVERT = "convert"
+STEP_ENTRY_POINT_GROUP = "fits.steps"
 
 DIST_IO = "fits-io"
 
@@ -11,8 +12,25 @@ FITS_ARRAY_NAME = "fits_array.tif"
 FITS_MASK_NAME = "fits_mask.tif"
 FITS_FILES: set[FitsName] = {FITS_ARRAY_NAME, FITS_MASK_NAME}
 
+STATE_FILE_NAME = "experiment_state.json"
+STATE_DB_NAME = "fits_states.sqlite"
+# Run-level bookkeeping folder, skipped by the discovery walks: writing in it never makes the run_dir look changed
+RUN_META_DIR = ".fits"
+DISCOVERY_SNAPSHOT_NAME = "discovery.json"  # in RUN_META_DIR
+STATE_JOURNAL_NAME = ".fits_state_journal.jsonl"
+FAILED_STATES_NAME = ".fits_failed_states.json"
+BROKER_DB_NAME = ".fits_broker.sqlite"
+
+StateBackend = Literal["json", "sqlite"]
+
 EXCLUDED_PREFIXES = {'fits_'}
 
 UIMode = Literal["cli", "gui", "notebook"]
 
-ExecMode = Literal["serial", "thread", "process"]
\ No newline at end of file
+ExecMode = Literal["serial", "thread", "process", "distributed"]
+
+ErrorMode = Literal["fail_fast", "continue", "retry"]
+
+Schedule = Literal["input", "largest_first"]
+
+CacheLink = Literal["auto", "reflink", "hardlink", "copy"]
\ No newline at end of file
@@ -1,6 +1,15 @@
-from dataclasses import dataclass
+from __future__ import annotations
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import TYPE_CHECKING
 
 from fits.environment.constant import UIMode
+if TYPE_CHECKING:
+    from fits.environment.statcache import StatCache
+    from fits.environment.store import StateStore
+    from fits.workflows.executors import CancelToken, WorkerPools
+    from fits.workflows.cache import OutputCache
+    from fits.workflows.memory import MemoryBudget
 
 
 @dataclass
@@ -11,8 +20,30 @@ class ExecutionContext:
         user_name : Name of the user executing the pipeline.
         dry_run : If True, simulate actions without making changes.
         mode : Execution mode, can be 'cli', 'gui', or 'notebook'.
+        state_store : Optional backend used to persist experiment states. If None, states are saved as per-workdir JSON files.
+        stat_cache : Optional run-scoped cache of directory listings used by existence checks (e.g. needs_run).
+        memory_budget : Optional run-wide RAM budget used to admit step tasks by their estimated footprint.
+        worker_pools : Optional warm worker pools reused by every step of the run.
+        cancel : Optional run-wide cancellation token (set on SIGINT/SIGTERM); executors drain once it is cancelled.
+        broker : Optional broker database (or directory holding it) used by the distributed execution mode.
+        telemetry_dir : Optional directory where steps write their executor telemetry (per-task timings). None disables it.
+        output_cache : Optional content-addressed cache of step outputs shared across runs.
     """
     
     user_name: str
     dry_run: bool = False
     mode: UIMode = "cli"
+    state_store: StateStore | None = None
+    stat_cache: StatCache | None = None
+    memory_budget: MemoryBudget | None = None
+    worker_pools: WorkerPools | None = None
+    cancel: CancelToken | None = None
+    broker: Path | None = None
+    telemetry_dir: Path | None = None
+    output_cache: OutputCache | None = None
+
+    def portable(self) -> ExecutionContext:
+        """
+        Return a copy that can be sent to worker processes: process-local resources (state store, stat cache, memory budget, worker pools, cancellation token) are dropped.
+        """
+        return replace(self, state_store=None, stat_cache=None, memory_budget=None, worker_pools=None, cancel=None)
@@ -1,51 +1,338 @@
+from __future__ import annotations
+from dataclasses import dataclass, field
+from functools import lru_cache
+import json
 import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Literal
 
 from pathlib import Path
-from fits_io import SUPPORTED_EXTENSIONS
 
-from fits.environment.constant import EXCLUDED_PREFIXES, FITS_FILES
+from fits.environment.constant import DISCOVERY_SNAPSHOT_NAME, EXCLUDED_PREFIXES, FITS_FILES, RUN_META_DIR, STATE_FILE_NAME
+if TYPE_CHECKING:
+    from fits.environment.statcache import StatCache
 
 
 logger = logging.getLogger(__name__)
 
+SNAPSHOT_VERSION = 2
+# Coarsest mtime granularity of the filesystems runs live on (FAT: 2 s, ext3/HFS+ and some NFS servers: 1 s). A
+# directory changed within this window after it was listed may keep the same mtime: it is listed again next time.
+RACY_MTIME_WINDOW_NS = 2_000_000_000
 
-def collect_supported_files(directory: Path) -> list[Path]:
+
+@dataclass(frozen=True)
+class RunIndex:
+    """
+    Classified listing of a run directory, built in a single traversal.
+
+    Attributes:
+        root: Directory that was indexed.
+        raw_files: Sorted supported raw image files (excluded prefixes removed).
+        fits_outputs: Sorted FITS output files (by expected filenames).
+        state_files: Sorted saved ``experiment_state.json`` files.
+    """
+
+    root: Path
+    raw_files: list[Path] = field(default_factory=list)
+    fits_outputs: list[Path] = field(default_factory=list)
+    state_files: list[Path] = field(default_factory=list)
+
+
+FileKind = Literal["raw", "fits", "state"]
+
+_PREFIXES = tuple(EXCLUDED_PREFIXES)
+
+
+@lru_cache(maxsize=1)
+def _supported_extensions() -> frozenset[str]:
+    # fits_io (and its readers) is imported on the first walk, not with this module
+    from fits_io import SUPPORTED_EXTENSIONS
+    return frozenset(e.lower() for e in SUPPORTED_EXTENSIONS)
+
+
+def _classify(name: str) -> FileKind | None:
+    """
+    Classify a file name as raw image, FITS output or saved state, or None if irrelevant to the run.
+    """
+    lower = name.lower()
+    if lower in FITS_FILES:
+        return "fits"
+    if name == STATE_FILE_NAME:
+        return "state"
+    if not name.startswith(_PREFIXES) and os.path.splitext(lower)[1] in _supported_extensions():
+        return "raw"
+    return None
+
+
+def _build_index(directory: Path, classified: Iterable[tuple[Path, FileKind]]) -> RunIndex:
+    buckets: dict[FileKind, list[Path]] = {"raw": [], "fits": [], "state": []}
+    for path, kind in classified:
+        buckets[kind].append(path)
+    for paths in buckets.values():
+        paths.sort()
+    logger.debug(f"Indexed {directory}: {len(buckets['raw'])} raw files, {len(buckets['fits'])} FITS outputs, {len(buckets['state'])} saved states")
+    return RunIndex(directory, buckets["raw"], buckets["fits"], buckets["state"])
+
+
+def walk_run_dir(directory: Path, *, stat_cache: StatCache | None = None) -> Iterator[tuple[Path, list[tuple[Path, FileKind]]]]:
+    """
+    Walk a directory with ``os.scandir`` and yield the classified files of each directory as soon as it is complete.
+
+    Directories are yielded bottom-up (a directory comes after all of its subdirectories, in sorted order), so the
+    saved states of the workdirs next to a raw file are known before the raw file itself is yielded. File type checks
+    rely on the ``DirEntry`` cache (no extra stat per entry on most platforms), and symlinked directories are not
+    followed, matching ``Path.rglob``. ``RUN_META_DIR`` folders are skipped.
+
+    Args:
+        directory: Root directory to walk.
+        stat_cache: Optional StatCache primed with every directory listing made during the walk.
+
+    Yields:
+        (directory, sorted (path, kind) pairs of the files directly in it).
+    """
+    stack: list[tuple[Path, list[tuple[Path, FileKind]] | None]] = [(directory, None)]
+    while stack:
+        current, done = stack.pop()
+        if done is not None:
+            yield current, done
+            continue
+        try:
+            with os.scandir(current) as it:
+                entries = list(it)
+        except OSError as exc:
+            logger.warning("Cannot list directory %s: %s", current, exc)
+            continue
+        if stat_cache is not None:
+            stat_cache.prime(current, (entry.name for entry in entries))
+
+        classified: list[tuple[Path, FileKind]] = []
+        subdirs: list[Path] = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != RUN_META_DIR:
+                        subdirs.append(current / entry.name)
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            kind = _classify(entry.name)
+            if kind is not None:
+                classified.append((current / entry.name, kind))
+
+        classified.sort()
+        stack.append((current, classified))
+        stack.extend((d, None) for d in sorted(subdirs, reverse=True))
+
+
+def index_run_dir(directory: Path, *, stat_cache: StatCache | None = None) -> RunIndex:
+    """
+    Walk a directory once with ``os.scandir`` and classify every file entry.
+
+    Args:
+        directory: Root directory to index.
+        stat_cache: Optional StatCache primed with every directory listing made during the walk.
+
+    Returns:
+        RunIndex holding the raw images, FITS outputs and saved state files found under directory.
+    """
+    return _build_index(directory, (item for _, files in walk_run_dir(directory, stat_cache=stat_cache) for item in files))
+
+
+# ---------------------------------------------------------------------
+# Incremental rediscovery
+# ---------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Rediscovery:
+    """
+    Result of an incremental rediscovery of a run directory.
+
+    Attributes:
+        index: Up-to-date RunIndex, identical to what index_run_dir would return.
+        added: Raw files that were not in the previous snapshot.
+        removed: Raw files of the previous snapshot that are gone.
+        modified: Raw files whose size or mtime changed, in the directories that had to be rescanned.
+        scanned_dirs: Number of directories listed again.
+        reused_dirs: Number of directories taken from the snapshot (unchanged mtime).
+    """
+
+    index: RunIndex
+    added: list[Path] = field(default_factory=list)
+    removed: list[Path] = field(default_factory=list)
+    modified: list[Path] = field(default_factory=list)
+    scanned_dirs: int = 0
+    reused_dirs: int = 0
+
+
+def _scan_dir(path: Path, mtime_ns: int) -> dict[str, Any]:
+    """
+    List one directory and record its classified files (with size and mtime), its subdirectories, the names of all
+    its entries (to prime a StatCache) and when it was listed.
+    """
+    files: dict[str, list[int]] = {}
+    subdirs: list[str] = []
+    names: list[str] = []
+    scanned_ns = time.time_ns()
+    with os.scandir(path) as it:
+        for entry in it:
+            names.append(entry.name)
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != RUN_META_DIR:
+                        subdirs.append(entry.name)
+                elif entry.is_file() and _classify(entry.name) is not None:
+                    st = entry.stat()
+                    files[entry.name] = [st.st_size, st.st_mtime_ns]
+            except OSError:
+                continue
+    return {"mtime_ns": mtime_ns, "scanned_ns": scanned_ns, "files": files, "subdirs": subdirs, "names": names}
+
+
+def _is_settled(record: dict[str, Any], mtime_ns: int) -> bool:
+    # Same mtime as when listed, and listed long enough after that mtime that a later change would have moved it
+    return record.get("mtime_ns") == mtime_ns and record.get("scanned_ns", 0) - mtime_ns >= RACY_MTIME_WINDOW_NS
+
+
+def _load_snapshot(snapshot_path: Path) -> dict[str, Any]:
+    try:
+        raw = json.loads(snapshot_path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as exc:
+        logger.warning("Ignoring unreadable discovery snapshot %s: %s", snapshot_path, exc)
+        return {}
+    if not isinstance(raw, dict) or raw.get("version") != SNAPSHOT_VERSION or not isinstance(raw.get("dirs"), dict):
+        return {}
+    return raw["dirs"]
+
+
+def _save_snapshot(snapshot_path: Path, dirs: dict[str, Any]) -> None:
+    payload = json.dumps({"version": SNAPSHOT_VERSION, "dirs": dirs})
+    temp_path = snapshot_path.with_name(f".{snapshot_path.name}.tmp")
+    try:
+        snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path.write_text(payload, encoding="utf-8")
+        os.replace(temp_path, snapshot_path)
+    except OSError as exc:
+        # The snapshot is only a cache: the next run falls back to a full walk
+        logger.warning("Could not save discovery snapshot %s: %s", snapshot_path, exc)
+        temp_path.unlink(missing_ok=True)
+
+
+def rediscover_run_dir(directory: Path, snapshot_path: Path | None = None, *, stat_cache: StatCache | None = None) -> Rediscovery:
+    """
+    Index a run directory, listing again only the directories whose mtime changed since the last snapshot.
+
+    Unchanged directories cost a single stat: their classified files and subdirectories are taken from the snapshot
+    persisted in the ``RUN_META_DIR`` folder of directory, which is rewritten at the end of the call only if a directory
+    was listed again or removed. The folder is not walked, so saving the snapshot does not change the mtime of the
+    directories it records: a watched run settles and later calls only stat its directories.
+    A file rewritten in place (without being re-created) does not change its directory mtime and is therefore not reported as modified.
+    As in git's racy-index check, a directory whose mtime was within RACY_MTIME_WINDOW_NS of the time it was listed is
+    listed again, since an entry added right after that listing may not have changed its mtime.
+
+    Args:
+        directory: Root directory to index.
+        snapshot_path: Optional snapshot location. Defaults to ``directory / RUN_META_DIR / DISCOVERY_SNAPSHOT_NAME``.
+        stat_cache: Optional StatCache primed with the listing of every directory, listed or taken from the snapshot.
+
+    Returns:
+        Rediscovery with the up-to-date index and the raw files added, removed or modified since the last snapshot.
+    """
+    snapshot_path = snapshot_path or directory / RUN_META_DIR / DISCOVERY_SNAPSHOT_NAME
+    previous = _load_snapshot(snapshot_path)
+    current: dict[str, Any] = {}
+    scanned = reused = 0
+
+    stack = ["."]
+    while stack:
+        rel = stack.pop()
+        abs_dir = directory / rel
+        try:
+            mtime_ns = os.stat(abs_dir).st_mtime_ns
+            old = previous.get(rel)
+            if old is not None and _is_settled(old, mtime_ns):
+                record = old
+                reused += 1
+            else:
+                record = _scan_dir(abs_dir, mtime_ns)
+                scanned += 1
+        except OSError as exc:
+            logger.warning("Cannot list directory %s: %s", abs_dir, exc)
+            continue
+        current[rel] = record
+        if stat_cache is not None:
+            stat_cache.prime(abs_dir, record["names"])
+        stack.extend((Path(rel) / name).as_posix() for name in record["subdirs"])
+
+    def raw_stats(dirs: dict[str, Any]) -> dict[Path, list[int]]:
+        return {
+            directory / rel / name: stat
+            for rel, record in dirs.items()
+            for name, stat in record["files"].items()
+            if _classify(name) == "raw"
+        }
+
+    old_raw = raw_stats(previous)
+    new_raw = raw_stats(current)
+    index = _build_index(directory, (
+        (directory / rel / name, kind)
+        for rel, record in current.items()
+        for name in record["files"]
+        if (kind := _classify(name)) is not None
+    ))
+    if scanned or current.keys() != previous.keys():
+        _save_snapshot(snapshot_path, current)
+
+    result = Rediscovery(
+        index=index,
+        added=sorted(p for p in new_raw if p not in old_raw),
+        removed=sorted(p for p in old_raw if p not in new_raw),
+        modified=sorted(p for p, stat in new_raw.items() if p in old_raw and old_raw[p] != stat),
+        scanned_dirs=scanned,
+        reused_dirs=reused,
+    )
+    logger.debug(f"Rediscovered {directory}: {scanned} directories listed, {reused} reused from snapshot")
+    return result
+
+
+def collect_supported_files(directory: Path, *, index: RunIndex | None = None) -> list[Path]:
     """
     Collect all supported image files under a directory.
 
+    Args:
+        directory: Path to the directory to search.
+        index: Optional pre-built RunIndex of directory, to avoid walking it again.
+
     Returns:
         Sorted list of image file paths.
     """
-    prefixes = tuple(EXCLUDED_PREFIXES)
-    exts = {e.lower() for e in SUPPORTED_EXTENSIONS}
-    
-    supported_files: set[Path] = set()
-    for p in directory.rglob("*"):
-        if not p.is_file():
-            continue
-        if p.name.startswith(prefixes):
-            continue
-        if p.suffix.lower() in exts:
-            supported_files.add(p)
-            logger.debug(f"Found supported file: {p}")
-    
-    return sorted(supported_files)
+    if index is None:
+        index = index_run_dir(directory)
+
+    for p in index.raw_files:
+        logger.debug(f"Found supported file: {p}")
+    return list(index.raw_files)
 
-def find_fits_outputs(directory: Path) -> list[Path]:
+def find_fits_outputs(directory: Path, *, index: RunIndex | None = None) -> list[Path]:
     """
     Find all FITS files output (by expected filenames) in a directory and its subdirectories.
-    
+
     Args:
         directory: Path to the directory to search.
+        index: Optional pre-built RunIndex of directory, to avoid walking it again.
     """
-    fits_files: set[Path] = set()
-    for p in directory.rglob("*"):
-        if not p.is_file():
-            continue
-        if p.name.lower() in FITS_FILES:
-            fits_files.add(p)
-            logger.debug(f"Found FITS output file: {p}")
-    return sorted(fits_files)
+    if index is None:
+        index = index_run_dir(directory)
+
+    for p in index.fits_outputs:
+        logger.debug(f"Found FITS output file: {p}")
+    return list(index.fits_outputs)
 
 
 
@@ -54,7 +341,7 @@ def find_fits_outputs(directory: Path) -> list[Path]:
 
 
 if __name__ == "__main__":
-    
-    
-    for tag in SUPPORTED_EXTENSIONS:
-        print(tag)
\ No newline at end of file
+
+
+    for tag in sorted(_supported_extensions()):
+        print(tag)
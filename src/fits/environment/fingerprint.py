@@ -0,0 +1,117 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from functools import lru_cache
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+if TYPE_CHECKING:
+    from fits.environment.statcache import StatCache
+
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BLOCK_SIZE = 1 << 20  # 1 MiB read at each end of the file
+CONTENT_DIGEST_BLOCK_SIZE = 8 << 20  # 8 MiB read at a time when hashing a whole file
+
+
+@dataclass(frozen=True)
+class SourceFingerprint:
+    """
+    Cheap identity of a raw image file: size, modification time and a hash of its first and last blocks.
+
+    Attributes:
+        size: File size in bytes.
+        mtime_ns: Modification time in nanoseconds.
+        digest: Hex digest of the head and tail blocks (and size).
+    """
+
+    size: int
+    mtime_ns: int
+    digest: str
+
+    def dump(self) -> dict[str, Any]:
+        return {"size": self.size, "mtime_ns": self.mtime_ns, "digest": self.digest}
+
+    def changed(self, path: Path, stat_cache: StatCache | None = None, *, read: bool = True) -> bool:
+        """
+        Return True if path no longer matches this fingerprint.
+
+        Same size and mtime is trusted without reading the file; a different mtime with the same size is settled by the
+        head/tail digest, so touching or copying a file does not count as a change. Without read, the file is never
+        opened and a different mtime counts as a change. A missing file is not a change (raw files may be archived once
+        converted). With stat_cache, the source is stated once per run however many series share it, and the digest
+        of a given size and mtime is computed once.
+        """
+        if stat_cache is not None:
+            st = stat_cache.stat(path)
+        else:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None
+        if st is None:
+            logger.debug("Source %s is missing; keeping its previous outputs", path)
+            return False
+        if st.st_size != self.size:
+            return True
+        if st.st_mtime_ns == self.mtime_ns:
+            return False
+        if not read:
+            return True
+        if stat_cache is not None:
+            return _memoised_digest(path, st.st_size, st.st_mtime_ns) != self.digest
+        return _digest(path, st.st_size) != self.digest
+
+
+def _digest(path: Path, size: int, block_size: int = FINGERPRINT_BLOCK_SIZE) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(size.to_bytes(8, "little"))
+    with open(path, "rb") as handle:
+        h.update(handle.read(block_size))
+        if size > block_size:
+            handle.seek(max(block_size, size - block_size))
+            h.update(handle.read(block_size))
+    return h.hexdigest()
+
+
+@lru_cache(maxsize=4096)
+def _memoised_digest(path: Path, size: int, mtime_ns: int) -> str:
+    # Keyed by size and mtime too, so a source modified again is digested again
+    return _digest(path, size)
+
+
+def compute_fingerprint(path: Path) -> SourceFingerprint:
+    """
+    Fingerprint a file by reading at most two blocks of FINGERPRINT_BLOCK_SIZE bytes, whatever its size.
+
+    Args:
+        path: File to fingerprint.
+    """
+    st = os.stat(path)
+    return SourceFingerprint(st.st_size, st.st_mtime_ns, _digest(path, st.st_size))
+
+
+def content_digest(path: Path, block_size: int = CONTENT_DIGEST_BLOCK_SIZE) -> str:
+    """
+    Hex digest of the whole content (and size) of a file.
+
+    Unlike the head/tail digest of a SourceFingerprint, two files only share it if every byte is equal, which is what
+    content-addressed reuse of outputs needs. It reads the whole file, so it is only computed right before the file is
+    read for conversion (which then finds it in the page cache).
+
+    Args:
+        path: File to hash.
+        block_size: Bytes read at a time.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    size = 0
+    with open(path, "rb", buffering=0) as handle:
+        while n := handle.readinto(buffer):
+            h.update(view[:n])
+            size += n
+    h.update(size.to_bytes(8, "little"))
+    return h.hexdigest()
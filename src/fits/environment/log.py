@@ -3,15 +3,8 @@ import logging
 import sys
 from pathlib import Path
 from datetime import datetime
-from typing import Literal
-
-try:
-    from PySide6.QtCore import QObject, Signal
-    PYSIDE_AVAILABLE = True
-except ImportError:
-    QObject = None
-    Signal = None
-    PYSIDE_AVAILABLE = False
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Literal
 
 from fits.environment.constant import UIMode
 
@@ -30,7 +23,23 @@ _LEVEL_MAP: dict[LevelName, int] = {
 # GUI logging (Qt handler)
 # ---------------------------------------------------------------------
 
-if PYSIDE_AVAILABLE and QObject is not None and Signal is not None:
+# PySide6 is slow to import and only needed in GUI mode: LogEmitter, QtLogHandler and PYSIDE_AVAILABLE are built on
+# first access (module __getattr__), not when the CLI imports this module.
+_QT_ATTRS = ("LogEmitter", "QtLogHandler", "PYSIDE_AVAILABLE")
+
+if TYPE_CHECKING:
+    LogEmitter: Any
+    QtLogHandler: Any
+    PYSIDE_AVAILABLE: bool
+
+
+@lru_cache(maxsize=1)
+def _load_qt() -> dict[str, Any]:
+    try:
+        from PySide6.QtCore import QObject, Signal
+    except ImportError:
+        # Dummy placeholders so type-checkers don’t complain
+        return {"LogEmitter": None, "QtLogHandler": None, "PYSIDE_AVAILABLE": False}
 
     class LogEmitter(QObject):
         """
@@ -56,11 +65,13 @@ if PYSIDE_AVAILABLE and QObject is not None and Signal is not None:
             except Exception:
                 self.handleError(record)
 
+    return {"LogEmitter": LogEmitter, "QtLogHandler": QtLogHandler, "PYSIDE_AVAILABLE": True}
+
 
-else:
-    # Dummy placeholders so type-checkers don’t complain
-    LogEmitter = None # type: ignore
-    QtLogHandler = None # type: ignore
+def __getattr__(name: str) -> Any:
+    if name in _QT_ATTRS:
+        return _load_qt()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ---------------------------------------------------------------------
 # Public API
@@ -104,10 +115,11 @@ def configure_logging(*, log_dir: Path | None, mode: UIMode = "cli", console_lev
         if gui_emitter is None:
             raise ValueError("GUI mode requires a LogEmitter instance")
         
-        if not PYSIDE_AVAILABLE:
+        qt = _load_qt()
+        if not qt["PYSIDE_AVAILABLE"]:
             raise RuntimeError("PySide6 is not available but GUI mode was requested")
 
-        handler: logging.Handler = QtLogHandler(gui_emitter)
+        handler: logging.Handler = qt["QtLogHandler"](gui_emitter)
     else:
         # CLI & notebook use stdout
         handler = logging.StreamHandler(sys.stdout)
@@ -1,12 +1,22 @@
 from contextlib import contextmanager
 from contextvars import ContextVar
-from typing import Iterator, cast
+import logging
+import signal
+import threading
+from typing import TYPE_CHECKING, Iterator, cast
 
 from fits.environment.constant import UIMode
 from fits.environment.context import ExecutionContext
 
+if TYPE_CHECKING:
+    from fits.workflows.executors import CancelToken
+
+
+logger = logging.getLogger(__name__)
+
 
 CURRENT_CTX: ContextVar[ExecutionContext] = ContextVar("CURRENT_CTX")
+WORKER_IGNORED_SIGNALS = (signal.SIGINT, signal.SIGTERM)
 
 def get_ctx() -> ExecutionContext:
     try:
@@ -14,6 +24,46 @@ def get_ctx() -> ExecutionContext:
     except LookupError:
         raise RuntimeError("ExecutionContext is not set. Call with use_ctx(ctx): ...")
 
+def init_worker_ctx(ctx: ExecutionContext) -> None:
+    """
+    Process-pool initializer: make ctx the current ExecutionContext of the worker process.
+    
+    ContextVars are not inherited by child processes, so get_ctx() would fail there without it.
+    Workers also ignore SIGINT and SIGTERM: Ctrl+C (or a kill of the process group, e.g. by a job scheduler) reaches
+    every worker, and the parent decides how to drain, letting running tasks finish and save their states.
+    """
+    if threading.current_thread() is threading.main_thread():
+        for sig in WORKER_IGNORED_SIGNALS:
+            signal.signal(sig, signal.SIG_IGN)
+    CURRENT_CTX.set(ctx)
+
+@contextmanager
+def handle_signals(token: "CancelToken | None") -> Iterator[None]:
+    """
+    Turn SIGINT/SIGTERM into a graceful cancellation of token while the block runs.
+    
+    The first signal cancels the token (executors stop submitting, drop queued tasks and let running ones finish); a
+    second SIGINT interrupts immediately. Outside the main thread (e.g. GUI worker) signals cannot be handled, and the
+    block runs unchanged.
+    """
+    if token is None or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    def on_signal(signum: int, _frame: object) -> None:
+        name = signal.Signals(signum).name
+        if token.cancelled and signum == signal.SIGINT:
+            raise KeyboardInterrupt
+        logger.warning(f"Received {name}: finishing running tasks and saving their states (press Ctrl+C again to abort)")
+        token.cancel(name)
+
+    previous = {sig: signal.signal(sig, on_signal) for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        yield
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+
 @contextmanager
 def use_ctx(ctx: ExecutionContext) -> Iterator[None]:
     token = CURRENT_CTX.set(ctx)
@@ -4,9 +4,17 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+from fits.environment.fingerprint import SourceFingerprint
+
+
+# Written by serialize_experiment_state. Payloads carrying the current version were produced by this module
+# and take the fast path in deserialize_experiment_state; bump it whenever the layout changes.
+STATE_SCHEMA_VERSION = 2
+
 
 def serialize_experiment_state(state: Any) -> dict[str, Any]:
     return {
+        "schema_version": STATE_SCHEMA_VERSION,
         "run_dir": str(state.run_dir),
         "original_image_rel": str(state.original_image_rel),
         "image_rel": str(state.image_rel) if state.image_rel is not None else None,
@@ -18,6 +26,29 @@ def serialize_experiment_state(state: Any) -> dict[str, Any]:
         "step_settings_hash": state.step_settings_hash,
         "last_error": state.last_error,
         "updated_at": state.updated_at.isoformat() if state.updated_at is not None else None,
+        "source_fingerprint": state.source_fingerprint.dump() if state.source_fingerprint is not None else None,
+    }
+
+
+def _deserialize_trusted(raw: dict[str, Any]) -> dict[str, Any]:
+    """Convert a payload of the current schema version without re-validating every field."""
+    image_rel = raw["image_rel"]
+    masks_rel = raw["masks_rel"]
+    updated_at = raw["updated_at"]
+    fingerprint = raw["source_fingerprint"]
+    return {
+        "run_dir": Path(raw["run_dir"]),
+        "original_image_rel": Path(raw["original_image_rel"]),
+        "image_rel": Path(image_rel) if image_rel is not None else None,
+        "masks_rel": Path(masks_rel) if masks_rel is not None else None,
+        "last_step": raw["last_step"],
+        "experiment_id": raw["experiment_id"],
+        "series_index": raw["series_index"],
+        "step_status": dict(raw["step_status"]),
+        "step_settings_hash": dict(raw["step_settings_hash"]),
+        "last_error": raw["last_error"],
+        "updated_at": datetime.fromisoformat(updated_at) if updated_at is not None else None,
+        "source_fingerprint": SourceFingerprint(**fingerprint) if fingerprint is not None else None,
     }
 
 
@@ -25,6 +56,12 @@ def deserialize_experiment_state(raw: Any) -> dict[str, Any]:
     if not isinstance(raw, dict):
         raise TypeError("Experiment state JSON root must be an object.")
 
+    if raw.get("schema_version") == STATE_SCHEMA_VERSION:
+        try:
+            return _deserialize_trusted(raw)
+        except (KeyError, TypeError, ValueError):
+            pass  # fall through to the full validation for a precise error
+
     def required(name: str) -> Any:
         if name not in raw:
             raise KeyError(f"Missing required key: {name}")
@@ -72,6 +109,20 @@ def deserialize_experiment_state(raw: Any) -> dict[str, Any]:
         except ValueError as exc:
             raise ValueError(f"{name} is not a valid ISO datetime.") from exc
 
+    def as_optional_fingerprint(name: str, value: Any) -> SourceFingerprint | None:
+        if value is None:
+            return None
+        if not isinstance(value, dict):
+            raise TypeError(f"{name} must be an object or null.")
+        try:
+            return SourceFingerprint(
+                size=as_int(f"{name}.size", value["size"]),
+                mtime_ns=as_int(f"{name}.mtime_ns", value["mtime_ns"]),
+                digest=as_optional_str(f"{name}.digest", value["digest"]) or "",
+            )
+        except KeyError as exc:
+            raise KeyError(f"Missing required key: {name}.{exc.args[0]}") from exc
+
     return {
         "run_dir": as_path("run_dir", required("run_dir")),
         "original_image_rel": as_path("original_image_rel", required("original_image_rel")),
@@ -84,4 +135,5 @@ def deserialize_experiment_state(raw: Any) -> dict[str, Any]:
         "step_settings_hash": as_str_map("step_settings_hash", raw.get("step_settings_hash", {})),
         "last_error": as_optional_str("last_error", raw.get("last_error")),
         "updated_at": as_optional_datetime("updated_at", raw.get("updated_at")),
+        "source_fingerprint": as_optional_fingerprint("source_fingerprint", raw.get("source_fingerprint")),
     }
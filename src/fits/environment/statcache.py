@@ -0,0 +1,85 @@
+from __future__ import annotations
+import os
+from pathlib import Path
+import threading
+from typing import Iterable
+
+
+class StatCache:
+    """
+    Run-scoped cache of directory listings, used to answer existence checks without one stat per file.
+
+    The first check in a directory lists it once with ``os.scandir``; later checks in the same directory are set lookups.
+    Whoever writes into a directory during the run must call ``invalidate`` so the next check lists it again.
+    ``stat`` memoises the metadata of files read many times per run (e.g. a raw file shared by all of its series); it is
+    forgotten with the listing of the directory (``invalidate``, or a new listing passed to ``prime``).
+    The cache is shared between worker threads.
+    """
+
+    def __init__(self) -> None:
+        self._listings: dict[Path, frozenset[str]] = {}
+        self._stats: dict[Path, dict[str, os.stat_result | None]] = {}
+        self._lock = threading.Lock()
+        self.listings_done = 0
+
+    def _listing(self, directory: Path) -> frozenset[str]:
+        with self._lock:
+            names = self._listings.get(directory)
+        if names is not None:
+            return names
+
+        try:
+            with os.scandir(directory) as it:
+                names = frozenset(entry.name for entry in it)
+        except (FileNotFoundError, NotADirectoryError):
+            names = frozenset()
+
+        with self._lock:
+            self._listings[directory] = names
+            self.listings_done += 1
+        return names
+
+    def prime(self, directory: Path, names: Iterable[str]) -> None:
+        """
+        Record a complete listing of directory obtained elsewhere (e.g. during discovery).
+        """
+        with self._lock:
+            self._listings[directory] = frozenset(names)
+            self._stats.pop(directory, None)
+
+    def exists(self, path: Path) -> bool:
+        """
+        Return True if path exists, based on the cached listing of its parent directory.
+        """
+        return path.name in self._listing(path.parent)
+
+    def stat(self, path: Path) -> os.stat_result | None:
+        """
+        Return the stat of path (None if it is missing), made once per run unless its directory is invalidated.
+        """
+        with self._lock:
+            stats = self._stats.get(path.parent)
+            if stats is not None and path.name in stats:
+                return stats[path.name]
+        try:
+            st: os.stat_result | None = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            st = None
+        with self._lock:
+            self._stats.setdefault(path.parent, {})[path.name] = st
+        return st
+
+    def invalidate(self, path: Path) -> None:
+        """
+        Forget the cached listing of the directory containing path (and of path itself if it is a directory).
+        """
+        with self._lock:
+            self._listings.pop(path.parent, None)
+            self._listings.pop(path, None)
+            self._stats.pop(path.parent, None)
+            self._stats.pop(path, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._listings.clear()
+            self._stats.clear()
@@ -4,12 +4,21 @@ import json
 import logging
 import os
 from pathlib import Path
+import queue
 import tempfile
-from typing import Literal, Sequence
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable, Iterator, Literal, Sequence
 from datetime import datetime
 
-from fits.environment.constant import FITS_ARRAY_NAME, FitsName, FITS_MASK_NAME
+from fits.environment.fingerprint import SourceFingerprint
+from fits.environment.constant import FAILED_STATES_NAME, FITS_ARRAY_NAME, FitsName, FITS_MASK_NAME, STATE_FILE_NAME, STATE_JOURNAL_NAME
+from fits.environment.discovery import walk_run_dir
 from fits.environment.serialization import deserialize_experiment_state, serialize_experiment_state
+if TYPE_CHECKING:
+    from fits.environment.statcache import StatCache
+    from fits.environment.store import StateStore
 
 
 OutputKey = Literal["image", "masks"]
@@ -34,6 +43,7 @@ class ExperimentState():
         step_settings_hash: Dictionary storing hash of settings used for each step.
         last_error: Error message from the last failed step.
         updated_at: Timestamp of last state update.
+        source_fingerprint: Fingerprint of the original image when it was last processed, used to detect re-exported sources.
     """
     
     run_dir: Path
@@ -47,6 +57,7 @@ class ExperimentState():
     step_settings_hash: dict[str, str] = field(default_factory=dict)
     last_error: str | None = None
     updated_at: datetime | None = None
+    source_fingerprint: SourceFingerprint | None = None
     
     @classmethod
     def init(cls, run_dir: Path, original_image: Path) -> ExperimentState:
@@ -93,19 +104,28 @@ class ExperimentState():
         
         return replace(self, step_settings_hash=set_h, updated_at=datetime.now())
      
+    def with_fingerprint(self, fingerprint: SourceFingerprint) -> ExperimentState:
+        """
+        Return a new ExperimentState recording the fingerprint of the original image it was processed from.
+        """
+        return replace(self, source_fingerprint=fingerprint, updated_at=datetime.now())
+     
     def commit(self, **kwargs) -> ExperimentState:
         """
         Return a new ExperimentState with updated_at set to now and any additional fields updated.
         """
         return replace(self, updated_at=datetime.now(), **kwargs)
 
-    def to_json(self) -> ExperimentState:
+    def to_json(self, *, durable: bool = True) -> ExperimentState:
         """
         Serialize the experiment state to ``workdir/experiment_state.json``.
+
+        The file is always replaced atomically. With ``durable=False`` the fsync is skipped, for callers (e.g. StateJournal)
+        that guarantee durability by other means.
         """
         if self.workdir is None:
             raise ValueError("workdir is not available; set image before calling to_json().")
-        target_path = self.workdir / "experiment_state.json"
+        target_path = self.workdir / STATE_FILE_NAME
         target_path.parent.mkdir(parents=True, exist_ok=True)
 
         payload = json.dumps(serialize_experiment_state(self), indent=2, sort_keys=True)
@@ -121,7 +141,8 @@ class ExperimentState():
             with os.fdopen(fd, "w", encoding="utf-8") as handle:
                 handle.write(payload)
                 handle.flush()
-                os.fsync(handle.fileno())
+                if durable:
+                    os.fsync(handle.fileno())
             os.replace(temp_path, target_path)
         except Exception:
             try:
@@ -137,7 +158,7 @@ class ExperimentState():
         """
         Load an experiment state from ``workdir/experiment_state.json``.
         """
-        json_path = workdir / "experiment_state.json"
+        json_path = workdir / STATE_FILE_NAME
         raw = json.loads(json_path.read_text(encoding="utf-8"))
         return cls(**deserialize_experiment_state(raw))
     
@@ -229,70 +250,118 @@ class ExperimentState():
             updated_at=datetime.now()
         )
     
-    def _exists(self, p: Path | None) -> bool:
-        return p is not None and p.exists()
+    def _exists(self, p: Path | None, stat_cache: StatCache | None = None) -> bool:
+        if p is None:
+            return False
+        return stat_cache.exists(p) if stat_cache is not None else p.exists()
 
-    def needs_run(self, step: str, settings_hash: str, overwrite: bool, *,  required_output: FitsName = FITS_ARRAY_NAME, required_files_rel: Sequence[Path] = (),) -> bool:
+    def needs_run(self, step: str, settings_hash: str, overwrite: bool, *,  required_output: FitsName = FITS_ARRAY_NAME, required_files_rel: Sequence[Path] = (), stat_cache: StatCache | None = None, check_source: bool = True) -> bool:
         """
         Returns True if:
         - step not done, OR
         - settings hash changed, OR
+        - original image changed since it was processed (recorded fingerprint, if any and check_source), OR
         - required primary outputs missing (image/masks), OR
         - required relative files missing (optional small sidecars)
+
+        If ``stat_cache`` is given, existence checks are answered from its directory listings instead of one stat per file,
+        and the source is stated once per run for all the states sharing it.
+        """
+        return self.run_reason(step, settings_hash, overwrite, required_output=required_output, required_files_rel=required_files_rel,
+                               stat_cache=stat_cache, check_source=check_source) is not None
+
+    def run_reason(self, step: str, settings_hash: str, overwrite: bool, *,  required_output: FitsName = FITS_ARRAY_NAME, required_files_rel: Sequence[Path] = (), stat_cache: StatCache | None = None, check_source: bool = True, read_source: bool = True) -> str | None:
+        """
+        Same checks as ``needs_run``, returning why the step has to run (e.g. "settings changed"), or None if it is up
+        to date. Only file metadata is read, except for the head/tail digest of a source whose mtime changed; without
+        read_source, such a source is reported as "source modified (mtime)" without being opened.
         """
         # 0) overwrite gate
         if overwrite:
-            return True
+            return "overwrite"
         
         # 1) status gate
-        if self.step_status.get(step) != "done":
-            return True
+        status = self.step_status.get(step)
+        if status != "done":
+            return "new" if status is None else f"previously {status}"
 
         # 2) settings gate
         if self.step_settings_hash.get(step) != settings_hash:
-            return True
+            return "settings changed"
+
+        # 2b) source gate: a raw file re-exported in place
+        if check_source and self.source_fingerprint is not None and self.source_fingerprint.changed(self.original_image, stat_cache, read=read_source):
+            if not read_source:
+                return "source modified (mtime)"
+            logger.info("Source %s changed since it was processed; %s will run again.", self.original_image, step)
+            return "source changed"
 
         # 3) required primary outputs
-        if required_output == FITS_ARRAY_NAME and not self._exists(self.image):
-            return True
-        if required_output == FITS_MASK_NAME and not self._exists(self.masks):
-            return True
+        if required_output == FITS_ARRAY_NAME and not self._exists(self.image, stat_cache):
+            return "output missing"
+        if required_output == FITS_MASK_NAME and not self._exists(self.masks, stat_cache):
+            return "output missing"
 
         # 4) optional sidecar files (relative to run_dir)
         for rel in required_files_rel:
-            abs_path = self.run_dir / rel
-            if not abs_path.exists():
-                return True
+            if not self._exists(self.run_dir / rel, stat_cache):
+                return "sidecar missing"
+
+        return None
+
+
+def _default_io_workers() -> int:
+    return min(32, (os.cpu_count() or 1) + 4)
+
 
-        return False
+def _load_saved_state(json_path: Path) -> ExperimentState | None:
+    try:
+        return ExperimentState.from_json(json_path.parent)
+    except Exception as exc:
+        logger.warning("Failed to load experiment state at %s: %s", json_path, exc)
+        return None
 
 
-def _discover_saved_states(run_dir: Path) -> list[ExperimentState]:
+def _discover_saved_states(run_dir: Path, state_files: Sequence[Path] | None = None, *, workers: int | None = None) -> list[ExperimentState]:
     """
-    Discover and load all saved ``experiment_state.json`` files under ``run_dir``.
+    Discover and load all saved ``experiment_state.json`` files under ``run_dir``, plus the failed states recorded
+    without workdir (see ``record_failed_states``).
 
+    If ``state_files`` is given (e.g. from a ``RunIndex``), those files are loaded instead of walking ``run_dir`` again.
+    Files are read on a bounded I/O thread pool (``workers``, default cpu + 4 up to 32) and returned in input order.
     Invalid state files are skipped with a warning.
     """
-    states: list[ExperimentState] = []
-    for json_path in run_dir.rglob("experiment_state.json"):
-        workdir = json_path.parent
-        try:
-            states.append(ExperimentState.from_json(workdir))
-        except Exception as exc:
-            logger.warning("Failed to load experiment state at %s: %s", json_path, exc)
-            continue
+    if state_files is None:
+        state_files = sorted(run_dir.rglob(STATE_FILE_NAME))
+
+    start = time.perf_counter()
+    n_workers = min(_default_io_workers() if workers is None else workers, len(state_files))
+    if n_workers <= 1:
+        loaded = [_load_saved_state(p) for p in state_files]
+    else:
+        # Per-file latency dominates on network storage: overlap the reads, keep the input order
+        with ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="fits-state-io") as ex:
+            loaded = list(ex.map(_load_saved_state, state_files))
+    states = [st for st in loaded if st is not None] + load_failed_states(run_dir)
+
+    logger.debug(f"Loaded {len(states)}/{len(state_files)} saved experiment states in {time.perf_counter() - start:.3f}s using {max(n_workers, 1)} worker(s)")
     return states
 
 
-def assemble_experiment_states(run_dir: Path, raw_files: Sequence[Path]) -> list[ExperimentState]:
+def assemble_experiment_states(run_dir: Path, raw_files: Sequence[Path], *, state_files: Sequence[Path] | None = None, store: StateStore | None = None) -> list[ExperimentState]:
     """
     Build the final experiment state list for a run.
 
     Keeps all discovered saved states and appends only raw-file states whose
     ``original_image_rel`` is not already represented by saved states.
+    ``state_files`` can be passed from a ``RunIndex`` to skip the extra directory walk,
+    and ``store`` replaces the JSON discovery by the store's own loading (a single query for SQLite).
     """
     raw_states = [ExperimentState.init(run_dir, raw_file) for raw_file in raw_files]
-    saved_states = _discover_saved_states(run_dir)
+    if store is not None:
+        saved_states = store.load_all()
+    else:
+        saved_states = _discover_saved_states(run_dir, state_files)
 
     converted_originals = {state.original_image_rel for state in saved_states}
     remaining_raw_states = [
@@ -301,5 +370,372 @@ def assemble_experiment_states(run_dir: Path, raw_files: Sequence[Path]) -> list
     ]
     return saved_states + remaining_raw_states
 
+
+def iter_experiment_states(run_dir: Path, *, saved_states: Iterable[ExperimentState] | None = None, stat_cache: StatCache | None = None) -> Iterator[ExperimentState]:
+    """
+    Stream the experiment states of a run while run_dir is being walked.
+
+    Same result as ``assemble_experiment_states`` (up to order), without waiting for the end of the walk: each
+    directory is yielded bottom-up, so the saved states of the workdirs created next to a raw file are seen (and
+    yielded) before the raw file, which is then skipped. Raw files are deduplicated incrementally against the saved
+    states seen so far.
+
+    Args:
+        run_dir: Base directory of the run.
+        saved_states: Optional saved states already loaded from a store (e.g. SQLite). They are yielded first and
+            the JSON state files met during the walk are ignored. Otherwise, the recorded failed states without
+            workdir are yielded first.
+        stat_cache: Optional StatCache primed with the directory listings of the walk.
+    """
+    converted_originals: set[Path] = set()
+    for state in saved_states if saved_states is not None else load_failed_states(run_dir):
+        converted_originals.add(state.original_image_rel)
+        yield state
+
+    n_saved = n_raw = 0
+    start = time.perf_counter()
+    for _, files in walk_run_dir(run_dir, stat_cache=stat_cache):
+        for path, kind in files:
+            if kind == "state" and saved_states is None:
+                state = _load_saved_state(path)
+                if state is not None:
+                    converted_originals.add(state.original_image_rel)
+                    n_saved += 1
+                    yield state
+            elif kind == "raw":
+                state = ExperimentState.init(run_dir, path)
+                if state.original_image_rel not in converted_originals:
+                    n_raw += 1
+                    yield state
+    logger.debug(f"Streamed {n_saved} saved and {n_raw} new experiment states from {run_dir} in {time.perf_counter() - start:.3f}s")
+
     
-    
\ No newline at end of file
+    
+
+
+def state_key(state: ExperimentState) -> str:
+    """
+    Stable identity of a saved state: its workdir relative to run_dir, or ``original#series`` before conversion.
+    """
+    if state.image_rel is not None:
+        return state.image_rel.parent.as_posix()
+    return f"{state.original_image_rel.as_posix()}#{state.series_index}"
+
+
+# ---------------------------------------------------------------------
+# Failures without workdir
+# ---------------------------------------------------------------------
+
+_FAILED_LOCK = threading.Lock()
+
+
+def load_failed_states(run_dir: Path) -> list[ExperimentState]:
+    """
+    Failed states recorded by ``record_failed_states`` for the run (empty if there is none).
+    """
+    path = run_dir / FAILED_STATES_NAME
+    try:
+        entries = json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as exc:
+        logger.warning("Ignoring unreadable failure record %s: %s", path, exc)
+        return []
+    states: list[ExperimentState] = []
+    for raw in entries.values():
+        try:
+            states.append(replace(ExperimentState(**deserialize_experiment_state(raw)), run_dir=run_dir))
+        except Exception as exc:
+            logger.warning("Ignoring invalid entry in %s: %s", path, exc)
+    return states
+
+
+def record_failed_states(states: Iterable[ExperimentState]) -> None:
+    """
+    Keep a run-level record (``run_dir/.fits_failed_states.json``, keyed by ``state_key``) of the failed states that
+    have no workdir to hold their ``experiment_state.json``, e.g. a corrupt raw file failing its first conversion.
+    Entries of an experiment that was saved with a workdir since then are removed.
+
+    Per-workdir JSON persistence (JSON store, write-behind journal) calls it for every saved batch; the file is only
+    read when a batch has such a failure or when the record exists.
+    """
+    by_run: dict[Path, list[ExperimentState]] = {}
+    for st in states:
+        by_run.setdefault(st.run_dir, []).append(st)
+    for run_dir, run_states in by_run.items():
+        path = run_dir / FAILED_STATES_NAME
+        failed = [st for st in run_states if st.workdir is None and "failed" in st.step_status.values()]
+        if not failed and not path.exists():
+            continue
+        with _FAILED_LOCK:
+            try:
+                entries: dict[str, dict] = json.loads(path.read_text(encoding="utf-8"))
+            except FileNotFoundError:
+                entries = {}
+            except (OSError, ValueError) as exc:
+                logger.warning("Replacing unreadable failure record %s: %s", path, exc)
+                entries = {}
+            before = dict(entries)
+            converted = {str(st.original_image_rel) for st in run_states if st.workdir is not None}
+            entries = {key: raw for key, raw in entries.items() if raw.get("original_image_rel") not in converted}
+            for st in failed:
+                entries[state_key(st)] = serialize_experiment_state(st)
+            if entries == before:
+                continue
+            if not entries:
+                path.unlink(missing_ok=True)
+                continue
+            fd, tmp = tempfile.mkstemp(dir=run_dir, prefix=f"{FAILED_STATES_NAME}.", suffix=".tmp", text=True)
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as handle:
+                    json.dump(entries, handle, indent=2, sort_keys=True)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                os.replace(tmp, path)
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+        if failed:
+            logger.debug("Recorded %d failed experiment state(s) without workdir in %s", len(failed), path)
+
+
+# ---------------------------------------------------------------------
+# Write-behind persistence
+# ---------------------------------------------------------------------
+
+_STOP = object()
+
+
+class StateJournal:
+    """
+    Write-behind journal for experiment states, usable wherever a StateStore is expected.
+
+    Workers enqueue states with ``save``/``save_many`` and return immediately; a single writer thread groups them in
+    batches (every ``flush_interval`` seconds or ``batch_size`` states) and persists each batch with one fsync:
+
+    - with a store that commits batches durably (SQLite), the batch is one ``save_many`` transaction;
+    - with per-workdir JSON files, the batch is first appended to ``run_dir/.fits_state_journal.jsonl`` and fsynced once,
+      then the JSON files are replaced atomically without their own fsync. At each checkpoint (``flush``, ``close``, or
+      once the journal grows over checkpoint_size bytes) the JSON files written since the last one, and their folders,
+      are fsynced and the journal is removed; ``replay_state_journal`` restores them if the process died in between.
+
+    ``flush`` blocks until everything enqueued before it is durable; it is called at the end of each step (or watch
+    cycle) and by ``close``. Errors raised by the writer are re-raised by the next ``flush``/``close``.
+
+    Args:
+        run_dir: Base directory of the run (location of the journal file).
+        store: Optional underlying store. If None, states are saved as per-workdir JSON files.
+        flush_interval: Maximum time in seconds a state waits in memory before being written.
+        batch_size: Maximum number of states per batch.
+        checkpoint_size: Journal size in bytes beyond which the JSON files are synced and the journal is removed, even
+            without a flush.
+    """
+
+    durable_batches = True
+
+    def __init__(self, run_dir: Path, store: StateStore | None = None, *, flush_interval: float = 1.0, batch_size: int = 256, checkpoint_size: int = 8 << 20) -> None:
+        self.run_dir = run_dir
+        self.journal_path = run_dir / STATE_JOURNAL_NAME
+        self._store = store
+        self._flush_interval = flush_interval
+        self._batch_size = max(1, batch_size)
+        self._checkpoint_size = checkpoint_size
+        self._queue: queue.Queue[object] = queue.Queue()
+        self._error: BaseException | None = None
+        self._journal_size = 0
+        self._unsynced: set[Path] = set()  # JSON files written since the last checkpoint
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="fits-state-writer", daemon=True)
+        self._writer.start()
+
+    # ---------------------------------------------------------------------
+    # StateStore interface
+    # ---------------------------------------------------------------------
+
+    def save(self, state: ExperimentState) -> None:
+        if self._closed:
+            raise RuntimeError("StateJournal is closed.")
+        self._queue.put(state)
+
+    def save_many(self, states: Sequence[ExperimentState]) -> None:
+        for state in states:
+            self.save(state)
+
+    def load_all(self) -> list[ExperimentState]:
+        self.flush()
+        if self._store is not None:
+            return self._store.load_all()
+        return _discover_saved_states(self.run_dir)
+
+    def flush(self) -> None:
+        """
+        Block until every state enqueued so far has been written durably.
+        """
+        if self._writer.is_alive():
+            done = threading.Event()
+            self._queue.put(done)
+            done.wait()
+        self._raise_pending_error()
+
+    def close(self) -> None:
+        """
+        Flush pending states, stop the writer and finalize the JSON journal.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        self._raise_pending_error()
+
+    def __enter__(self) -> StateJournal:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+    # ---------------------------------------------------------------------
+    # Writer thread
+    # ---------------------------------------------------------------------
+
+    def _raise_pending_error(self) -> None:
+        if self._error is not None:
+            err, self._error = self._error, None
+            raise RuntimeError("Failed to persist experiment states.") from err
+
+    def _run(self) -> None:
+        pending: list[ExperimentState] = []
+        waiters: list[threading.Event] = []
+        deadline: float | None = None
+        stop = False
+        while not stop:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None  # flush interval elapsed
+
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+            elif isinstance(item, ExperimentState):
+                pending.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self._flush_interval
+
+            if stop or waiters or item is None or len(pending) >= self._batch_size:
+                if pending:
+                    self._write_batch(pending)
+                if stop or waiters or self._journal_size >= self._checkpoint_size:
+                    self._checkpoint()
+                pending = []
+                deadline = None
+                for waiter in waiters:
+                    waiter.set()
+                waiters = []
+
+    def _write_batch(self, batch: list[ExperimentState]) -> None:
+        # Keep only the latest update per experiment
+        latest = list({state_key(st): st for st in batch}.values())
+        try:
+            if self._store is not None and getattr(self._store, "durable_batches", False):
+                self._store.save_many(latest)
+                return
+
+            writable = [st for st in latest if st.workdir is not None]
+            record_failed_states(latest)
+            if not writable:
+                return
+            lines = "".join(json.dumps(serialize_experiment_state(st), sort_keys=True) + "\n" for st in writable).encode("utf-8")
+            new_journal = self._journal_size == 0
+            with open(self.journal_path, "ab") as handle:
+                handle.write(lines)
+                handle.flush()
+                os.fsync(handle.fileno())
+            if new_journal:
+                _fsync_dir(self.run_dir)
+            self._journal_size += len(lines)
+            for st in writable:
+                st.to_json(durable=False)
+                self._unsynced.add(st.workdir / STATE_FILE_NAME)  # type: ignore[operator]
+        except BaseException as exc:
+            logger.error("Failed to persist %d experiment states: %s", len(latest), exc)
+            self._error = exc
+
+    def _checkpoint(self) -> None:
+        # Make the JSON files written since the last checkpoint durable, then the journal is no longer needed
+        if not self._journal_size:
+            return
+        try:
+            for path in self._unsynced:
+                _fsync_file(path)
+            for folder in {path.parent for path in self._unsynced}:
+                _fsync_dir(folder)
+            self.journal_path.unlink(missing_ok=True)
+            _fsync_dir(self.run_dir)
+        except BaseException as exc:
+            logger.error("Failed to sync %d experiment state files: %s", len(self._unsynced), exc)
+            self._error = exc
+            return
+        self._unsynced.clear()
+        self._journal_size = 0
+
+
+def _fsync_file(path: Path) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return  # removed since (e.g. workdir deleted): nothing left to sync
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(path: Path) -> None:
+    # Persists renames and new entries of a folder; folders cannot be opened for fsync on Windows
+    if os.name == "nt":
+        return
+    _fsync_file(path)
+
+
+def read_state_journal(run_dir: Path) -> dict[str, ExperimentState]:
+    """
+    Latest journaled state of each experiment (by ``state_key``) left by an interrupted run, without applying them.
+    """
+    journal_path = run_dir / STATE_JOURNAL_NAME
+    try:
+        lines = journal_path.read_text(encoding="utf-8").splitlines()
+    except FileNotFoundError:
+        return {}
+
+    latest: dict[str, ExperimentState] = {}
+    for line in lines:
+        try:
+            st = ExperimentState(**deserialize_experiment_state(json.loads(line)))
+        except Exception as exc:
+            # A torn last line is expected if the process died while appending
+            logger.warning("Ignoring invalid journal entry in %s: %s", journal_path, exc)
+            continue
+        latest[state_key(st)] = st
+    return latest
+
+
+def replay_state_journal(run_dir: Path) -> int:
+    """
+    Re-apply the journal left by an interrupted run, so every journaled state has a durable ``experiment_state.json``.
+
+    Returns:
+        Number of states restored (0 if there was no journal).
+    """
+    journal_path = run_dir / STATE_JOURNAL_NAME
+    if not journal_path.exists():
+        return 0
+    latest = read_state_journal(run_dir)
+
+    for st in latest.values():
+        st.to_json()
+    journal_path.unlink(missing_ok=True)
+    logger.info(f"Restored {len(latest)} experiment states from the journal of an interrupted run")
+    return len(latest)
@@ -0,0 +1,301 @@
+from __future__ import annotations
+import json
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Iterable, Protocol, Sequence
+
+from fits.environment.constant import STATE_DB_NAME, StateBackend
+from fits.environment.serialization import deserialize_experiment_state, serialize_experiment_state
+from fits.environment.state import ExperimentState, _discover_saved_states, record_failed_states, state_key
+
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore(Protocol):
+    """
+    Persistence backend for experiment states of one run.
+
+    ``durable_batches`` tells whether ``save_many`` persists a whole batch with a single commit.
+    """
+
+    durable_batches: bool
+
+    def save(self, state: ExperimentState) -> None: ...
+
+    def save_many(self, states: Iterable[ExperimentState]) -> None: ...
+
+    def load_all(self) -> list[ExperimentState]: ...
+
+    def flush(self) -> None: ...
+
+    def close(self) -> None: ...
+
+
+def _save_json(states: Sequence[ExperimentState]) -> None:
+    # A state that never produced an image (e.g. failed on first conversion) has no workdir to hold its JSON file:
+    # failures are kept in the run-level record instead
+    for state in states:
+        if state.workdir is None:
+            logger.debug("No workdir for the experiment state of %s yet", state.original_image)
+            continue
+        state.to_json()
+    record_failed_states(states)
+
+
+class JsonStateStore:
+    """
+    Default backend: one ``experiment_state.json`` per workdir, written atomically by ``ExperimentState.to_json``.
+    States without a workdir (nothing converted yet) have no file: failed ones are kept in the run-level record of
+    ``record_failed_states``, the others are skipped.
+
+    Args:
+        run_dir: Base directory of the run.
+        state_files: Optional known state files (e.g. from a ``RunIndex``), to avoid walking run_dir on load.
+    """
+
+    durable_batches = False
+
+    def __init__(self, run_dir: Path, state_files: Sequence[Path] | None = None) -> None:
+        self.run_dir = run_dir
+        self._state_files = state_files
+
+    def save(self, state: ExperimentState) -> None:
+        self.save_many([state])
+
+    def save_many(self, states: Iterable[ExperimentState]) -> None:
+        _save_json(list(states))
+
+    def load_all(self) -> list[ExperimentState]:
+        return _discover_saved_states(self.run_dir, self._state_files)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS experiment_states (
+    state_key TEXT PRIMARY KEY,
+    original_image_rel TEXT NOT NULL,
+    experiment_id TEXT,
+    series_index INTEGER NOT NULL,
+    last_step TEXT,
+    updated_at TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_states_original ON experiment_states (original_image_rel);
+CREATE INDEX IF NOT EXISTS ix_states_experiment ON experiment_states (experiment_id);
+CREATE TABLE IF NOT EXISTS step_status (
+    state_key TEXT NOT NULL REFERENCES experiment_states (state_key) ON DELETE CASCADE,
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    settings_hash TEXT,
+    PRIMARY KEY (state_key, step)
+);
+CREATE INDEX IF NOT EXISTS ix_step_status ON step_status (step, status);
+"""
+
+
+class SqliteStateStore:
+    """
+    Single-file SQLite store (WAL mode) holding all experiment states of a run.
+
+    Writes are grouped in one transaction per ``save_many`` call, so persisting thousands of states costs one commit instead of one fsync per file.
+    The connection is shared between threads behind a lock.
+
+    Args:
+        run_dir: Base directory of the run.
+        db_path: Optional database path. Defaults to ``run_dir / STATE_DB_NAME``.
+        read_only: Open an existing database without creating or changing it (writes then raise sqlite3.OperationalError).
+    """
+
+    durable_batches = True
+
+    def __init__(self, run_dir: Path, db_path: Path | None = None, *, read_only: bool = False) -> None:
+        self.run_dir = run_dir
+        self.db_path = db_path or run_dir / STATE_DB_NAME
+        self._lock = threading.Lock()
+        if read_only:
+            self._conn = sqlite3.connect(f"{self.db_path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+            return
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL keeps the durability of the atomic JSON writes, but only once per transaction
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+
+    # ---------------------------------------------------------------------
+    # Writes
+    # ---------------------------------------------------------------------
+
+    def save(self, state: ExperimentState) -> None:
+        self.save_many([state])
+
+    def save_many(self, states: Iterable[ExperimentState]) -> None:
+        """
+        Upsert states in bulk, in a single transaction.
+        """
+        rows = []
+        status_rows = []
+        for state in states:
+            key = state_key(state)
+            raw = serialize_experiment_state(state)
+            rows.append((key, raw["original_image_rel"], state.experiment_id, state.series_index, state.last_step, raw["updated_at"], json.dumps(raw, sort_keys=True)))
+            for step, status in state.step_status.items():
+                status_rows.append((key, step, status, state.step_settings_hash.get(step)))
+        if not rows:
+            return
+
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                cur.executemany(
+                    """
+                    INSERT INTO experiment_states (state_key, original_image_rel, experiment_id, series_index, last_step, updated_at, payload)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (state_key) DO UPDATE SET
+                        original_image_rel = excluded.original_image_rel,
+                        experiment_id = excluded.experiment_id,
+                        series_index = excluded.series_index,
+                        last_step = excluded.last_step,
+                        updated_at = excluded.updated_at,
+                        payload = excluded.payload
+                    """,
+                    rows,
+                )
+                cur.executemany("DELETE FROM step_status WHERE state_key = ?", [(r[0],) for r in rows])
+                cur.executemany("INSERT INTO step_status (state_key, step, status, settings_hash) VALUES (?, ?, ?, ?)", status_rows)
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    # ---------------------------------------------------------------------
+    # Reads
+    # ---------------------------------------------------------------------
+
+    def _query(self, sql: str, params: Sequence[object] = ()) -> list[ExperimentState]:
+        with self._lock:
+            payloads = [row[0] for row in self._conn.execute(sql, params)]
+        return [ExperimentState(**deserialize_experiment_state(json.loads(p))) for p in payloads]
+
+    def load_all(self) -> list[ExperimentState]:
+        """
+        Load every saved state of the run in one query.
+        """
+        return self._query("SELECT payload FROM experiment_states ORDER BY state_key")
+
+    def get_by_original_image(self, original_image_rel: Path) -> list[ExperimentState]:
+        return self._query(
+            "SELECT payload FROM experiment_states WHERE original_image_rel = ? ORDER BY series_index",
+            (original_image_rel.as_posix(),),
+        )
+
+    def get_by_experiment_id(self, experiment_id: str) -> list[ExperimentState]:
+        return self._query("SELECT payload FROM experiment_states WHERE experiment_id = ? ORDER BY state_key", (experiment_id,))
+
+    def find_by_step_status(self, step: str, status: str) -> list[ExperimentState]:
+        return self._query(
+            """
+            SELECT s.payload FROM experiment_states AS s
+            JOIN step_status AS t ON t.state_key = s.state_key
+            WHERE t.step = ? AND t.status = ?
+            ORDER BY s.state_key
+            """,
+            (step, status),
+        )
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM experiment_states").fetchone()[0]
+
+    # ---------------------------------------------------------------------
+    # JSON interop
+    # ---------------------------------------------------------------------
+
+    def import_json(self, state_files: Sequence[Path] | None = None) -> int:
+        """
+        Import existing ``experiment_state.json`` files into the store. Invalid files are skipped with a warning.
+
+        Args:
+            state_files: Optional known state files. If None, run_dir is searched.
+
+        Returns:
+            Number of imported states.
+        """
+        states = _discover_saved_states(self.run_dir, state_files)
+        self.save_many(states)
+        logger.info(f"Imported {len(states)} experiment states from JSON into {self.db_path}")
+        return len(states)
+
+    def export_json(self) -> int:
+        """
+        Write every stored state back to its ``workdir/experiment_state.json``. States without a workdir are skipped.
+
+        Returns:
+            Number of exported states.
+        """
+        exported = 0
+        for state in self.load_all():
+            if state.workdir is None:
+                continue
+            state.to_json()
+            exported += 1
+        logger.info(f"Exported {exported} experiment states from {self.db_path} to JSON")
+        return exported
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def open_state_store(run_dir: Path, backend: StateBackend = "json", *, state_files: Sequence[Path] | None = None, read_only: bool = False) -> StateStore:
+    """
+    Open the state store of a run for the requested backend.
+
+    Args:
+        run_dir: Base directory of the run.
+        backend: "json" (one file per workdir) or "sqlite" (single file at the run_dir root).
+        state_files: Optional known JSON state files, used by the JSON backend and to seed a new SQLite store.
+        read_only: Only read the states (e.g. to plan a run): an existing SQLite database is opened read-only, and
+            without one (or while it is empty) the JSON states it would import are read instead of creating it.
+    """
+    if backend == "json":
+        return JsonStateStore(run_dir, state_files)
+    if backend == "sqlite" and read_only:
+        db_path = run_dir / STATE_DB_NAME
+        if db_path.exists():
+            store = SqliteStateStore(run_dir, db_path, read_only=True)
+            if store.count() > 0:
+                return store
+            store.close()
+        return JsonStateStore(run_dir, state_files)
+    if backend == "sqlite":
+        store = SqliteStateStore(run_dir)
+        if store.count() == 0:
+            # First use on a run that was persisted as JSON so far
+            if state_files is None or state_files:
+                store.import_json(state_files)
+        return store
+    raise ValueError(f"Invalid state backend: {backend!r}")
+
+
+def save_states(states: Sequence[ExperimentState], store: StateStore | None = None) -> None:
+    """
+    Persist states through the given store, falling back to per-workdir JSON files.
+    """
+    if store is None:
+        _save_json(states)
+        return
+    store.save_many(states)
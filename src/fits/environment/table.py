@@ -0,0 +1,242 @@
+from __future__ import annotations
+from array import array
+from datetime import datetime, timedelta
+from itertools import compress
+from pathlib import Path
+from typing import Generic, Hashable, Iterable, Iterator, Sequence, TypeVar
+
+from fits.environment.fingerprint import SourceFingerprint
+from fits.environment.state import ExperimentState
+
+
+H = TypeVar("H", bound=Hashable)
+
+_NONE = -1
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_NO_TIME = -(2**63)
+
+STATUS_NAMES: tuple[str, ...] = ("", "pending", "running", "done", "failed", "skipped")
+
+
+class _Interner(Generic[H]):
+    """Store each distinct value once and refer to it by a small integer."""
+
+    def __init__(self) -> None:
+        self.values: list[H] = []
+        self._ids: dict[H, int] = {}
+
+    def intern(self, value: H | None) -> int:
+        if value is None:
+            return _NONE
+        idx = self._ids.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self._ids[value] = idx
+            self.values.append(value)
+        return idx
+
+    def lookup(self, value: H) -> int | None:
+        return self._ids.get(value)
+
+    def value(self, idx: int) -> H | None:
+        return None if idx == _NONE else self.values[idx]
+
+
+class StateTable:
+    """
+    Columnar representation of many experiment states of one run.
+
+    All rows share a single run_dir; paths, strings (experiment ids, steps, settings hashes, errors) and source
+    fingerprints are interned, and per-step status and settings hash are stored as compact integer arrays. Filters such
+    as ``needing(step, hash)`` scan those arrays instead of looping over ExperimentState objects, and bulk updates
+    (``mark``) stamp a single timestamp.
+
+    ``ExperimentState`` stays the row type: ``table[i]`` (or iteration) materializes the row on demand, and
+    ``table[i] = state`` writes a state produced by a step runner back into the table.
+
+    Args:
+        run_dir: Base directory shared by every row.
+    """
+
+    def __init__(self, run_dir: Path) -> None:
+        self.run_dir = run_dir
+        self._paths: _Interner[Path] = _Interner()
+        self._strings: _Interner[str] = _Interner()
+        self._fingerprints: _Interner[SourceFingerprint] = _Interner()
+        self._status_codes: _Interner[str] = _Interner()
+        for name in STATUS_NAMES:
+            self._status_codes.intern(name)
+
+        self._original = array("q")
+        self._image = array("q")
+        self._masks = array("q")
+        self._experiment_id = array("q")
+        self._last_step = array("q")
+        self._series_index = array("q")
+        self._last_error = array("q")
+        self._updated_at = array("q")
+        self._fingerprint = array("q")
+        self._aware_updated_at: dict[int, datetime] = {}
+        self._status: dict[str, array] = {}
+        self._hash: dict[str, array] = {}
+
+    @classmethod
+    def from_states(cls, states: Iterable[ExperimentState], run_dir: Path | None = None) -> StateTable:
+        """
+        Build a table from experiment states. run_dir defaults to the run_dir of the first state.
+        """
+        table: StateTable | None = cls(run_dir) if run_dir is not None else None
+        for state in states:
+            if table is None:
+                table = cls(state.run_dir)
+            table.append(state)
+        if table is None:
+            raise ValueError("run_dir is required to build a StateTable from no states.")
+        return table
+
+    def __len__(self) -> int:
+        return len(self._original)
+
+    # ---------------------------------------------------------------------
+    # Row access
+    # ---------------------------------------------------------------------
+
+    def _step_columns(self, step: str) -> tuple[array, array]:
+        if step not in self._status:
+            self._status[step] = array("B", bytes(len(self)))
+            self._hash[step] = array("q", [_NONE]) * len(self)
+        return self._status[step], self._hash[step]
+
+    def _encode_time(self, row: int, value: datetime | None) -> int:
+        self._aware_updated_at.pop(row, None)
+        if value is None:
+            return _NO_TIME
+        if value.tzinfo is not None:
+            self._aware_updated_at[row] = value
+            return _NO_TIME
+        return (value - _EPOCH) // _MICROSECOND
+
+    def _decode_time(self, row: int) -> datetime | None:
+        encoded = self._updated_at[row]
+        if encoded == _NO_TIME:
+            return self._aware_updated_at.get(row)
+        return _EPOCH + encoded * _MICROSECOND
+
+    def _write(self, row: int, state: ExperimentState) -> None:
+        if state.run_dir != self.run_dir:
+            raise ValueError(f"State run_dir {state.run_dir} does not match table run_dir {self.run_dir}")
+        self._original[row] = self._paths.intern(state.original_image_rel)
+        self._image[row] = self._paths.intern(state.image_rel)
+        self._masks[row] = self._paths.intern(state.masks_rel)
+        self._experiment_id[row] = self._strings.intern(state.experiment_id)
+        self._last_step[row] = self._strings.intern(state.last_step)
+        self._series_index[row] = state.series_index
+        self._last_error[row] = self._strings.intern(state.last_error)
+        self._updated_at[row] = self._encode_time(row, state.updated_at)
+        self._fingerprint[row] = self._fingerprints.intern(state.source_fingerprint)
+
+        for step in set(state.step_status) | set(state.step_settings_hash):
+            self._step_columns(step)
+        for step, status_col in self._status.items():
+            status = state.step_status.get(step)
+            status_col[row] = 0 if status is None else self._status_codes.intern(status)
+            self._hash[step][row] = self._strings.intern(state.step_settings_hash.get(step))
+
+    def append(self, state: ExperimentState) -> int:
+        """
+        Append a state as a new row and return its index.
+        """
+        row = len(self)
+        for col in (self._original, self._image, self._masks, self._experiment_id, self._last_step, self._series_index, self._last_error, self._updated_at, self._fingerprint):
+            col.append(_NONE)
+        for step in self._status:
+            self._status[step].append(0)
+            self._hash[step].append(_NONE)
+        self._write(row, state)
+        return row
+
+    def __setitem__(self, row: int, state: ExperimentState) -> None:
+        self._write(row, state)
+
+    def __getitem__(self, row: int) -> ExperimentState:
+        """
+        Materialize one row as an ExperimentState.
+        """
+        step_status: dict[str, str] = {}
+        step_settings_hash: dict[str, str] = {}
+        for step, status_col in self._status.items():
+            if status_col[row]:
+                step_status[step] = self._status_codes.values[status_col[row]]
+            settings_hash = self._strings.value(self._hash[step][row])
+            if settings_hash is not None:
+                step_settings_hash[step] = settings_hash
+
+        original = self._paths.value(self._original[row])
+        assert original is not None
+        return ExperimentState(
+            run_dir=self.run_dir,
+            original_image_rel=original,
+            image_rel=self._paths.value(self._image[row]),
+            masks_rel=self._paths.value(self._masks[row]),
+            last_step=self._strings.value(self._last_step[row]),
+            experiment_id=self._strings.value(self._experiment_id[row]),
+            series_index=self._series_index[row],
+            step_status=step_status,
+            step_settings_hash=step_settings_hash,
+            last_error=self._strings.value(self._last_error[row]),
+            updated_at=self._decode_time(row),
+            source_fingerprint=self._fingerprints.value(self._fingerprint[row]),
+        )
+
+    def __iter__(self) -> Iterator[ExperimentState]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def rows(self, indices: Iterable[int]) -> list[ExperimentState]:
+        return [self[i] for i in indices]
+
+    def to_states(self) -> list[ExperimentState]:
+        return list(self)
+
+    # ---------------------------------------------------------------------
+    # Vectorized filters and updates
+    # ---------------------------------------------------------------------
+
+    def where_status(self, step: str, status: str) -> list[int]:
+        """
+        Indices of the rows whose status for step equals status.
+        """
+        code = self._status_codes.lookup(status)
+        if code is None or step not in self._status:
+            return []
+        return list(compress(range(len(self)), (c == code for c in self._status[step])))
+
+    def needing(self, step: str, settings_hash: str) -> list[int]:
+        """
+        Indices of the rows whose step is not done, or was done with another settings hash.
+
+        This is the status/settings part of ``ExperimentState.needs_run``; output existence is not checked here.
+        """
+        if step not in self._status:
+            return list(range(len(self)))
+        done = self._status_codes.lookup("done")
+        hash_id = self._strings.lookup(settings_hash)
+        if hash_id is None:
+            return list(range(len(self)))
+        status_col, hash_col = self._status[step], self._hash[step]
+        return list(compress(range(len(self)), (s != done or h != hash_id for s, h in zip(status_col, hash_col))))
+
+    def mark(self, indices: Sequence[int], step: str, status: str, *, settings_hash: str | None = None, updated_at: datetime | None = None) -> None:
+        """
+        Set the status (and optionally the settings hash) of a step for many rows at once, with one shared timestamp.
+        """
+        status_col, hash_col = self._step_columns(step)
+        code = self._status_codes.intern(status)
+        hash_id = self._strings.intern(settings_hash) if settings_hash is not None else None
+        stamp = updated_at or datetime.now()
+        for row in indices:
+            status_col[row] = code
+            if hash_id is not None:
+                hash_col[row] = hash_id
+            self._updated_at[row] = self._encode_time(row, stamp)
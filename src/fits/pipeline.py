@@ -1,24 +1,87 @@
 from __future__ import annotations
+from contextlib import closing
+from dataclasses import dataclass
 from pathlib import Path
 import logging
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Iterable, Mapping
 
+from fits.environment.constant import CacheLink, StateBackend, UIMode
 from fits.environment.context import ExecutionContext
-from fits.environment.state import assemble_experiment_states
+from fits.environment.state import ExperimentState, StateJournal, assemble_experiment_states, iter_experiment_states, replay_state_journal
 from fits.workflows.execute import run_workflow
 if TYPE_CHECKING:
-    from fits.environment.log import LogEmitter
-from fits.environment.discovery import collect_supported_files
+    from fits.environment.log import LevelName, LogEmitter
+    from fits.environment.store import StateStore
+from fits.environment.discovery import collect_supported_files, index_run_dir, rediscover_run_dir
 from fits.environment.log import configure_logging
-from fits.environment.runtime import use_ctx, coerce_mode
+from fits.environment.runtime import handle_signals, use_ctx, coerce_mode
+from fits.environment.statcache import StatCache
+from fits.environment.store import open_state_store
+from fits.environment.table import StateTable
 from fits.settings.loader import load_settings
+from fits.workflows.executors import CancelToken, WorkerPools
+from fits.workflows.cache import OutputCache
+from fits.workflows.memory import MemoryBudget
 
 logger = logging.getLogger(__name__)
 
 SETTINGS_PATH = Path("src/fits/settings/user_settings.toml")
 
 
-def start_pipeline(settings_path: Path | None = None, gui_emitter: LogEmitter | None = None) -> None:
+@dataclass(frozen=True)
+class RunConfig:
+    """
+    Validated top-level configuration of a run, read from the user settings file.
+
+    Attributes:
+        user_cfg: Full user configuration (step sections included).
+        run_dir: Resolved run directory.
+        user_name: Name of the user executing the pipeline.
+        mode: UI mode (cli, gui or notebook).
+        log_dir: Optional directory for log files.
+        console_level: Console log level.
+        file_level: File log level.
+        dry_run: If True, log the plan of the run (see fits.plan) instead of running it.
+        state_backend: Backend used to persist experiment states.
+        incremental_discovery: If True, rediscover the run from the persisted directory snapshot.
+        streaming_discovery: If True, feed experiment states to the workflow while the run directory is being walked.
+        write_behind: If True, persist experiment states through the write-behind journal.
+        state_flush_interval: Write-behind flush interval in seconds.
+        state_batch_size: Write-behind maximum batch size.
+        max_memory: Optional RAM budget for step tasks (e.g. "48GB").
+        broker: Broker database (or directory holding it) of the distributed execution mode. Defaults to run_dir.
+        telemetry: If True, steps write per-task executor timings to the log directory (run_dir if unset).
+        output_cache: Optional directory of the step output cache shared across runs.
+        output_cache_max_size: Optional size limit of the output cache (e.g. "500GB").
+        output_cache_link: How cached outputs are materialised into workdirs.
+    """
+
+    user_cfg: Mapping[str, Any]
+    run_dir: Path
+    user_name: str
+    mode: UIMode = "cli"
+    log_dir: Path | None = None
+    console_level: LevelName = "info"
+    file_level: LevelName = "debug"
+    dry_run: bool = False
+    state_backend: StateBackend = "json"
+    incremental_discovery: bool = False
+    streaming_discovery: bool = False
+    write_behind: bool = False
+    state_flush_interval: float = 1.0
+    state_batch_size: int = 256
+    max_memory: str | int | None = None
+    broker: Path | None = None
+    telemetry: bool = False
+    output_cache: str | None = None
+    output_cache_max_size: str | int | None = None
+    output_cache_link: CacheLink = "auto"
+
+
+def load_run_config(settings_path: Path | None = None) -> RunConfig:
+    """
+    Load the user settings file and extract the run-level configuration.
+    """
     # --- load settings ---
     cfg_path = (settings_path or SETTINGS_PATH).expanduser().resolve()
     user_cfg = load_settings(cfg_path)
@@ -32,51 +95,162 @@ def start_pipeline(settings_path: Path | None = None, gui_emitter: LogEmitter |
     
     # --- runtime config ---
     rt_settings = user_cfg.get("runtime", {})
-    mode = coerce_mode(rt_settings.get("mode"))
-    
     log_raw = rt_settings.get("log_dir", None)
-    log_dir = Path(log_raw).expanduser().resolve() if isinstance(log_raw, str) else log_raw
-    console_level = rt_settings.get("console_level", "info")
-    file_level = rt_settings.get("file_level", "debug")
-    dry_run = rt_settings.get("dry_run", False)
-    
+    broker_raw = rt_settings.get("broker", None)
+    return RunConfig(
+        user_cfg=user_cfg,
+        run_dir=run_dir,
+        user_name=user_name,
+        mode=coerce_mode(rt_settings.get("mode")),
+        log_dir=Path(log_raw).expanduser().resolve() if isinstance(log_raw, str) else log_raw,
+        console_level=rt_settings.get("console_level", "info"),
+        file_level=rt_settings.get("file_level", "debug"),
+        dry_run=rt_settings.get("dry_run", False),
+        state_backend=rt_settings.get("state_backend", "json"),
+        incremental_discovery=rt_settings.get("incremental_discovery", False),
+        streaming_discovery=rt_settings.get("streaming_discovery", False),
+        write_behind=rt_settings.get("write_behind", False),
+        state_flush_interval=rt_settings.get("state_flush_interval", 1.0),
+        state_batch_size=rt_settings.get("state_batch_size", 256),
+        max_memory=rt_settings.get("max_memory", None),
+        telemetry=rt_settings.get("telemetry", False),
+        output_cache=rt_settings.get("output_cache", None),
+        output_cache_max_size=rt_settings.get("output_cache_max_size", None),
+        output_cache_link=rt_settings.get("output_cache_link", "auto"),
+        broker=Path(broker_raw).expanduser().resolve() if isinstance(broker_raw, str) and broker_raw.lower() != "none" else None,
+    )
+
+
+def setup_run(cfg: RunConfig, gui_emitter: LogEmitter | None = None) -> ExecutionContext:
+    """
+    Configure logging once and build the ExecutionContext of a run.
+    """
     # --- logging setup once ---
-    if mode == "gui" and gui_emitter is None:
+    if cfg.mode == "gui" and gui_emitter is None:
         raise ValueError("GUI mode requires gui_emitter (create it in the GUI thread and connect it).")
-    configure_logging(log_dir=log_dir, mode=mode, console_level=console_level, file_level=file_level, gui_emitter=gui_emitter)
+    configure_logging(log_dir=cfg.log_dir, mode=cfg.mode, console_level=cfg.console_level, file_level=cfg.file_level, gui_emitter=gui_emitter)
 
     # --- context setup once ---
-    ctx = ExecutionContext(user_name=user_name,
-                           dry_run=dry_run,
-                           mode=mode)
+    return ExecutionContext(user_name=cfg.user_name,
+                            dry_run=cfg.dry_run,
+                            mode=cfg.mode,
+                            stat_cache=StatCache(),
+                            memory_budget=MemoryBudget.from_setting(cfg.max_memory),
+                            cancel=CancelToken(),
+                            broker=cfg.broker or cfg.run_dir,
+                            telemetry_dir=(cfg.log_dir or cfg.run_dir) if cfg.telemetry else None,
+                            output_cache=OutputCache.from_setting(cfg.output_cache, cfg.output_cache_max_size, cfg.output_cache_link))
+
+
+def open_state_journal(cfg: RunConfig, store: StateStore) -> StateJournal | None:
+    """
+    Open the write-behind journal in front of store, if enabled.
+    """
+    if not cfg.write_behind:
+        return None
+    return StateJournal(cfg.run_dir, store, flush_interval=cfg.state_flush_interval, batch_size=cfg.state_batch_size)
+
+
+def optimize_target(user_cfg: Mapping[str, Any]) -> Path | None:
+    """
+    Raw file the run is restricted to (``optimize`` setting), if any.
+    """
+    optimize_raw = user_cfg.get("optimize", None)
+    if isinstance(optimize_raw, str) and optimize_raw.strip():
+        return Path(optimize_raw).expanduser().resolve()
+    return None
+
+
+def discover_states(cfg: RunConfig, stat_cache: StatCache | None, optimize_path: Path | None = None, *, incremental: bool = False, read_only: bool = False) -> tuple[StateTable, StateStore]:
+    """
+    Discover the raw files and saved states of the run in a single walk and open its state store.
+
+    With incremental, the run is rediscovered from (and updates) the persisted directory snapshot. With read_only, the
+    state store is only read (see ``open_state_store``), e.g. to plan the run.
+
+    Returns:
+        The experiment states (saved states + raw files not converted yet) as a StateTable, whose rows are materialised
+        as ExperimentState when the workflow reaches them, and the state store, to be closed by the caller.
+    """
+    run_dir = cfg.run_dir
+    if incremental:
+        rediscovery = rediscover_run_dir(run_dir, stat_cache=stat_cache)
+        run_index = rediscovery.index
+        logger.info(f"Incremental discovery: {len(rediscovery.added)} new, {len(rediscovery.removed)} removed and {len(rediscovery.modified)} modified raw files since last run")
+    else:
+        run_index = index_run_dir(run_dir, stat_cache=stat_cache)
+    supported_files = collect_supported_files(run_dir, index=run_index)
+    
+    if optimize_path is not None:
+        matches = [p for p in supported_files if p.resolve() == optimize_path]
+        if matches: # optimize path is in supported files
+            logger.info(f"Optimization mode: only processing {optimize_path}")
+            supported_files = matches
+        else:
+            logger.warning(
+                f"optimize path {optimize_path} was provided but was not found among discovered supported files under {run_dir}; "
+                "continuing with full pipeline.")
+    
+    # --- build ExperimentState list from saved states + newly discovered raw files ---
+    store = open_state_store(run_dir, cfg.state_backend, state_files=run_index.state_files, read_only=read_only)
+    return StateTable.from_states(assemble_experiment_states(run_dir, supported_files, store=store), run_dir), store
+
+
+def start_pipeline(settings_path: Path | None = None, gui_emitter: LogEmitter | None = None) -> bool:
+    """
+    Run the workflow over every experiment of the run directory.
+
+    SIGINT/SIGTERM drain the run: running tasks finish and their states are saved, the rest is left for the next run.
+    With ``dry_run``, the plan of the run is logged instead (see fits.plan).
+
+    Returns:
+        False if the run was interrupted before completion, True otherwise.
+    """
+    cfg = load_run_config(settings_path)
+    user_cfg, run_dir = cfg.user_cfg, cfg.run_dir
+    ctx = setup_run(cfg, gui_emitter)
+    
+    # --- dry run: report the plan of the run instead of running it ---
+    if cfg.dry_run:
+        from fits.plan import format_plan, plan_run
+        logger.info(f"Dry run, nothing will be written:\n{format_plan(plan_run(cfg))}")
+        return True
     
     # --- main execution block with context ---
     with use_ctx(ctx):
-        # --- discover images ---
-        supported_files = collect_supported_files(run_dir)
+        # --- restore states journaled by an interrupted run before looking for them ---
+        replay_state_journal(run_dir)
         
-        # --- optimization ---
-        optimize_raw = user_cfg.get("optimize", None)
-        optimize_path = None
-        if isinstance(optimize_raw, str) and optimize_raw.strip():
-            optimize_path = Path(optimize_raw).expanduser().resolve()
+        optimize_path = optimize_target(user_cfg)
+        states: Iterable[ExperimentState]
+        if cfg.streaming_discovery and optimize_path is None:
+            # --- stream states to the workflow while the walk goes on ---
+            store = open_state_store(run_dir, cfg.state_backend)
+            saved_states = store.load_all() if cfg.state_backend != "json" else None
+            states = iter_experiment_states(run_dir, saved_states=saved_states, stat_cache=ctx.stat_cache)
+            logger.info(f"Streaming discovery of {run_dir}: conversions start while the run directory is walked")
+        else:
+            states, store = discover_states(cfg, ctx.stat_cache, optimize_path, incremental=cfg.incremental_discovery)
         
-        if optimize_path is not None:
-            matches = [p for p in supported_files if p.resolve() == optimize_path]
-            if matches: # optimize path is in supported files
-                logger.info(f"Optimization mode: only processing {optimize_path}")
-                supported_files = matches
-            else:
-                logger.warning(
-                    f"optimize path {optimize_path} was provided but was not found among discovered supported files under {run_dir}; "
-                    "continuing with full pipeline.")
-        
-        # --- build ExperimentState list from saved states + newly discovered raw files ---
-        states = assemble_experiment_states(run_dir, supported_files)
-        
-        # --- start the workflow ---
-        logger.debug(f"Loaded user configuration {user_cfg}")
-        run_workflow(user_cfg, states)
+        with closing(store):
+            # --- state updates go through the write-behind journal, flushed at each step end and on exit ---
+            journal = open_state_journal(cfg, store)
+            ctx.state_store = journal or store
+            
+            # --- start the workflow, on worker pools kept warm across steps ---
+            logger.debug(f"Loaded user configuration {user_cfg}")
+            try:
+                with handle_signals(ctx.cancel), WorkerPools() as pools:
+                    ctx.worker_pools = pools
+                    run_workflow(user_cfg, states)
+            finally:
+                if journal is not None:
+                    journal.close()
+    
+    if ctx.cancel is not None and ctx.cancel.cancelled:
+        logger.warning(f"Run interrupted ({ctx.cancel.reason}): completed experiments are saved, run the pipeline again to resume")
+        return False
+    return True
 
 
 if __name__ == "__main__":
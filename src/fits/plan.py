@@ -0,0 +1,266 @@
+from __future__ import annotations
+from collections import Counter
+from contextlib import closing
+from dataclasses import dataclass
+import logging
+from pathlib import Path
+import time
+from typing import Any, Iterable, Mapping, Sequence
+
+from fits.environment.state import ExperimentState, read_state_journal, state_key
+from fits.environment.statcache import StatCache
+from fits.environment.table import StateTable
+from fits.settings.models import SettingsModel
+from fits.pipeline import RunConfig, discover_states, load_run_config, optimize_target
+from fits.workflows.execute import step_order
+from fits.workflows.executors import default_workers
+from fits.workflows.memory import file_size_footprint
+from fits.workflows.payload import build_payload, hash_payload
+from fits.workflows.provenance import StepProfile
+from fits.workflows.registry import REGISTRY
+from fits.workflows.telemetry import read_telemetry
+
+
+logger = logging.getLogger(__name__)
+
+UP_TO_DATE = "up to date"
+UPSTREAM = "upstream step runs"
+
+
+@dataclass(frozen=True)
+class PlannedExperiment:
+    """
+    Decision of the planner for one experiment and step.
+
+    Attributes:
+        state: Experiment state as found on disk.
+        run: Whether the step will process the experiment.
+        reason: Why it runs (see ``ExperimentState.run_reason``) or "up to date".
+        bytes_in: Size of its source file (0 if it is missing, e.g. archived).
+    """
+
+    state: ExperimentState
+    run: bool
+    reason: str
+    bytes_in: int
+
+
+@dataclass(frozen=True)
+class StepPlan:
+    """
+    What a step will do on the next run, with estimates from past telemetry of the step.
+
+    Attributes:
+        step: Step name.
+        experiments: One decision per experiment.
+        bytes_in: Bytes the step will read (sources of the experiments to run, each counted once).
+        bytes_out: Estimated bytes written, or None without history.
+        wall_s: Projected wall time in seconds, or None without telemetry.
+        basis: Where the estimates come from.
+    """
+
+    step: str
+    experiments: list[PlannedExperiment]
+    bytes_in: int
+    bytes_out: int | None
+    wall_s: float | None
+    basis: str
+
+    @property
+    def to_run(self) -> int:
+        return sum(e.run for e in self.experiments)
+
+    @property
+    def skipped(self) -> int:
+        return len(self.experiments) - self.to_run
+
+    @property
+    def reasons(self) -> Counter[str]:
+        return Counter(e.reason for e in self.experiments)
+
+
+@dataclass(frozen=True)
+class RunPlan:
+    run_dir: Path
+    experiments: int
+    steps: list[StepPlan]
+    elapsed_s: float
+
+    def to_dict(self, *, details: bool = False) -> dict[str, Any]:
+        """JSON-friendly form of the plan; with details, the decision of every experiment is included."""
+        steps: list[dict[str, Any]] = []
+        for sp in self.steps:
+            step: dict[str, Any] = {"step": sp.step, "to_run": sp.to_run, "skipped": sp.skipped, "reasons": dict(sp.reasons),
+                                    "bytes_in": sp.bytes_in, "bytes_out": sp.bytes_out, "wall_s": sp.wall_s, "basis": sp.basis}
+            if details:
+                step["experiments"] = [{"original_image": str(e.state.original_image), "series_index": e.state.series_index,
+                                        "run": e.run, "reason": e.reason, "bytes_in": e.bytes_in} for e in sp.experiments]
+            steps.append(step)
+        return {"run_dir": str(self.run_dir), "experiments": self.experiments, "steps": steps, "elapsed_s": self.elapsed_s}
+
+
+def _overlay_journal(states: StateTable, journaled: Mapping[str, ExperimentState]) -> StateTable:
+    # States journaled by an interrupted run win over their saved (or raw) form, as after replay_state_journal
+    if not journaled:
+        return states
+    pending = dict(journaled)
+    originals = {st.original_image_rel for st in pending.values()}
+    out = [pending.pop(state_key(st), st) for st in states if st.image_rel is not None or st.original_image_rel not in originals]
+    return StateTable.from_states(out + list(pending.values()), states.run_dir)
+
+
+def _estimate(step_name: str, telemetry_dir: Path, bytes_in: Sequence[int], workers: int) -> tuple[float | None, float | None, str]:
+    """
+    Output/input size ratio and projected wall time of running tasks reading bytes_in on workers, from the tasks that
+    processed an experiment in the last runs of the step.
+    """
+    durations: list[float] = []
+    read = written = 0
+    for data in read_telemetry(telemetry_dir, step_name):
+        for stage in data.get("stages", []):
+            if stage.get("summary", {}).get("name") != step_name:
+                continue
+            for task in stage.get("tasks", []):
+                # Skipped experiments pass through without output: only converted ones tell the cost of a task
+                if task.get("error") is not None or task.get("start") is None or not task.get("bytes_out"):
+                    continue
+                durations.append(task["end"] - task["start"])
+                read += task.get("bytes_in", 0)
+                written += task["bytes_out"]
+    if not durations:
+        return None, None, "no telemetry history"
+
+    ratio = written / read if read else None
+    if read:
+        per_byte = sum(durations) / read
+        costs = [size * per_byte if size else sum(durations) / len(durations) for size in bytes_in]
+    else:
+        costs = [sum(durations) / len(durations)] * len(bytes_in)
+    wall = max(sum(costs) / max(workers, 1), max(costs, default=0.0))
+    return ratio, wall, f"telemetry of {len(durations)} past task(s)"
+
+
+def _output_ratio(experiments: Sequence[PlannedExperiment]) -> float | None:
+    # Without telemetry: size of the outputs already on disk relative to their sources
+    sources: dict[Path, int] = {}
+    written = 0
+    for e in experiments:
+        if e.run or e.bytes_in == 0 or e.state.image is None:
+            continue
+        sources[e.state.original_image] = e.bytes_in
+        written += file_size_footprint(e.state.image, 1.0)
+    read = sum(sources.values())
+    return written / read if read and written else None
+
+
+def plan_step(step_name: str, settings: SettingsModel, states: Iterable[ExperimentState], *, user_name: str, output_name: str, step_profile: StepProfile,
+              stat_cache: StatCache | None = None, upstream_runs: frozenset[str] = frozenset(), telemetry_dir: Path | None = None) -> StepPlan:
+    """
+    Decide for every state whether step_name will run, as the step itself does (``ExperimentState.run_reason``), and
+    estimate what it will read and write. Sources are not opened: a source whose mtime changed is reported as
+    "source modified (mtime)", even if the step would find its content unchanged (e.g. a copied file).
+
+    States whose ``state_key`` is in upstream_runs run because a step producing their input runs before this one.
+    """
+    payload = build_payload(settings, step_profile, user_name, output_name)
+    settings_hash = hash_payload(payload)
+    overwrite = bool(getattr(settings, "overwrite", False))
+
+    experiments: list[PlannedExperiment] = []
+    for st in states:
+        reason = UPSTREAM if state_key(st) in upstream_runs else st.run_reason(step_name, settings_hash, overwrite, required_output=output_name, stat_cache=stat_cache, read_source=False)
+        experiments.append(PlannedExperiment(st, reason is not None, reason or UP_TO_DATE, file_size_footprint(st.original_image, 1.0)))
+
+    # The series of a multi-series file are converted together: each source is read (and costs a task) once
+    sizes = list({e.state.original_image: e.bytes_in for e in experiments if e.run}.values())
+    bytes_in = sum(sizes)
+    execution = getattr(settings, "execution", "thread")
+    workers = 1 if execution == "serial" else getattr(settings, "workers", None) or default_workers(execution)
+    ratio, wall, basis = _estimate(step_name, telemetry_dir, sizes, workers) if telemetry_dir is not None and sizes else (None, None, "no telemetry history")
+    if ratio is None:
+        ratio = _output_ratio(experiments)
+        if ratio is not None and wall is None:
+            basis = "existing outputs (no telemetry history)"
+    if not sizes:
+        ratio, wall, basis = 0.0, 0.0, "nothing to run"
+    return StepPlan(step=step_name,
+                    experiments=experiments,
+                    bytes_in=bytes_in,
+                    bytes_out=int(bytes_in * ratio) if ratio is not None else None,
+                    wall_s=wall,
+                    basis=basis)
+
+
+def plan_run(cfg: RunConfig) -> RunPlan:
+    """
+    Plan a run without running it: discover the run directory, then evaluate every enabled step for every experiment.
+
+    Nothing is written (the state store is opened read-only and a missing SQLite store is not created; the journal of
+    an interrupted run is read, not replayed; discovery is never incremental, so the directory snapshot is left alone) and image data is never opened: only directory listings, state files and file
+    metadata (size, mtime) are read. Estimates use the telemetry files found in the log directory (run_dir if unset).
+    """
+    start = time.perf_counter()
+    stat_cache = StatCache()
+    states, store = discover_states(cfg, stat_cache, optimize_target(cfg.user_cfg), read_only=True)
+    with closing(store):
+        states = _overlay_journal(states, read_state_journal(cfg.run_dir))
+
+    steps: list[StepPlan] = []
+    produced: dict[str, frozenset[str]] = {}  # artifact -> keys of the states whose producing step runs
+    for step_name in step_order():
+        spec = REGISTRY[step_name]
+        step_cfg = cfg.user_cfg.get(step_name) or {}
+        if not step_cfg.get("enabled", False):
+            continue
+        upstream_runs = frozenset().union(*(produced.get(i, frozenset()) for i in spec.inputs))
+        sp = plan_step(step_name, spec.model_validate(step_cfg.get("params", {})), states,
+                       user_name=cfg.user_name, output_name=spec.output_name, step_profile=spec.step_profile,
+                       stat_cache=stat_cache, upstream_runs=upstream_runs, telemetry_dir=cfg.log_dir or cfg.run_dir)
+        for output in spec.outputs:
+            produced[output] = frozenset(state_key(e.state) for e in sp.experiments if e.run)
+        steps.append(sp)
+    return RunPlan(run_dir=cfg.run_dir, experiments=len(states), steps=steps, elapsed_s=time.perf_counter() - start)
+
+
+def plan_pipeline(settings_path: Path | None = None) -> RunPlan:
+    """
+    Plan the run described by a user settings file (see ``plan_run``).
+    """
+    return plan_run(load_run_config(settings_path))
+
+
+def _size(n: int | None) -> str:
+    if n is None:
+        return "unknown"
+    value = float(n)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1000:
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1000
+    return f"{value:.1f} TB"
+
+
+def _duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "unknown"
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{secs:02d}s" if hours else f"{minutes}m{secs:02d}s"
+
+
+def format_plan(plan: RunPlan, *, details: bool = False) -> str:
+    """
+    Human-readable report of a plan; with details, one line per experiment.
+    """
+    lines = [f"Run {plan.run_dir}: {plan.experiments} experiment(s) (planned in {plan.elapsed_s:.1f}s)"]
+    if not plan.steps:
+        lines.append("No step is enabled.")
+    for sp in plan.steps:
+        lines.append(f"Step '{sp.step}': {sp.to_run} to run, {sp.skipped} to skip")
+        for reason, count in sp.reasons.most_common():
+            lines.append(f"  {reason}: {count}")
+        lines.append(f"  read {_size(sp.bytes_in)}, write ~{_size(sp.bytes_out)}, wall time ~{_duration(sp.wall_s)} ({sp.basis})")
+        if details:
+            for e in sp.experiments:
+                lines.append(f"    [{'run' if e.run else 'skip'}] {e.state.original_image} #{e.state.series_index}: {e.reason}")
+    return "\n".join(lines)
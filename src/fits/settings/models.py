@@ -3,7 +3,7 @@ from typing import Any, Mapping, Sequence, TypeVar
 from fits_io.readers._types import Zproj
 from pydantic import BaseModel, field_validator, Field
 
-from fits.environment.constant import ExecMode
+from fits.environment.constant import ErrorMode, ExecMode, Schedule
 
 
 class SettingsModel(BaseModel):
@@ -29,8 +29,17 @@ class ConvertSettings(SettingsModel):
         z_projection: Z-projection method to apply to the input files. Supported methods are: max, mean or None. By default, apply max projection.
         compression: Optional compression method for the output file.
         overwrite: Whether to overwrite existing files during conversion coming from SettingsModel.
-        execution: Execution mode for the convert step: serial | thread | process. By default, it will use thread-based execution for this step.
+        execution: Execution mode for the convert step: serial | thread | process | distributed (remote ``fits worker`` processes through the run broker). By default, it will use thread-based execution for this step.
         workers: Number of worker threads or processes to use for the convert step. This is only applicable if the execution mode is set to thread or process. If set to "None", it will use the default number of workers (which is typically the number of CPU plus four).
+        max_in_flight: Maximum number of experiments submitted to the workers and not yet collected. If None, twice the number of workers. Keeps memory flat on very large runs.
+        read_ahead: Whether to read the start of the next input files on I/O threads while the current ones are being converted, to warm the page cache (at most READ_AHEAD_LIMIT bytes per file, see fits.workflows.tasks.convert). The conversion itself still reads, converts and writes each file in one go.
+        read_ahead_workers: Number of I/O threads reading input files ahead in read-ahead mode.
+        memory_factor: Estimated memory needed to convert a file, as a multiple of its size on disk. Only used with a runtime max_memory budget.
+        on_error: What to do when an experiment fails: fail_fast (stop the run), continue (mark it failed and go on) or retry (retry it, then mark it failed and go on).
+        retries: Number of extra attempts per experiment when on_error is retry.
+        retry_backoff: Seconds before the first retry, doubled at each following attempt.
+        task_timeout: Optional maximum time in seconds per experiment (and per attempt), to catch hung network reads. None means no timeout.
+        schedule: Order in which experiments are handed to the workers: input (order of discovery) or largest_first (biggest source files first, so a huge file does not start last and run alone). Ignored with ordered_execution.
         ordered_execution: Whether to preserve the order of the input files in the output files when using parallel execution. If true, it will ensure that the output files are saved in the same order as the input files. If false, it may save output files in a different order than the input files, which can be faster but may not be desirable in some cases.
     """
     channel_labels: str | Sequence[str] | None = None
@@ -40,9 +49,18 @@ class ConvertSettings(SettingsModel):
     compression: str | None = 'zlib'
     execution: ExecMode = Field(default="thread", exclude=True)
     workers: int | None = Field(default=None, exclude=True)
+    max_in_flight: int | None = Field(default=None, exclude=True, ge=1)
     ordered_execution: bool = Field(default=False, exclude=True)
+    schedule: Schedule = Field(default="input", exclude=True)
+    read_ahead: bool = Field(default=False, exclude=True)
+    read_ahead_workers: int = Field(default=2, exclude=True, ge=1)
+    memory_factor: float = Field(default=3.0, exclude=True, gt=0)
+    on_error: ErrorMode = Field(default="fail_fast", exclude=True)
+    retries: int = Field(default=2, exclude=True, ge=0)
+    retry_backoff: float = Field(default=5.0, exclude=True, ge=0)
+    task_timeout: float | None = Field(default=None, exclude=True, gt=0)
     
-    @field_validator('workers', mode='before')
+    @field_validator('workers', 'max_in_flight', 'task_timeout', mode='before')
     @classmethod
     def parse_workers(cls, v):
         if isinstance(v, str) and v.lower() == 'none':
@@ -0,0 +1,167 @@
+from __future__ import annotations
+from contextlib import closing
+from dataclasses import dataclass, field
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Mapping, Sequence
+
+from fits.environment.discovery import collect_supported_files, rediscover_run_dir
+from fits.environment.runtime import handle_signals, use_ctx
+from fits.environment.state import ExperimentState, replay_state_journal
+from fits.environment.store import open_state_store
+from fits.pipeline import load_run_config, open_state_journal, setup_run
+from fits.workflows.execute import run_workflow
+from fits.workflows.executors import WorkerPools
+if TYPE_CHECKING:
+    from fits.environment.log import LogEmitter
+
+
+logger = logging.getLogger(__name__)
+
+_STOP_POLL_INTERVAL = 0.5
+
+
+@dataclass
+class _Pending:
+    size: int
+    mtime_ns: int
+    stable_since: float
+
+
+@dataclass
+class SettleTracker:
+    """
+    Track newly seen raw files until they stop changing.
+
+    A file is ready once its size and modification time have not changed for ``settle`` seconds, i.e. the microscope
+    has finished writing it.
+
+    Args:
+        settle: Seconds a file must stay unchanged before it is handed to the workflow.
+    """
+
+    settle: float = 30.0
+    _pending: dict[Path, _Pending] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def update(self, candidates: list[Path], now: float | None = None) -> list[Path]:
+        """
+        Record the current size/mtime of candidates and return the ones that are stable.
+
+        Candidates that disappeared are forgotten; returned files are removed from tracking.
+        """
+        now = time.monotonic() if now is None else now
+        ready: list[Path] = []
+        seen = set(candidates)
+        for path in list(self._pending):
+            if path not in seen:
+                del self._pending[path]
+
+        for path in candidates:
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                self._pending.pop(path, None)
+                continue
+            pending = self._pending.get(path)
+            if pending is None or (pending.size, pending.mtime_ns) != (st.st_size, st.st_mtime_ns):
+                self._pending[path] = _Pending(st.st_size, st.st_mtime_ns, now)
+                continue
+            if now - pending.stable_since >= self.settle:
+                ready.append(path)
+                del self._pending[path]
+        return ready
+
+
+def _run_cycle(user_cfg: Mapping[str, Any], states: Sequence[ExperimentState], failures: dict[Path, str]) -> None:
+    # A failing cycle (e.g. a corrupt file with on_error = "fail_fast") must not end the watch: its raw files are
+    # recorded as failed and left alone until the next watch or run
+    try:
+        run_workflow(user_cfg, states)
+    except Exception as e:
+        message = f"{type(e).__name__}: {e}"
+        logger.exception(f"Watch: cycle over {len(states)} experiment(s) failed; watching goes on")
+        for st in states:
+            failures[st.original_image] = message
+
+
+def watch_pipeline(settings_path: Path | None = None, gui_emitter: LogEmitter | None = None, *, interval: float = 10.0, settle: float = 30.0, stop: threading.Event | None = None, max_cycles: int | None = None) -> dict[Path, str]:
+    """
+    Keep a run directory converted while it is being acquired.
+
+    The first cycle runs the workflow over the saved states of the run (so settings changes are picked up), then the
+    run directory is polled every ``interval`` seconds with the incremental rediscovery (there is no inotify-style
+    notification: polling also works on network shares). New raw files are processed as soon as they have been stable
+    for ``settle`` seconds; only their ExperimentStates go through ``run_workflow``. Worker pools stay warm between
+    cycles. A cycle that raises is logged and its raw files are not retried until the next watch or run.
+
+    Args:
+        settings_path: Path to user_settings.toml. Defaults to the packaged settings.
+        gui_emitter: Log emitter, required in GUI mode.
+        interval: Seconds between two polls of the run directory.
+        settle: Seconds a new file must stay unchanged before it is processed.
+        stop: Optional event to end the watch from another thread. Ctrl+C or SIGTERM also end it, after the running
+            conversions have finished and their states are saved.
+        max_cycles: Optional number of polls after which the watch returns (mainly for scripted use and tests).
+
+    Returns:
+        The raw files of the cycles that failed, with their error.
+    """
+    cfg = load_run_config(settings_path)
+    user_cfg, run_dir = cfg.user_cfg, cfg.run_dir
+    ctx = setup_run(cfg, gui_emitter)
+    stop = stop or threading.Event()
+    tracker = SettleTracker(settle)
+    failures: dict[Path, str] = {}
+
+    def stopping() -> bool:
+        return stop.is_set() or (ctx.cancel is not None and ctx.cancel.cancelled)
+
+    with use_ctx(ctx):
+        replay_state_journal(run_dir)
+        with closing(open_state_store(run_dir, cfg.state_backend)) as store:
+            journal = open_state_journal(cfg, store)
+            ctx.state_store = journal or store
+            try:
+                with handle_signals(ctx.cancel), WorkerPools() as pools:
+                    ctx.worker_pools = pools
+                    # --- catch up on what was already acquired and converted ---
+                    saved = store.load_all()
+                    known: set[Path] = {s.original_image for s in saved}
+                    if saved:
+                        logger.info(f"Watch: re-checking {len(saved)} saved experiment states in {run_dir}")
+                        _run_cycle(user_cfg, saved, failures)
+
+                    logger.info(f"Watching {run_dir} every {interval:g}s (files must be stable for {settle:g}s)")
+                    cycles = 0
+                    while not stopping():
+                        rediscovery = rediscover_run_dir(run_dir, stat_cache=ctx.stat_cache)
+                        candidates = [p for p in collect_supported_files(run_dir, index=rediscovery.index) if p not in known]
+                        ready = tracker.update(candidates)
+                        if ready and not stopping():
+                            logger.info(f"Watch: {len(ready)} new raw files ready ({len(tracker)} still being written)")
+                            known.update(ready)
+                            _run_cycle(user_cfg, [ExperimentState.init(run_dir, p) for p in ready], failures)
+
+                        cycles += 1
+                        if max_cycles is not None and cycles >= max_cycles:
+                            break
+                        deadline = time.monotonic() + interval
+                        while not stopping() and (remaining := deadline - time.monotonic()) > 0:
+                            stop.wait(min(remaining, _STOP_POLL_INTERVAL))
+            except KeyboardInterrupt:
+                logger.info("Watch interrupted; flushing experiment states")
+            finally:
+                if ctx.cancel is not None and ctx.cancel.cancelled:
+                    logger.info(f"Watch stopped ({ctx.cancel.reason}); experiment states are saved")
+                if journal is not None:
+                    journal.close()
+    if failures:
+        logger.warning(f"Watch: {len(failures)} raw file(s) failed, run the pipeline again to retry them: {', '.join(str(p) for p in failures)}")
+    return failures
+
@@ -0,0 +1,435 @@
+from __future__ import annotations
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass
+import logging
+import os
+from pathlib import Path
+import pickle
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+from typing import Any, Callable
+import uuid
+
+from fits.environment.constant import BROKER_DB_NAME
+
+
+logger = logging.getLogger(__name__)
+
+BROKER_POLL_INTERVAL = 0.5
+HEARTBEAT_INTERVAL = 10.0
+TASK_LEASE = 60.0  # a running task without heartbeat for that long goes back to the queue (its worker died)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    batch_id TEXT PRIMARY KEY,
+    func BLOB NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    batch_id TEXT NOT NULL REFERENCES batches (batch_id) ON DELETE CASCADE,
+    item BLOB NOT NULL,
+    status TEXT NOT NULL,
+    worker TEXT,
+    heartbeat REAL,
+    result BLOB
+);
+CREATE INDEX IF NOT EXISTS ix_tasks_status ON tasks (status, task_id);
+CREATE INDEX IF NOT EXISTS ix_tasks_batch ON tasks (batch_id, status);
+"""
+
+# SQLite limits the number of bound parameters per statement
+_CHUNK = 500
+
+
+class RemoteTaskError(RuntimeError):
+    """
+    Error raised by a task on a broker worker whose exception could not be sent back as is.
+    """
+
+
+@dataclass(frozen=True)
+class ClaimedTask:
+    task_id: int
+    batch_id: str
+    item: Any
+
+
+def resolve_broker_path(path: Path) -> Path:
+    """
+    Broker database for path: the file itself, or ``BROKER_DB_NAME`` inside it if path is a directory (e.g. run_dir).
+    """
+    return path / BROKER_DB_NAME if path.is_dir() else path
+
+
+class TaskBroker:
+    """
+    SQLite task queue shared by the nodes of a distributed run (the database lives on the shared storage).
+
+    The parent registers a batch (the pickled step task, with the worker initializer) and submits pickled items; workers
+    started with ``fits worker`` claim queued tasks, run them and store the pickled result or exception. Running tasks
+    are kept alive by heartbeats: the task of a worker that died goes back to the queue after ``TASK_LEASE`` seconds.
+
+    The database uses the rollback journal rather than WAL, which needs shared memory and does not work across hosts.
+    Node clocks are assumed to agree within a fraction of the lease.
+
+    Args:
+        path: Broker database, or a directory to hold it (see resolve_broker_path).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = resolve_broker_path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+
+    def _transaction(self, statements: Callable[[sqlite3.Cursor], Any]) -> Any:
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(cur)
+                cur.execute("COMMIT")
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            return result
+
+    # ---------------------------------------------------------------------
+    # Parent side
+    # ---------------------------------------------------------------------
+
+    def register_batch(self, func: Callable[[Any], Any], initializer: Callable[..., object] | None = None, initargs: tuple[Any, ...] = ()) -> str:
+        """
+        Store the task function (and the initializer run once per worker and batch) and return the batch id.
+        """
+        batch_id = uuid.uuid4().hex
+        blob = pickle.dumps((func, initializer, initargs))
+        self._transaction(lambda cur: cur.execute("INSERT INTO batches (batch_id, func, created_at) VALUES (?, ?, ?)", (batch_id, blob, time.time())))
+        return batch_id
+
+    def submit(self, batch_id: str, item: Any) -> int:
+        blob = pickle.dumps(item)
+        return self._transaction(lambda cur: cur.execute("INSERT INTO tasks (batch_id, item, status) VALUES (?, ?, 'queued')", (batch_id, blob)).lastrowid)
+
+    def poll(self, task_ids: list[int]) -> list[tuple[int, str, bytes | None]]:
+        """
+        Return (task_id, status, result) of the given tasks that left the queue. Finished tasks are removed.
+        """
+        rows: list[tuple[int, str, bytes | None]] = []
+        for start in range(0, len(task_ids), _CHUNK):
+            chunk = task_ids[start:start + _CHUNK]
+            marks = ",".join("?" * len(chunk))
+            def collect(cur: sqlite3.Cursor) -> list[tuple[int, str, bytes | None]]:
+                found = cur.execute(f"SELECT task_id, status, result FROM tasks WHERE task_id IN ({marks}) AND status != 'queued'", chunk).fetchall()
+                cur.execute(f"DELETE FROM tasks WHERE task_id IN ({marks}) AND status IN ('done', 'failed')", chunk)
+                return found
+            rows.extend(self._transaction(collect))
+        return rows
+
+    def cancel(self, task_ids: list[int]) -> int:
+        """
+        Remove the given tasks if they are still queued. Returns the number removed.
+        """
+        removed = 0
+        for start in range(0, len(task_ids), _CHUNK):
+            chunk = task_ids[start:start + _CHUNK]
+            marks = ",".join("?" * len(chunk))
+            removed += self._transaction(lambda cur: cur.execute(f"DELETE FROM tasks WHERE task_id IN ({marks}) AND status = 'queued'", chunk).rowcount)
+        return removed
+
+    def requeue_stale(self, lease: float = TASK_LEASE) -> int:
+        """
+        Put back in the queue the running tasks whose worker stopped sending heartbeats.
+        """
+        deadline = time.time() - lease
+        n = self._transaction(lambda cur: cur.execute("UPDATE tasks SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat < ?", (deadline,)).rowcount)
+        if n:
+            logger.warning(f"Requeued {n} task(s) of unresponsive workers")
+        return n
+
+    def drop_batch(self, batch_id: str) -> None:
+        self._transaction(lambda cur: cur.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,)))
+
+    # ---------------------------------------------------------------------
+    # Worker side
+    # ---------------------------------------------------------------------
+
+    def claim(self, worker: str) -> ClaimedTask | None:
+        """
+        Atomically take the oldest queued task, or return None if the queue is empty.
+        """
+        def take(cur: sqlite3.Cursor) -> tuple[int, str, bytes] | None:
+            row = cur.execute("SELECT task_id, batch_id, item FROM tasks WHERE status = 'queued' ORDER BY task_id LIMIT 1").fetchone()
+            if row is not None:
+                cur.execute("UPDATE tasks SET status = 'running', worker = ?, heartbeat = ? WHERE task_id = ?", (worker, time.time(), row[0]))
+            return row
+        row = self._transaction(take)
+        if row is None:
+            return None
+        return ClaimedTask(row[0], row[1], pickle.loads(row[2]))
+
+    def load_batch(self, batch_id: str) -> tuple[Callable[[Any], Any], Callable[..., object] | None, tuple[Any, ...]] | None:
+        with self._lock:
+            row = self._conn.execute("SELECT func FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        return None if row is None else pickle.loads(row[0])
+
+    def heartbeat(self, task_id: int, worker: str) -> None:
+        self._transaction(lambda cur: cur.execute("UPDATE tasks SET heartbeat = ? WHERE task_id = ? AND status = 'running' AND worker = ?", (time.time(), task_id, worker)))
+
+    def finish(self, task_id: int, worker: str, *, ok: bool, result: bytes) -> bool:
+        """
+        Store the result of a task, if worker still holds it. Returns False for a late result: the task was requeued
+        (see requeue_stale) and may run or have run on another worker, whose result is the one kept.
+        """
+        status = "done" if ok else "failed"
+        return self._transaction(lambda cur: cur.execute("UPDATE tasks SET status = ?, result = ?, heartbeat = ? WHERE task_id = ? AND status = 'running' AND worker = ?",
+                                                         (status, result, time.time(), task_id, worker)).rowcount) == 1
+
+    def release(self, task_id: int, worker: str) -> None:
+        """
+        Give a claimed task back to the queue (e.g. its worker is stopping).
+        """
+        self._transaction(lambda cur: cur.execute("UPDATE tasks SET status = 'queued', worker = NULL WHERE task_id = ? AND status = 'running' AND worker = ?", (task_id, worker)))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _dump_error(err: BaseException) -> bytes:
+    try:
+        return pickle.dumps(err)
+    except Exception:
+        return pickle.dumps(RemoteTaskError(f"{type(err).__name__}: {err}"))
+
+
+class BrokerExecutor(Executor):
+    """
+    concurrent.futures executor handing tasks to remote workers through a TaskBroker (``distributed`` mode of execute).
+
+    Futures stay pending while their task is queued (so execute can cancel them), run once a worker claimed it and
+    complete with the result sent back. A collector thread polls the broker every ``BROKER_POLL_INTERVAL`` seconds; a
+    result that cannot be unpickled fails its future with a RemoteTaskError, and if the collector itself dies, every
+    pending future fails the same way.
+
+    func, items and results must be picklable; paths must resolve to the same shared storage on every node.
+
+    Args:
+        path: Broker database (or directory holding it).
+        initializer: Optional initializer run once per worker and batch, with initargs.
+        initargs: Arguments of initializer.
+    """
+
+    def __init__(self, path: Path, initializer: Callable[..., object] | None = None, initargs: tuple[Any, ...] = ()) -> None:
+        self._broker = TaskBroker(path)
+        self._initializer = initializer
+        self._initargs = initargs
+        self._batches: dict[int, tuple[Callable[..., Any], str]] = {}
+        self._futures: dict[int, Future[Any]] = {}
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._broken: str | None = None
+        self._stop = threading.Event()
+        self._collector = threading.Thread(target=self._collect, name="fits-broker-collector", daemon=True)
+        self._collector.start()
+        logger.info(f"Distributed execution through broker {self._broker.path}: start workers with 'fits worker --broker {self._broker.path}'")
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future[Any]:
+        if kwargs or len(args) != 1:
+            raise TypeError("BrokerExecutor only runs single-argument tasks")
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            if self._broken is not None:
+                raise RemoteTaskError(self._broken)
+            known = self._batches.get(id(fn))
+            if known is None:
+                known = (fn, self._broker.register_batch(fn, self._initializer, self._initargs))
+                self._batches[id(fn)] = known
+            fut: Future[Any] = Future()
+            self._futures[self._broker.submit(known[1], args[0])] = fut
+        return fut
+
+    def _collect(self) -> None:
+        last_requeue = 0.0
+        try:
+            while not self._stop.wait(BROKER_POLL_INTERVAL):
+                try:
+                    self._collect_once()
+                    if time.monotonic() - last_requeue > HEARTBEAT_INTERVAL:
+                        self._broker.requeue_stale()
+                        last_requeue = time.monotonic()
+                except sqlite3.Error as e:
+                    logger.warning(f"Broker poll failed, retrying: {e}")
+        except BaseException:
+            logger.exception("Broker collector stopped")
+            self._fail_pending(f"Broker collector stopped:\n{traceback.format_exc()}")
+
+    def _fail_pending(self, message: str) -> None:
+        # No result can come back anymore: fail every pending future instead of leaving execute waiting
+        with self._lock:
+            self._broken = message
+            futures = dict(self._futures)
+            self._futures.clear()
+        for fut in futures.values():
+            if not fut.done():
+                fut.set_exception(RemoteTaskError(message))
+        try:
+            self._broker.cancel(list(futures))
+        except sqlite3.Error as e:
+            logger.warning(f"Could not remove the queued tasks from the broker: {e}")
+
+    def _collect_once(self) -> None:
+        with self._lock:
+            futures = dict(self._futures)
+        settled = [task_id for task_id, fut in futures.items() if fut.cancelled()]
+        if settled:
+            self._broker.cancel(settled)
+        for task_id, status, result in self._broker.poll([t for t in futures if t not in settled]):
+            fut = futures[task_id]
+            if not fut.running() and not fut.set_running_or_notify_cancel():
+                settled.append(task_id)  # claimed just after being cancelled: its result is ignored
+                continue
+            if status == "running":
+                continue
+            assert result is not None
+            try:
+                value = pickle.loads(result)
+            except Exception:
+                kind = "result" if status == "done" else "exception"
+                fut.set_exception(RemoteTaskError(f"Cannot unpickle the {kind} of task {task_id}:\n{traceback.format_exc()}"))
+            else:
+                if status == "done":
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+            settled.append(task_id)
+        if settled:
+            with self._lock:
+                for task_id in settled:
+                    self._futures.pop(task_id, None)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            self._shutdown = True
+            futures = list(self._futures.values())
+        if cancel_futures:
+            for fut in futures:
+                fut.cancel()
+        if wait:
+            for fut in futures:
+                if not fut.cancelled():
+                    try:
+                        fut.exception()
+                    except Exception:
+                        pass
+        self._collect_once()
+        self._stop.set()
+        self._collector.join()
+        for _, batch_id in self._batches.values():
+            self._broker.drop_batch(batch_id)
+        self._broker.close()
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_worker(path: Path, *, name: str | None = None, poll: float = 1.0, idle_exit: float | None = None, stop: threading.Event | None = None) -> int:
+    """
+    Serve tasks from the broker until stopped: claim a task, run it, send back its result (or exception).
+
+    Started on any node of the shared storage by ``fits worker --broker PATH``. The initializer of a batch runs once
+    in this process before its first task. Ctrl+C gives the current task back to the queue.
+
+    Args:
+        path: Broker database (or directory holding it).
+        name: Worker name shown in the broker (defaults to host:pid).
+        poll: Seconds between two looks at an empty queue.
+        idle_exit: Optional number of idle seconds after which the worker exits.
+        stop: Optional event to stop the worker from another thread.
+
+    Returns:
+        Number of tasks run.
+    """
+    broker = TaskBroker(path)
+    name = name or worker_id()
+    stop = stop or threading.Event()
+    batches: dict[str, Callable[[Any], Any]] = {}
+    n_tasks = 0
+    idle_since = time.monotonic()
+    logger.info(f"Worker {name} serving tasks from {broker.path}")
+
+    try:
+        while not stop.is_set():
+            task = broker.claim(name)
+            if task is None:
+                if idle_exit is not None and time.monotonic() - idle_since >= idle_exit:
+                    logger.info(f"Worker {name} idle for {idle_exit:g}s, exiting")
+                    break
+                stop.wait(poll)
+                continue
+
+            func = batches.get(task.batch_id)
+            if func is None:
+                loaded = broker.load_batch(task.batch_id)
+                if loaded is None:
+                    # The parent gave up on its batch (cancelled or finished) between submit and claim
+                    broker.finish(task.task_id, name, ok=False, result=_dump_error(RemoteTaskError("Batch no longer exists")))
+                    continue
+                func, initializer, initargs = loaded
+                if initializer is not None:
+                    _run_initializer(initializer, initargs)
+                batches[task.batch_id] = func
+
+            beating = threading.Event()
+            beat = threading.Thread(target=_heartbeat, args=(broker, task.task_id, name, beating), daemon=True)
+            beat.start()
+            try:
+                result = func(task.item)
+            except KeyboardInterrupt:
+                broker.release(task.task_id, name)
+                raise
+            except Exception as e:
+                logger.error(f"Task {task.task_id} failed: {e}")
+                accepted = broker.finish(task.task_id, name, ok=False, result=_dump_error(e))
+            else:
+                accepted = broker.finish(task.task_id, name, ok=True, result=pickle.dumps(result))
+            finally:
+                beating.set()
+                beat.join()
+            if not accepted:
+                logger.warning(f"Dropped the late result of task {task.task_id}: it was requeued after its lease expired")
+            n_tasks += 1
+            idle_since = time.monotonic()
+    except KeyboardInterrupt:
+        logger.info(f"Worker {name} interrupted")
+    finally:
+        broker.close()
+    logger.info(f"Worker {name} ran {n_tasks} task(s)")
+    return n_tasks
+
+
+def _run_initializer(initializer: Callable[..., object], initargs: tuple[Any, ...]) -> None:
+    # Pool initializers may ignore SIGINT/SIGTERM (see init_worker_ctx); a broker worker must stay interruptible
+    in_main = threading.current_thread() is threading.main_thread()
+    handlers = {sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)} if in_main else {}
+    initializer(*initargs)
+    for sig, handler in handlers.items():
+        signal.signal(sig, handler)
+
+
+def _heartbeat(broker: TaskBroker, task_id: int, worker: str, done: threading.Event) -> None:
+    while not done.wait(HEARTBEAT_INTERVAL):
+        try:
+            broker.heartbeat(task_id, worker)
+        except sqlite3.Error as e:
+            logger.warning(f"Heartbeat of task {task_id} failed: {e}")
@@ -0,0 +1,249 @@
+from __future__ import annotations
+from collections.abc import Sequence
+from functools import lru_cache
+import hashlib
+from importlib import metadata
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import time
+import uuid
+
+from fits.environment.constant import CacheLink
+from fits.environment.fingerprint import SourceFingerprint, content_digest
+from fits.workflows.memory import parse_memory_size
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+INDEX_DIR = "index"  # fingerprint -> content digest of the raw files seen so far
+# Provenance user of cached outputs: they are shared by every user, so they cannot name the one who converted them
+CACHE_USER_NAME = "output-cache"
+_FICLONE = 0x40049409  # Linux ioctl cloning a file (reflink) on btrfs, XFS, ...
+
+
+@lru_cache(maxsize=None)
+def distribution_version(name: str | None) -> str:
+    """
+    Installed version of the distribution running a step ("" if unknown), so a new release does not reuse old outputs.
+    """
+    if not name:
+        return ""
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return ""
+
+
+def _reflink(src: Path, dst: Path) -> None:
+    import fcntl
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+
+
+class OutputCache:
+    """
+    Content-addressed cache of step outputs, shared across runs and users (e.g. on the shared storage).
+
+    Entries are keyed by a digest of the whole content of the raw file (not its path or mtime, see
+    ``fingerprint.content_digest``), the step, its settings hash and the version of the distribution running it. The
+    content digest is computed once per source fingerprint (size, mtime and head/tail digest) and kept in an index, so
+    looking up a source seen before only stats it. Cached outputs are converted under ``CACHE_USER_NAME`` rather than
+    the user running the step, so any user can reuse them. Outputs are stored once, under paths relative to the raw
+    file folder, and materialised into a new workdir by reflink (copy-on-write clone) or hardlink, falling back to a
+    copy. Least recently used entries are evicted when the cache grows over max_size.
+
+    Hardlinks share the file with the cache: tools editing outputs in place (e.g. metadata changes) would edit the
+    cached copy too, which is why ``auto`` only uses reflinks or copies.
+
+    Args:
+        root: Cache directory.
+        max_size: Optional size limit in bytes.
+        link: How outputs are materialised: auto (reflink, else copy) | reflink | hardlink | copy.
+    """
+
+    def __init__(self, root: Path, max_size: int | None = None, link: CacheLink = "auto") -> None:
+        self.root = root
+        self.max_size = max_size
+        self.link = link
+
+    @classmethod
+    def from_setting(cls, root: str | Path | None, max_size: str | int | None = None, link: CacheLink = "auto") -> OutputCache | None:
+        """
+        Build the cache from runtime settings, or None if no cache directory is set.
+        """
+        if root is None or (isinstance(root, str) and root.strip().lower() in ("", "none")):
+            return None
+        if isinstance(max_size, str) and max_size.strip().lower() in ("", "none"):
+            max_size = None
+        return cls(Path(root).expanduser().resolve(), parse_memory_size(max_size) if max_size is not None else None, link)
+
+    @staticmethod
+    def key(digest: str, step_name: str, settings_hash: str, version: str = "") -> str:
+        raw = f"{digest}:{step_name}:{settings_hash}:{version}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:32]
+
+    def _entry(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _index_entry(self, fingerprint: SourceFingerprint) -> Path:
+        name = hashlib.sha256(f"{fingerprint.size}:{fingerprint.mtime_ns}:{fingerprint.digest}".encode()).hexdigest()[:32]
+        return self.root / INDEX_DIR / name[:2] / name
+
+    def source_digest(self, path: Path, fingerprint: SourceFingerprint) -> str:
+        """
+        Content digest of the raw file path, whose fingerprint was just taken. Only the first lookup of a fingerprint
+        reads the whole file; the digest is then indexed under the fingerprint.
+        """
+        entry = self._index_entry(fingerprint)
+        try:
+            return entry.read_text(encoding="utf-8").strip()
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        except OSError as e:
+            logger.debug(f"Ignoring unreadable cache index entry {entry}: {e}")
+
+        digest = content_digest(path)
+        st = os.stat(path)
+        if (st.st_size, st.st_mtime_ns) != (fingerprint.size, fingerprint.mtime_ns):
+            # Modified while being hashed: the digest does not belong to the fingerprint
+            return digest
+        tmp = entry.with_name(f".{entry.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            entry.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(digest, encoding="utf-8")
+            os.replace(tmp, entry)
+        except OSError as e:
+            tmp.unlink(missing_ok=True)
+            logger.debug(f"Could not index the digest of {path}: {e}")
+        return digest
+
+    # ---------------------------------------------------------------------
+    # Lookup
+    # ---------------------------------------------------------------------
+
+    def has(self, key: str) -> bool:
+        return (self._entry(key) / MANIFEST_NAME).exists()
+
+    def get(self, key: str, base_dir: Path) -> list[Path] | None:
+        """
+        Materialise the outputs of key under base_dir and return their paths, or None on a cache miss.
+        """
+        entry = self._entry(key)
+        try:
+            manifest = json.loads((entry / MANIFEST_NAME).read_text(encoding="utf-8"))
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable cache entry {entry}: {e}")
+            return None
+
+        out: list[Path] = []
+        for rel in manifest["files"]:
+            dst = base_dir / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.tmp")
+            try:
+                self._materialise(entry / "files" / rel, tmp)
+                os.replace(tmp, dst)
+            except FileNotFoundError:
+                tmp.unlink(missing_ok=True)
+                logger.debug(f"Cache entry {key} was evicted while being read")
+                return None
+            out.append(dst)
+        os.utime(entry / MANIFEST_NAME)  # last access, for LRU eviction
+        return out
+
+    def _materialise(self, src: Path, dst: Path) -> None:
+        if self.link in ("auto", "reflink"):
+            try:
+                _reflink(src, dst)
+                return
+            except (OSError, ImportError) as e:
+                dst.unlink(missing_ok=True)
+                if self.link == "reflink":
+                    logger.debug(f"Reflink not supported for {dst} ({e}); copying")
+        elif self.link == "hardlink":
+            try:
+                os.link(src, dst)
+                return
+            except OSError as e:
+                logger.debug(f"Hardlink not possible for {dst} ({e}); copying")
+        shutil.copyfile(src, dst)
+
+    # ---------------------------------------------------------------------
+    # Store
+    # ---------------------------------------------------------------------
+
+    def put(self, key: str, base_dir: Path, files: Sequence[Path]) -> bool:
+        """
+        Store files (all under base_dir) as the outputs of key. Returns False if they cannot be cached.
+        """
+        entry = self._entry(key)
+        if entry.exists():
+            return True
+        try:
+            rels = [Path(f).relative_to(base_dir).as_posix() for f in files]
+        except ValueError:
+            logger.debug(f"Not caching outputs outside of {base_dir}: {files}")
+            return False
+
+        staging = entry.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+        size = 0
+        try:
+            for f, rel in zip(files, rels):
+                dst = staging / "files" / rel
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                self._materialise(Path(f), dst)
+                size += dst.stat().st_size
+            (staging / MANIFEST_NAME).write_text(json.dumps({"files": rels, "size": size, "created": time.time()}), encoding="utf-8")
+        except OSError as e:
+            logger.warning(f"Could not cache outputs of {base_dir}: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+        try:
+            staging.rename(entry)
+        except OSError:
+            # Another run stored the same outputs meanwhile
+            shutil.rmtree(staging, ignore_errors=True)
+            return True
+        logger.debug(f"Cached {len(rels)} output(s) as {key} ({size / 1e6:.1f} MB)")
+        if self.max_size is not None:
+            self.evict()
+        return True
+
+    def evict(self, max_size: int | None = None) -> int:
+        """
+        Remove least recently used entries until the cache fits in max_size (default: the cache limit). Returns the
+        number of bytes freed.
+        """
+        limit = self.max_size if max_size is None else max_size
+        if limit is None:
+            return 0
+        entries: list[tuple[float, int, Path]] = []
+        with os.scandir(self.root) as shards:
+            for shard in shards:
+                if shard.name == INDEX_DIR or not shard.is_dir():
+                    continue
+                with os.scandir(shard.path) as items:
+                    for item in items:
+                        if item.name.startswith("."):
+                            continue
+                        manifest = Path(item.path) / MANIFEST_NAME
+                        try:
+                            entries.append((manifest.stat().st_mtime, json.loads(manifest.read_text(encoding="utf-8"))["size"], Path(item.path)))
+                        except (OSError, ValueError, KeyError):
+                            continue
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total - freed <= limit:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            freed += size
+        if freed:
+            logger.info(f"Output cache: evicted {freed / 1e6:.1f} MB of least recently used entries")
+        return freed
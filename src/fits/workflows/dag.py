@@ -0,0 +1,227 @@
+from __future__ import annotations
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+from graphlib import CycleError, TopologicalSorter
+import logging
+from typing import Any
+
+from fits.environment.state import ExperimentState, state_key
+from fits.workflows.executors import CANCEL_POLL_INTERVAL, CancelToken, ErrorPolicy, Guarded, WorkerPools, default_workers
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class StepJob:
+    """
+    Per-experiment form of a step, as run by the DAG engine.
+
+    Attributes:
+        run: Processes one experiment and returns the states it produced (already persisted).
+        concurrency: Maximum number of experiments of this step running at once. None means the default thread count.
+        policy: Error policy of the step (fail_fast, continue or retry, with optional timeout).
+        on_failure: With continue or retry, returns the (failed) states of an experiment whose run raised.
+        close: Called once every experiment went through the step (e.g. flush states, summarize failures).
+    """
+
+    run: Callable[[ExperimentState], Sequence[ExperimentState]]
+    concurrency: int | None = None
+    policy: ErrorPolicy = field(default_factory=ErrorPolicy)
+    on_failure: Callable[[ExperimentState, Exception], Sequence[ExperimentState]] | None = None
+    close: Callable[[], None] | None = None
+
+
+@dataclass(frozen=True)
+class StepNode:
+    name: str
+    job: StepJob
+    upstream: tuple[str, ...]
+    downstream: tuple[str, ...]
+
+    @property
+    def limit(self) -> int:
+        return self.job.concurrency or default_workers("thread")
+
+
+@dataclass(frozen=True)
+class WorkflowGraph:
+    """
+    Enabled steps of a workflow in topological order, linked by the artifacts they produce and consume.
+    """
+
+    nodes: dict[str, StepNode]
+
+    @property
+    def roots(self) -> list[str]:
+        return [name for name, node in self.nodes.items() if not node.upstream]
+
+
+def build_graph(user_cfg: Mapping[str, Any], registry: Mapping[str, Any]) -> WorkflowGraph | None:
+    """
+    Build the graph of the enabled steps of registry from the inputs and outputs declared by their StepSpec.
+
+    A step depends on the enabled steps producing one of its inputs; inputs produced by a disabled step are expected to
+    be on disk already (needs_run checks them). Returns None if an enabled step has no per-experiment job (it can only
+    run as a whole-step runner, e.g. its job factory returned None for the current settings) or if no step is enabled.
+
+    Raises:
+        ValueError: If the steps form a cycle.
+    """
+    jobs: dict[str, StepJob] = {}
+    producers: dict[str, str] = {}
+    specs: dict[str, Any] = {}
+    for name, spec in registry.items():
+        step_cfg = user_cfg.get(name) or {}
+        if not step_cfg.get("enabled", False):
+            continue
+        make_job = getattr(spec, "job", None)
+        job = make_job(spec.model_validate(step_cfg.get("params", {})), spec.step_profile, spec.output_name) if make_job is not None else None
+        if job is None:
+            logger.debug(f"Step '{name}' has no per-experiment job; using the step-by-step workflow")
+            return None
+        jobs[name] = job
+        specs[name] = spec
+        for output in spec.outputs:
+            producers[output] = name
+    if not jobs:
+        return None
+
+    upstream = {name: tuple(sorted({producers[i] for i in spec.inputs if i in producers} - {name})) for name, spec in specs.items()}
+    try:
+        order = list(TopologicalSorter(upstream).static_order())
+    except CycleError as e:
+        raise ValueError(f"Workflow steps form a cycle: {e.args[1]}") from e
+    downstream = {name: tuple(child for child in order if name in upstream[child]) for name in order}
+    return WorkflowGraph({name: StepNode(name, jobs[name], upstream[name], downstream[name]) for name in order})
+
+
+def _merge(states: Sequence[ExperimentState]) -> ExperimentState:
+    # States of one experiment coming from parallel branches: keep the latest, with the step records of all branches
+    latest = max(states, key=lambda st: st.updated_at)
+    step_status: dict[str, Any] = {}
+    step_settings_hash: dict[str, str] = {}
+    for st in states:
+        step_status.update(st.step_status)
+        step_settings_hash.update(st.step_settings_hash)
+    masks_rel = next((st.masks_rel for st in states if st.masks_rel is not None), latest.masks_rel)
+    return replace(latest, step_status=step_status, step_settings_hash=step_settings_hash, masks_rel=masks_rel)
+
+
+def run_dag(graph: WorkflowGraph, exp_states: Iterable[ExperimentState], *, pools: WorkerPools | None = None, cancel: CancelToken | None = None, max_in_flight: int | None = None) -> list[ExperimentState]:
+    """
+    Run the workflow per experiment: each state moves to the next steps as soon as its previous step is done with it,
+    instead of waiting for every experiment to finish that step.
+
+    All steps share one thread pool (sized to the sum of the step concurrency limits) and each step never runs more
+    than its limit at once. Downstream steps get free workers first, so experiments are finished before new ones are
+    started; at most max_in_flight experiments (default: 2 x pool size) are in the workflow at once, so exp_states can
+    be a lazy stream. A step depending on several steps runs once all of them produced the experiment. States failed by
+    a step (continue/retry policies) leave the workflow. Once cancel is cancelled, nothing new is started and running
+    tasks finish.
+
+    Returns:
+        The states leaving the workflow (outputs of the last steps and failed states).
+    """
+    nodes = graph.nodes
+    size = sum(node.limit for node in nodes.values())
+    window = 2 * size if max_in_flight is None else max_in_flight
+    if window < 1:
+        raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight!r}")
+    runs = {name: Guarded(node.job.run, node.job.policy) if node.job.policy.timeout is not None or node.job.policy.attempts > 1 else node.job.run
+            for name, node in nodes.items()}
+    priority = list(reversed(nodes))  # downstream first
+
+    source: Iterator[ExperimentState] | None = iter(exp_states)
+    ready: dict[str, deque[ExperimentState]] = {name: deque() for name in nodes}
+    running: dict[str, int] = {name: 0 for name in nodes}
+    joins: dict[tuple[str, str], list[ExperimentState]] = {}
+    futures: dict[Future[Sequence[ExperimentState]], tuple[str, ExperimentState]] = {}
+    results: list[ExperimentState] = []
+    in_flight = 0  # experiments (or series) inside the workflow
+    cancelled = False
+
+    def forward(name: str, states: Sequence[ExperimentState]) -> None:
+        nonlocal in_flight
+        for st in states:
+            if st.step_status.get(name) == "failed" or not nodes[name].downstream:
+                results.append(st)
+                continue
+            for child in nodes[name].downstream:
+                parents = nodes[child].upstream
+                if len(parents) == 1:
+                    ready[child].append(st)
+                    in_flight += 1
+                    continue
+                arrived = joins.setdefault((child, state_key(st)), [])
+                arrived.append(st)
+                if len(arrived) == len(parents):
+                    del joins[(child, state_key(st))]
+                    ready[child].append(_merge(arrived))
+                    in_flight += 1
+
+    def submit_ready(ex: Executor) -> None:
+        nonlocal source, in_flight
+        while len(futures) < size:
+            for name in priority:
+                if ready[name] and running[name] < nodes[name].limit:
+                    st = ready[name].popleft()
+                    futures[ex.submit(runs[name], st)] = (name, st)
+                    running[name] += 1
+                    break
+            else:
+                # No queued experiment can start: admit a new one from the source
+                if source is None or cancelled or in_flight >= window:
+                    return
+                st = next(source, None)
+                if st is None:
+                    source = None
+                    return
+                for root in graph.roots:
+                    ready[root].append(st)
+                    in_flight += 1
+
+    own_pool = pools is None
+    ex = ThreadPoolExecutor(max_workers=size) if pools is None else pools.get("thread", size)
+    try:
+        submit_ready(ex)
+        while futures:
+            done, _ = wait(futures, timeout=CANCEL_POLL_INTERVAL if cancel is not None else None, return_when=FIRST_COMPLETED)
+            if not cancelled and cancel is not None and cancel.cancelled:
+                cancelled = True
+                # Queued experiments (at any step) and those not read from the source yet
+                waiting = [(name, st) for name in nodes for st in ready[name]] + [(None, st) for st in (source or ())]
+                source = None
+                lines = "".join(f"\n  - {st.original_image}" + (f" (before step '{name}')" if name is not None else "") for name, st in waiting)
+                logger.warning(f"Workflow cancelled ({cancel.reason}): waiting for {len(futures)} running task(s); {len(waiting)} experiment(s) were not started:{lines}")
+                for q in ready.values():
+                    q.clear()
+            for fut in done:
+                name, st = futures.pop(fut)
+                running[name] -= 1
+                in_flight -= 1
+                job = nodes[name].job
+                try:
+                    out = fut.result()
+                except Exception as e:
+                    if job.policy.mode == "fail_fast":
+                        raise RuntimeError(f"Step '{name}' failed for item: {st!r}") from e
+                    logger.error("Step '%s' failed for item %r: %s", name, st, e)
+                    out = job.on_failure(st, e) if job.on_failure is not None else []
+                forward(name, out)
+            if not cancelled:
+                submit_ready(ex)
+    finally:
+        for fut in futures:
+            fut.cancel()
+        # Tasks already running (e.g. next to a fail_fast error, on shared pools) still save states: let them finish
+        # before the jobs are closed
+        wait(futures)
+        if own_pool:
+            ex.shutdown(wait=True)
+        for node in nodes.values():
+            if node.job.close is not None:
+                node.job.close()
+    return results
@@ -1,7 +1,11 @@
-from typing import Any, Mapping
+from graphlib import CycleError, TopologicalSorter
+import heapq
+from typing import Any, Iterable, Mapping
 import logging
 
+from fits.environment.runtime import CURRENT_CTX
 from fits.environment.state import ExperimentState
+from fits.workflows.dag import build_graph, run_dag
 from fits.workflows.registry import REGISTRY
 
 
@@ -11,12 +15,61 @@ WORKFLOW_ORDER = [
     "convert",
 ]
 
-def run_workflow(user_cfg: Mapping[str, Any], exp_states: list[ExperimentState]) -> list[ExperimentState]:
-    
-    for step_name in WORKFLOW_ORDER:
-        step_spec = REGISTRY.get(step_name)
-        if step_spec is None:
-            continue
+
+def step_order(registry: Mapping[str, Any] | None = None) -> list[str]:
+    """
+    Registered steps in run order: every step comes after the steps producing its inputs (from the inputs and outputs
+    declared by their StepSpec, as in build_graph). Steps free to run in any order follow WORKFLOW_ORDER, then their name.
+
+    Raises:
+        ValueError: If the steps form a cycle.
+    """
+    registry = REGISTRY if registry is None else registry
+    rank = {name: i for i, name in enumerate(WORKFLOW_ORDER)}
+    producers: dict[str, set[str]] = {}
+    for name, spec in registry.items():
+        for output in spec.outputs:
+            producers.setdefault(output, set()).add(name)
+    sorter: TopologicalSorter[str] = TopologicalSorter(
+        {name: set().union(*(producers.get(i, set()) for i in spec.inputs)) - {name} for name, spec in registry.items()})
+    try:
+        sorter.prepare()
+    except CycleError as e:
+        raise ValueError(f"Workflow steps form a cycle: {e.args[1]}") from e
+    order: list[str] = []
+    ready: list[tuple[int, str]] = []
+    while sorter.is_active():
+        for name in sorter.get_ready():
+            heapq.heappush(ready, (rank.get(name, len(rank)), name))
+        _, name = heapq.heappop(ready)
+        order.append(name)
+        sorter.done(name)
+    return order
+
+
+def run_workflow(user_cfg: Mapping[str, Any], exp_states: Iterable[ExperimentState]) -> list[ExperimentState]:
+    """
+    Run the enabled steps. exp_states may be a lazy stream: the first step consumes it as it comes.
+
+    With the dag engine (runtime ``workflow`` = "dag"), each experiment moves on to its next steps as soon as it is
+    done with the previous one (see fits.workflows.dag). Otherwise (the default "steps"), or if a step has no
+    per-experiment job, the steps run one after the other in step_order(), with their progress bars. Step code is
+    imported only for the enabled steps.
+    """
+    engine = (user_cfg.get("runtime") or {}).get("workflow", "steps")
+    if engine == "dag":
+        graph = build_graph(user_cfg, {name: REGISTRY[name] for name in step_order()})
+        if graph is not None:
+            ctx = CURRENT_CTX.get(None)
+            logger.debug(f"Running workflow graph: {' -> '.join(graph.nodes)}")
+            return run_dag(graph, exp_states,
+                           pools=ctx.worker_pools if ctx is not None else None,
+                           cancel=ctx.cancel if ctx is not None else None)
+    elif engine != "steps":
+        raise ValueError(f"Invalid workflow engine: {engine!r} (expected 'dag' or 'steps')")
+
+    for step_name in step_order():
+        step_spec = REGISTRY[step_name]
         
         step_cfg = user_cfg.get(step_name) or {}
         enabled = step_cfg.get("enabled", False)
@@ -30,4 +83,4 @@ def run_workflow(user_cfg: Mapping[str, Any], exp_states: list[ExperimentState])
         
         exp_states = step_spec.runner(settings, exp_states, step_spec.step_profile, step_spec.output_name)
     
-    return exp_states
\ No newline at end of file
+    return list(exp_states)
\ No newline at end of file
@@ -1,57 +1,617 @@
 from __future__ import annotations
+import contextvars
+import heapq
+from dataclasses import dataclass
+from functools import partial
+import logging
 import os
-from collections.abc import Callable, Iterator, Sequence
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
-from typing import TypeVar
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Generic, Hashable, Protocol, TypeVar
 
-from fits.environment.constant import ExecMode
+from fits.environment.constant import ErrorMode, ExecMode, Schedule
+from fits.workflows.telemetry import Telemetry, Timed, TimedOutcome
+if TYPE_CHECKING:
+    from fits.environment.context import ExecutionContext
+    from fits.workflows.memory import MemoryBudget
 
 
+logger = logging.getLogger(__name__)
+
 T = TypeVar("T")
 R = TypeVar("R")
+T_contra = TypeVar("T_contra", contravariant=True)
+R_co = TypeVar("R_co", covariant=True)
+
+
+class StepTask(Protocol[T_contra, R_co]):
+    """
+    Per-item worker of a step.
+
+    Implementations are module-level (frozen) dataclasses so they can be pickled to worker processes: everything the
+    worker needs travels with the task, including the ExecutionContext (use ``ctx.portable()`` for process mode).
+    """
+
+    ctx: ExecutionContext
+
+    def __call__(self, item: T_contra) -> R_co: ...
 
 
-def _default_workers(mode: ExecMode) -> int:
+def default_workers(mode: ExecMode) -> int:
+    """Number of workers used when a step does not set ``workers``."""
     cpu = os.cpu_count() or 1
     if mode == "thread":
         return min(32, cpu + 4)
-    if mode == "process":
+    if mode in ("process", "distributed"):
         return max(1, cpu)
     return 1
 
 
-def execute(items: Sequence[T], func: Callable[[T], R], *, mode: ExecMode = "serial", workers: int | None = None, ordered: bool = False, ) -> Iterator[R]:
+def _new_pool(mode: ExecMode, workers: int, initializer: Callable[..., object] | None, initargs: tuple[Any, ...], broker: Path | None) -> Executor:
+    if mode == "distributed":
+        if broker is None:
+            raise ValueError("Distributed execution needs a broker path")
+        from fits.workflows.broker import BrokerExecutor
+        return BrokerExecutor(broker, initializer=initializer, initargs=initargs)
+    Exec = ThreadPoolExecutor if mode == "thread" else ProcessPoolExecutor
+    return Exec(max_workers=workers, initializer=initializer, initargs=initargs)
+
+
+@dataclass(frozen=True)
+class ErrorPolicy:
+    """
+    What execute does when a task raises.
+
+    Attributes:
+        mode: fail_fast (stop at the first error), continue (record the failure and go on) or retry (retry the item,
+            then continue if it still fails).
+        retries: Extra attempts per item in retry mode.
+        backoff: Seconds to wait before the first retry, doubled at each following attempt.
+        timeout: Optional per-attempt timeout in seconds; a task running longer (e.g. a hung network read) fails with
+            TimeoutError. The hung call is abandoned in a daemon thread, its worker slot is freed.
+    """
+
+    mode: ErrorMode = "fail_fast"
+    retries: int = 0
+    backoff: float = 1.0
+    timeout: float | None = None
+
+    @classmethod
+    def retry(cls, n: int, backoff: float = 1.0, *, timeout: float | None = None) -> ErrorPolicy:
+        return cls("retry", n, backoff, timeout)
+
+    @property
+    def attempts(self) -> int:
+        return 1 + (self.retries if self.mode == "retry" else 0)
+
+
+@dataclass(frozen=True)
+class Guarded(Generic[T, R]):
+    """Picklable wrapper applying the retries and timeout of an ErrorPolicy inside the worker."""
+
+    func: Callable[[T], R]
+    policy: ErrorPolicy
+
+    def __call__(self, item: T) -> R:
+        attempts = self.policy.attempts
+        for attempt in range(1, attempts + 1):
+            try:
+                return self._run_once(item)
+            except Exception as exc:
+                if attempt == attempts:
+                    raise
+                delay = self.policy.backoff * 2 ** (attempt - 1)
+                logger.warning("Attempt %d/%d failed for %r: %s; retrying in %.1fs", attempt, attempts, item, exc, delay)
+                time.sleep(delay)
+        raise AssertionError("unreachable")
+
+    def _run_once(self, item: T) -> R:
+        if self.policy.timeout is None:
+            return self.func(item)
+
+        outcome: dict[str, Any] = {}
+        def target() -> None:
+            try:
+                outcome["result"] = self.func(item)
+            except BaseException as exc:
+                outcome["error"] = exc
+
+        runner = threading.Thread(target=contextvars.copy_context().run, args=(target,), name="fits-task", daemon=True)
+        runner.start()
+        runner.join(self.policy.timeout)
+        if runner.is_alive():
+            raise TimeoutError(f"Task did not finish within {self.policy.timeout:g}s")
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+
+CANCEL_POLL_INTERVAL = 0.2
+
+
+class CancelToken:
+    """
+    Run-wide cancellation flag (set e.g. by a SIGINT/SIGTERM handler), checked by execute between tasks.
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self.reason: str | None = None
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+
+class _Feeder(Generic[T]):
+    """
+    Pull the items to submit from source, within the in-flight window and the optional memory budget.
+
+    Items that do not fit in the budget wait in a lookahead buffer while the following ones are admitted (with
+    lookahead=1, i.e. ordered execution, nothing overtakes the waiting item).
+    """
+
+    def __init__(self, source: Iterator[T], budget: MemoryBudget | None, cost: Callable[[T], int] | None, lookahead: int, cancel: CancelToken | None = None) -> None:
+        self._source = source
+        self._cancel = cancel
+        self._budget = budget
+        self._cost = cost
+        self._lookahead = lookahead
+        self._deferred: deque[tuple[T, int]] = deque()
+
+    def admit(self, in_flight: int, window: int) -> Iterator[tuple[T, int]]:
+        """
+        Yield (item, reserved bytes) pairs to submit now.
+        """
+        while in_flight < window:
+            if self._cancel is not None and self._cancel.cancelled:
+                return
+            admitted = self._next(force=in_flight == 0)
+            if admitted is None:
+                return
+            in_flight += 1
+            yield admitted
+
+    def release(self, nbytes: int) -> None:
+        if self._budget is not None and nbytes:
+            self._budget.release(nbytes)
+
+    def _next(self, force: bool) -> tuple[T, int] | None:
+        budget = self._budget
+        if budget is None:
+            try:
+                return next(self._source), 0
+            except StopIteration:
+                return None
+
+        for i, (item, nbytes) in enumerate(self._deferred):
+            if budget.try_acquire(nbytes, force=force and i == 0):
+                del self._deferred[i]
+                return item, nbytes
+        while len(self._deferred) < self._lookahead:
+            try:
+                item = next(self._source)
+            except StopIteration:
+                return None
+            nbytes = self._cost(item) if self._cost is not None else 0
+            if budget.try_acquire(nbytes, force=force and not self._deferred):
+                return item, nbytes
+            self._deferred.append((item, nbytes))
+        return None
+
+
+class WorkerPools:
+    """
+    Run-scoped manager of warm worker pools, reused by every execute call (steps, watch cycles) instead of one pool per call.
+
+    Pools are keyed by mode, number of workers and initializer, so worker processes are spawned (and fits_io, numpy
+    and models imported, see warm_cache) once per run. ``shutdown`` (or leaving the ``with`` block) stops them all.
+    """
+
+    def __init__(self) -> None:
+        self._pools: list[tuple[tuple[ExecMode, int, Callable[..., object] | None, Path | None], tuple[Any, ...], Executor]] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def get(self, mode: ExecMode, workers: int, initializer: Callable[..., object] | None = None, initargs: tuple[Any, ...] = (), broker: Path | None = None) -> Executor:
+        """
+        Return the live pool matching the request, creating it on first use.
+        """
+        key = (mode, workers, initializer, broker)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("WorkerPools is shut down.")
+            for pool_key, pool_args, pool in self._pools:
+                if pool_key == key and pool_args == initargs:
+                    return pool
+            pool = _new_pool(mode, workers, initializer, initargs, broker)
+            self._pools.append((key, initargs, pool))
+            logger.debug("Started %s pool with %d workers", mode, workers)
+            return pool
+
+    def shutdown(self, *, wait: bool = True) -> None:
+        """
+        Stop every pool; tasks not started yet are cancelled.
+        """
+        with self._lock:
+            self._closed = True
+            pools, self._pools = self._pools, []
+        for _, _, pool in pools:
+            pool.shutdown(wait=wait, cancel_futures=True)
+
+    def __enter__(self) -> WorkerPools:
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.shutdown()
+
+
+_WARM_CACHE: dict[Hashable, Any] = {}
+_WARM_LOCK = threading.Lock()
+
+
+def warm_cache(key: Hashable, factory: Callable[[], R]) -> R:
     """
-    Execute func over items in serial / threads / processes.
+    Return the object cached under key in this worker process, building it with factory on first use.
+
+    Worker pools live for the whole run (see WorkerPools), so expensive objects (readers, models) built here are reused
+    by every later task of the same process, across steps.
+    """
+    with _WARM_LOCK:
+        if key in _WARM_CACHE:
+            return _WARM_CACHE[key]
+    value = factory()
+    with _WARM_LOCK:
+        return _WARM_CACHE.setdefault(key, value)
+
+
+# ---------------------------------------------------------------------
+# Scheduling
+# ---------------------------------------------------------------------
+
+def schedule_items(items: Iterable[T], schedule: Schedule, weight: Callable[[T], float] | None, *, lookahead: int | None = None) -> Iterator[T]:
+    """
+    Order items according to schedule before they are submitted.
+
+    - input keeps the order of items.
+    - largest_first submits the heaviest items (by weight, e.g. file size) first, so a huge file does not start last
+      and run alone while every other worker is idle. Sequences are sorted as a whole; lazy iterables (e.g. streamed
+      discovery) are reordered within a buffer of lookahead items, so they are still consumed as they come. execute
+      uses its in-flight window as lookahead: the first tasks start once the window could be filled, not after a long
+      stretch of discovery.
+
+    Items of equal weight keep their relative order. weight is called once per item.
+
+    Raises:
+        ValueError: If lookahead is missing (or below 1) to reorder a lazy iterable.
+    """
+    if schedule == "input" or weight is None:
+        yield from items
+        return
+    if schedule != "largest_first":
+        raise ValueError(f"Invalid schedule: {schedule!r}")
+
+    if isinstance(items, Sequence):
+        yield from sorted(items, key=weight, reverse=True)
+        return
+    if lookahead is None or lookahead < 1:
+        raise ValueError(f"lookahead must be at least 1 to schedule a lazy iterable, got {lookahead!r}")
+
+    heap: list[tuple[float, int, T]] = []
+    for index, item in enumerate(items):
+        entry = (-weight(item), index, item)
+        if len(heap) < lookahead:
+            heapq.heappush(heap, entry)
+            continue
+        yield heapq.heappushpop(heap, entry)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+def _in_flight_window(mode: ExecMode, workers: int | None, max_in_flight: int | None) -> int:
+    # Tasks submitted and not yet consumed (see execute)
+    n_workers = 1 if mode == "serial" else default_workers(mode) if workers is None else workers
+    return 2 * n_workers if max_in_flight is None else max_in_flight
+
+
+def _scheduled(items: Iterable[T], schedule: Schedule, weight: Callable[[T], float] | None, ordered: bool, lookahead: int) -> Iterable[T]:
+    if schedule == "input":
+        return items
+    if ordered:
+        logger.warning("Schedule %r ignored: ordered execution keeps the input order", schedule)
+        return items
+    if weight is None:
+        logger.warning("Schedule %r ignored: no weight to order the items by", schedule)
+        return items
+    return schedule_items(items, schedule, weight, lookahead=max(lookahead, 1))
+
+
+def execute(items: Iterable[T], func: Callable[[T], R], *, mode: ExecMode = "serial", workers: int | None = None, ordered: bool = False, max_in_flight: int | None = None, policy: ErrorPolicy | None = None, on_failure: Callable[[T, Exception], R] | None = None, budget: MemoryBudget | None = None, cost: Callable[[T], int] | None = None, pools: WorkerPools | None = None, cancel: CancelToken | None = None, schedule: Schedule = "input", weight: Callable[[T], float] | None = None, initializer: Callable[..., object] | None = None, initargs: tuple[Any, ...] = (), broker: Path | None = None, telemetry: Telemetry[T, R] | None = None) -> Iterator[R]:
+    """
+    Execute func over items in serial / threads / processes, or on the workers of a broker (distributed).
 
     - ordered=False yields results as tasks complete (best for progress).
     - ordered=True yields results in the same order as `items`.
-    - Fail-fast: the first exception raised by any task is propagated.
+    - Errors follow policy (default fail-fast: the first exception raised by any task is propagated). With continue or
+      retry, a failed item is logged and replaced by on_failure(item, exc) in the results (or dropped if on_failure is
+      None); the other items keep running at full throughput.
+    - items may be a lazy iterable (e.g. streamed discovery): tasks are submitted while it is consumed.
+    - At most max_in_flight tasks (default: 2 x workers) are submitted and not yet consumed: a new item is pulled from
+      items only when a result is handed to the consumer, so memory stays flat however many items are queued.
+    - With a memory budget, each item is admitted only when its estimated footprint cost(item) (bytes) fits in it.
+      In unordered mode, items that do not fit wait while the following smaller ones go through.
+    - In process mode, func and items must be picklable (see StepTask); initializer(*initargs) runs once in each worker.
+    - In distributed mode, tasks go through the broker database (see fits.workflows.broker) to the ``fits worker``
+      processes of any node sharing the storage; func, items and results must be picklable as in process mode, and
+      workers is the number of remote worker slots used to size the in-flight window.
+    - With pools, the workers come from that WorkerPools and stay alive after the call; otherwise a pool is created and
+      shut down for this call.
+    - Once cancel is cancelled, execute drains: nothing new is submitted, tasks not started are cancelled, running
+      tasks finish (or time out, see policy) and their results are still yielded.
+    - schedule sets the submission order (see schedule_items); largest_first weighs items with weight, or with cost if
+      weight is None. It is ignored with ordered=True, which keeps the input order.
+    - With telemetry, each task is timed in its worker (retries included) and recorded when its result is collected.
     """
+    policy = policy or ErrorPolicy()
+    items = _scheduled(items, schedule, weight or cost, ordered, _in_flight_window(mode, workers, max_in_flight))
+    if policy.timeout is not None or policy.attempts > 1:
+        func = Guarded(func, policy)
+    task: Callable[[T], Any] = func if telemetry is None else Timed(func)
+    submitted: dict[Future[Any], float] = {}
+
+    def collect(fut: Future[Any], item: T) -> R:
+        # Result of a finished task, recorded in telemetry; raises the task error
+        if telemetry is None:
+            return fut.result()
+        submit = submitted.pop(fut)
+        try:
+            outcome = fut.result()
+        except Exception as e:
+            telemetry.record(item, submit, None, e)
+            raise
+        return _unwrap(telemetry, item, submit, outcome)
+
+    def failed(item: T, exc: Exception) -> Iterator[R]:
+        logger.error("Task failed for item %r: %s", item, exc)
+        if on_failure is not None:
+            yield on_failure(item, exc)
+
     if mode == "serial":
+        if telemetry is not None:
+            telemetry.started(mode, 1)
         for it in items:
-            yield func(it)
+            if cancel is not None and cancel.cancelled:
+                logger.warning("Execution cancelled (%s): remaining items were not started", cancel.reason)
+                return
+            try:
+                result = func(it) if telemetry is None else _unwrap(telemetry, it, time.time(), task(it))
+            except Exception as e:
+                if policy.mode == "fail_fast":
+                    raise
+                yield from failed(it, e)
+                continue
+            yield result
         return
 
-    if mode not in ("thread", "process"):
+    if mode not in ("thread", "process", "distributed"):
         raise ValueError(f"Invalid mode: {mode!r}")
 
-    n_workers = _default_workers(mode) if workers is None else workers
-    Exec = ThreadPoolExecutor if mode == "thread" else ProcessPoolExecutor
+    n_workers = default_workers(mode) if workers is None else workers
+    window = _in_flight_window(mode, workers, max_in_flight)
+    if window < 1:
+        raise ValueError(f"max_in_flight must be at least 1, got {max_in_flight!r}")
+
+    feeder = _Feeder(iter(items), budget, cost, lookahead=window if not ordered else 1, cancel=cancel)
+    # Poll so a cancellation (set by a signal handler) is noticed while waiting on long tasks
+    poll = CANCEL_POLL_INTERVAL if cancel is not None else None
 
-    with Exec(max_workers=n_workers) as ex:
+    def drain() -> None:
+        dropped = 0
+        kept: list[tuple[Future[R], T, int]] = []
+        for fut, item, nbytes in queue:
+            if fut.cancel():
+                feeder.release(nbytes)
+                dropped += 1
+            else:
+                kept.append((fut, item, nbytes))
+        queue.clear()
+        queue.extend(kept)
+        for fut in list(pending):
+            if fut.cancel():
+                feeder.release(pending.pop(fut)[1])
+                dropped += 1
+        running = len(queue) + len(pending)
+        logger.warning(f"Execution cancelled ({cancel.reason if cancel else ''}): {dropped} queued task(s) dropped, waiting for {running} running task(s); remaining items were not started")
+
+    queue: deque[tuple[Future[R], T, int]] = deque()
+    pending: dict[Future[R], tuple[T, int]] = {}
+    draining = False
+    ex = pools.get(mode, n_workers, initializer, initargs, broker) if pools is not None else _new_pool(mode, n_workers, initializer, initargs, broker)
+    if telemetry is not None:
+        telemetry.started(mode, n_workers)
+
+    def submit(it: T) -> Future[Any]:
+        now = time.time()
+        fut = ex.submit(task, it)
+        if telemetry is not None:
+            submitted[fut] = now
+        return fut
+    try:
         if ordered:
-            futures = [ex.submit(func, it) for it in items]
-            for fut in futures:
-                yield fut.result()
-        else:
-            future_to_item = {ex.submit(func, it): it for it in items}
-            for fut in as_completed(future_to_item):
+            def refill_queue() -> None:
+                queue.extend((submit(it), it, nbytes) for it, nbytes in feeder.admit(len(queue), window))
+
+            refill_queue()
+            while queue:
+                fut, item, nbytes = queue[0]
+                if not wait([fut], timeout=poll).done:
+                    if not draining and cancel is not None and cancel.cancelled:
+                        draining = True
+                        drain()
+                    continue
+                queue.popleft()
+                feeder.release(nbytes)
                 try:
-                    yield fut.result()
+                    result = collect(fut, item)
                 except Exception as e:
-                    item = future_to_item[fut]
-                    raise RuntimeError(f"Task failed for item: {item!r}") from e
+                    if policy.mode == "fail_fast":
+                        raise
+                    refill_queue()
+                    yield from failed(item, e)
+                    continue
+                refill_queue()
+                yield result
+        else:
+            def refill_pending() -> None:
+                pending.update((submit(it), (it, nbytes)) for it, nbytes in feeder.admit(len(pending), window))
+
+            refill_pending()
+            while pending:
+                done, _ = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+                if not draining and cancel is not None and cancel.cancelled:
+                    draining = True
+                    drain()
+                for fut in done:
+                    item, nbytes = pending.pop(fut)
+                    feeder.release(nbytes)
+                    # refill before handing the result over, so workers keep busy while the consumer works
+                    refill_pending()
+                    try:
+                        result = collect(fut, item)
+                    except Exception as e:
+                        if policy.mode == "fail_fast":
+                            raise RuntimeError(f"Task failed for item: {item!r}") from e
+                        yield from failed(item, e)
+                        continue
+                    yield result
+    finally:
+        # On early exit (fail-fast error, consumer stopped), drop the tasks not started yet and give back their memory.
+        # Running tasks keep theirs until they finish.
+        for fut, nbytes in [*((fut, nbytes) for fut, _, nbytes in queue), *((fut, nbytes) for fut, (_, nbytes) in pending.items())]:
+            if fut.cancel():
+                feeder.release(nbytes)
+            elif nbytes:
+                fut.add_done_callback(lambda _, nbytes=nbytes: feeder.release(nbytes))
+        if pools is None:
+            ex.shutdown(wait=True)
+
+
+def _unwrap(telemetry: Telemetry[T, R], item: T, submit: float, outcome: TimedOutcome) -> R:
+    telemetry.record(item, submit, outcome)
+    if outcome.error is not None:
+        raise outcome.error
+    return outcome.value
+
+
+# ---------------------------------------------------------------------
+# Staged execution
+# ---------------------------------------------------------------------
+
+@dataclass(frozen=True)
+class Stage:
+    """
+    One stage of execute_staged: func runs on its own pool, fed by the results of the previous stage.
+
+    Attributes:
+        name: Stage name (for logs).
+        func: Per-item function; must be picklable in process mode.
+        mode: Execution mode of the stage pool.
+        workers: Number of workers of the stage pool.
+        budget: Optional memory budget admitting the items of this stage.
+        cost: Estimated footprint of an item of this stage, in bytes (used with budget).
+        initializer: Optional initializer of the stage workers.
+        initargs: Arguments of initializer.
+        broker: Broker of the stage in distributed mode.
+        telemetry: Optional instrumentation of the stage.
+    """
+
+    name: str
+    func: Callable[[Any], Any]
+    mode: ExecMode = "thread"
+    workers: int | None = None
+    budget: MemoryBudget | None = None
+    cost: Callable[[Any], int] | None = None
+    initializer: Callable[..., object] | None = None
+    initargs: tuple[Any, ...] = ()
+    broker: Path | None = None
+    telemetry: Telemetry[Any, Any] | None = None
+
+
+@dataclass(frozen=True)
+class _StageFailure:
+    stage: str
+    item: Any
+    error: Exception
+
+
+@dataclass(frozen=True)
+class _SkipFailures:
+    """Picklable wrapper passing failures of earlier stages through without calling func."""
+
+    func: Callable[[Any], Any]
+
+    def __call__(self, item: Any) -> Any:
+        if isinstance(item, _StageFailure):
+            return item
+        return self.func(item)
+
+
+def execute_staged(items: Iterable[Any], stages: Sequence[Stage], *, ordered: bool = False, max_in_flight: int | None = None, policy: ErrorPolicy | None = None, on_failure: Callable[[Any, Exception], R] | None = None, pools: WorkerPools | None = None, cancel: CancelToken | None = None, schedule: Schedule = "input", weight: Callable[[Any], float] | None = None) -> Iterator[Any]:
+    """
+    Run items through a pipeline of stages, each on its own pool (e.g. I/O threads, then CPU processes).
+
+    Stages are chained lazily with the bounded window of execute (max_in_flight per stage), which acts as the bounded
+    queue between two stages: stage n+1 works on item i while stage n already works on the next items, so the disk and
+    the CPU are busy together and throughput tends to the slowest stage rather than the sum of the stages.
+
+    Errors follow policy in every stage. With continue or retry, an item failing in any stage skips the next stages and
+    is replaced by on_failure(input of the failed stage, exc) in the results.
+
+    schedule and weight set the order in which items enter the first stage (see execute).
+    """
+    policy = policy or ErrorPolicy()
+    lookahead = _in_flight_window(stages[0].mode, stages[0].workers, max_in_flight) if stages else 1
+    stream: Iterator[Any] = iter(_scheduled(items, schedule, weight, ordered, lookahead))
+    for stage in stages:
+        stream = execute(stream, _SkipFailures(stage.func),
+                         mode=stage.mode,
+                         workers=stage.workers,
+                         ordered=ordered,
+                         max_in_flight=max_in_flight,
+                         policy=policy,
+                         on_failure=partial(_StageFailure, stage.name),
+                         budget=stage.budget,
+                         cost=_skip_cost(stage.cost) if stage.cost is not None else None,
+                         pools=pools,
+                         cancel=cancel,
+                         initializer=stage.initializer,
+                         initargs=stage.initargs,
+                         broker=stage.broker,
+                         telemetry=stage.telemetry)
+
+    for result in stream:
+        if isinstance(result, _StageFailure):
+            logger.debug("Item failed in stage '%s': %s", result.stage, result.error)
+            if on_failure is not None:
+                yield on_failure(result.item, result.error)
+            continue
+        yield result
+
+
+def _skip_cost(cost: Callable[[Any], int]) -> Callable[[Any], int]:
+    def stage_cost(item: Any) -> int:
+        return 0 if isinstance(item, _StageFailure) else cost(item)
+    return stage_cost
 
 if __name__ == '__main__':
     print(os.cpu_count())
\ No newline at end of file
@@ -0,0 +1,80 @@
+from __future__ import annotations
+import logging
+import os
+from pathlib import Path
+import re
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d*)?)\s*([kmgt]?)(?:i?b)?\s*$", re.IGNORECASE)
+_UNITS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+
+
+def parse_memory_size(value: str | int) -> int:
+    """
+    Parse a memory size such as ``"48GB"``, ``"512 MiB"`` or ``1073741824`` into bytes (units are powers of 1024).
+    """
+    if isinstance(value, int):
+        return value
+    match = _SIZE_RE.match(value)
+    if match is None:
+        raise ValueError(f"Invalid memory size: {value!r}")
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[unit.lower()])
+
+
+class MemoryBudget:
+    """
+    Run-wide RAM budget used by execute to admit tasks by their estimated footprint.
+
+    A task is admitted when its estimate fits in what is left of the budget. execute forces the admission when it has
+    nothing else in flight, so a task larger than the whole budget runs alone instead of waiting forever. The budget is
+    shared between threads (and steps).
+
+    Args:
+        limit: Budget in bytes.
+    """
+
+    def __init__(self, limit: int) -> None:
+        if limit <= 0:
+            raise ValueError(f"Memory budget must be positive, got {limit}")
+        self.limit = limit
+        self.in_use = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_setting(cls, value: str | int | None) -> MemoryBudget | None:
+        """
+        Build a budget from a runtime setting (e.g. ``"48GB"``), or None if unset.
+        """
+        if value is None or (isinstance(value, str) and value.strip().lower() in ("", "none")):
+            return None
+        return cls(parse_memory_size(value))
+
+    def try_acquire(self, nbytes: int, *, force: bool = False) -> bool:
+        """
+        Reserve nbytes if they fit (or unconditionally with force). Returns True if reserved.
+        """
+        with self._lock:
+            if not force and self.in_use + nbytes > self.limit:
+                return False
+            if nbytes > self.limit:
+                logger.warning(f"Task estimated at {nbytes / (1 << 30):.1f} GiB exceeds the memory budget of {self.limit / (1 << 30):.1f} GiB; running it alone")
+            self.in_use += nbytes
+            return True
+
+    def release(self, nbytes: int) -> None:
+        with self._lock:
+            self.in_use = max(0, self.in_use - nbytes)
+
+
+def file_size_footprint(path: Path, factor: float) -> int:
+    """
+    Estimate the memory needed to process a file as factor x its size on disk (0 if it is missing).
+    """
+    try:
+        return int(os.stat(path).st_size * factor)
+    except OSError:
+        return 0
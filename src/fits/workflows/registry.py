@@ -1,39 +1,138 @@
 from dataclasses import dataclass
-from typing import Any, Callable, Generic, Mapping, TypeVar
+from functools import lru_cache
+from importlib import import_module
+from importlib.metadata import entry_points
+import logging
+from typing import TYPE_CHECKING, Any, Callable, Generic, Iterable, Mapping, TypeVar
 
-from fits.environment.constant import FITS_ARRAY_NAME, DIST_IO, STEP_CONVERT
+from fits.environment.constant import FITS_ARRAY_NAME, DIST_IO, STEP_CONVERT, STEP_ENTRY_POINT_GROUP
 from fits.environment.state import ExperimentState
-from fits.settings.models import ConvertSettings, SettingsModel
-from fits.workflows.tasks.convert import run_convert
 from fits.workflows.provenance import StepProfile
+if TYPE_CHECKING:
+    from fits.settings.models import SettingsModel
+    from fits.workflows.dag import StepJob
 
 
-FitsSettings = TypeVar("FitsSettings", bound=SettingsModel)
+logger = logging.getLogger(__name__)
+
+FitsSettings = TypeVar("FitsSettings", bound="SettingsModel")
+
+Runner = Callable[[FitsSettings, Iterable[ExperimentState], StepProfile, str], list[ExperimentState]]
+JobFactory = Callable[[FitsSettings, StepProfile, str], "StepJob | None"]
+
+
+@lru_cache(maxsize=None)
+def load_ref(ref: str) -> Any:
+    """
+    Import the object named by a ``"package.module:attribute"`` reference.
+
+    Raises:
+        ValueError: If ref is not of that form.
+        ImportError: If the module or the attribute cannot be imported.
+    """
+    module_name, sep, attr = ref.partition(":")
+    if not sep or not module_name or not attr:
+        raise ValueError(f"Invalid reference {ref!r} (expected 'package.module:attribute')")
+    obj: Any = import_module(module_name)
+    try:
+        for part in attr.split("."):
+            obj = getattr(obj, part)
+    except AttributeError as e:
+        raise ImportError(f"Cannot import {attr!r} from {module_name!r}") from e
+    return obj
 
-Runner = Callable[[FitsSettings, list[ExperimentState], StepProfile, str], list[ExperimentState]]
 
 @dataclass(frozen=True)
 class StepSpec(Generic[FitsSettings]):
+    """
+    Lightweight description of a step. The settings model, runner and job factory are ``"module:attribute"``
+    references, imported on first use only, so listing the steps never imports their (heavy) dependencies.
+
+    Steps are registered under the ``fits.steps`` entry point group, each entry point naming a StepSpec, e.g. in the
+    pyproject.toml of a lab package::
+
+        [project.entry-points."fits.steps"]
+        segment = "lab_steps.specs:SEGMENT"
+
+    Attributes:
+        name: Step name, also the section of the step in the user settings.
+        settings_ref: Reference to the SettingsModel of the step parameters.
+        output_name: Name of the artifact produced by the step.
+        runner_ref: Reference to the whole-step runner (see Runner).
+        distribution: Distribution implementing the step (recorded in provenance).
+        inputs: Artifacts consumed by the step (see fits.workflows.dag.build_graph).
+        job_ref: Optional reference to the per-experiment job factory used by the DAG engine.
+    """
+
     name: str
-    settings_model: type[FitsSettings]
+    settings_ref: str
     output_name: str
-    runner: Runner[FitsSettings]
+    runner_ref: str
     distribution: str
-    
+    inputs: frozenset[str] = frozenset()
+    job_ref: str | None = None
+
+    @property
+    def settings_model(self) -> type[FitsSettings]:
+        return load_ref(self.settings_ref)
+
+    @property
+    def runner(self) -> Runner[FitsSettings]:
+        return load_ref(self.runner_ref)
+
+    @property
+    def job(self) -> JobFactory[FitsSettings] | None:
+        return load_ref(self.job_ref) if self.job_ref is not None else None
+
+    @property
+    def outputs(self) -> frozenset[str]:
+        """Artifacts produced by the step; steps whose inputs include one of them run after it (see build_graph)."""
+        return frozenset({self.output_name})
+
     @property
     def step_profile(self) -> StepProfile:
         return StepProfile(self.distribution, self.name)
-    
-    def model_validate(self, params: Mapping[str, Any]) -> SettingsModel:
+
+    def model_validate(self, params: Mapping[str, Any]) -> "SettingsModel":
         """Convenience method to validate settings using the associated settings model."""
         return self.settings_model.model_validate(params)
-    
-
-REGISTRY: dict[str, StepSpec[Any]] = {
-    STEP_CONVERT: StepSpec(
-                    name=STEP_CONVERT,
-                    settings_model=ConvertSettings,
-                    output_name=FITS_ARRAY_NAME,
-                    runner=run_convert,
-                    distribution=DIST_IO)
-    ,}
\ No newline at end of file
+
+
+CONVERT_STEP: StepSpec[Any] = StepSpec(
+    name=STEP_CONVERT,
+    settings_ref="fits.settings.models:ConvertSettings",
+    output_name=FITS_ARRAY_NAME,
+    runner_ref="fits.workflows.tasks.convert:run_convert",
+    distribution=DIST_IO,
+    inputs=frozenset(),  # raw acquisition files
+    job_ref="fits.workflows.tasks.convert:convert_job")
+
+BUILTIN_STEPS: dict[str, StepSpec[Any]] = {CONVERT_STEP.name: CONVERT_STEP}
+
+
+def load_registry(group: str = STEP_ENTRY_POINT_GROUP) -> dict[str, StepSpec[Any]]:
+    """
+    Built-in steps plus the steps registered under the entry point group by installed packages.
+
+    Only the modules holding the StepSpec stubs are imported. Invalid entry points and entry points reusing the name
+    of another step are skipped with a warning.
+    """
+    registry = dict(BUILTIN_STEPS)
+    for ep in entry_points(group=group):
+        try:
+            spec = ep.load()
+        except Exception as e:
+            logger.warning(f"Cannot load step plugin {ep.name!r} ({ep.value}): {e}")
+            continue
+        if not isinstance(spec, StepSpec):
+            logger.warning(f"Ignoring step plugin {ep.name!r}: {ep.value} is not a StepSpec")
+            continue
+        current = registry.get(spec.name)
+        if current is not None and current != spec:
+            logger.warning(f"Ignoring step plugin {ep.name!r}: a step named {spec.name!r} is already registered")
+            continue
+        registry[spec.name] = spec
+    return registry
+
+
+REGISTRY: dict[str, StepSpec[Any]] = load_registry()
@@ -1,62 +1,440 @@
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass
 import logging
+from pathlib import Path
+import threading
+from typing import Any, NamedTuple
 
 from fits_io.client import FitsIO
 from progress_bar import pbar
 
+from fits.environment.fingerprint import SourceFingerprint, compute_fingerprint
 from fits.environment.state import ExperimentState
-from fits.environment.runtime import get_ctx
+from fits.environment.context import ExecutionContext
+from fits.environment.store import save_states
+from fits.environment.runtime import get_ctx, init_worker_ctx, use_ctx
 from fits.environment.constant import ExecMode, FitsName
-from fits.workflows.executors import execute
+from fits.workflows.dag import StepJob
+from fits.workflows.executors import ErrorPolicy, Stage, execute, execute_staged
+from fits.workflows.cache import CACHE_USER_NAME, OutputCache, distribution_version
+from fits.workflows.memory import file_size_footprint
 from fits.workflows.payload import build_payload, hash_payload
 from fits.workflows.provenance import StepProfile
+from fits.workflows.telemetry import Telemetry, write_telemetry
 from fits.settings.models import ConvertSettings
 
 
 logger = logging.getLogger(__name__)
 
+READ_AHEAD_BLOCK_SIZE = 8 << 20  # 8 MiB
+# Bytes read ahead from the start of each source in read-ahead mode. Reading a whole multi-GB file would evict it (and
+# the sources of the running conversions) from the page cache before the conversion gets to it.
+READ_AHEAD_LIMIT = 512 << 20
+
+# States sharing a raw file (the series of a multi-series file), converted together: the conversion writes all of them
+SourceGroup = tuple[ExperimentState, ...]
+
+
+class ConvertOutcome(NamedTuple):
+    """
+    Result of the conversion of one raw file.
+
+    Attributes:
+        states: States produced for its series (the input states if it was skipped).
+        changed: False when the conversion was skipped because the experiment was up to date.
+        error: Error message if the conversion failed (states are then marked failed).
+    """
+
+    states: list[ExperimentState]
+    changed: bool
+    error: str | None = None
+
+
+class PreparedConversion(NamedTuple):
+    """
+    Raw file that needs converting (with the states of its series), the fingerprint of the file taken before it is
+    read and its output cache key, once resolved by the read-ahead stage.
+    """
+
+    states: SourceGroup
+    fingerprint: SourceFingerprint
+    cache_key: str | None = None
+
+    @property
+    def state(self) -> ExperimentState:
+        return self.states[0]
+
+
+@dataclass(frozen=True)
+class ConvertTask:
+    """
+    Conversion of one raw file, picklable so it can run in a worker process.
+
+    Tasks take the states of all the series of the file (see _by_source): the file is checked and converted once, and
+    its new states replace all of them. When ``persist`` is False (process mode), states are saved by the parent process instead of the worker.
+    Calling the task runs the whole conversion; ``prefetch`` and ``convert`` split it in two for the read-ahead mode.
+    """
+
+    ctx: ExecutionContext
+    payload: Mapping[str, Any]
+    settings_hash: str
+    step_name: str
+    overwrite: bool
+    output_name: FitsName
+    persist: bool = True
+
+    def __call__(self, group: SourceGroup) -> ConvertOutcome:
+        with use_ctx(self.ctx):
+            return self._finish(self._prepare(group))
+
+    def prefetch(self, group: SourceGroup) -> PreparedConversion | ConvertOutcome:
+        """
+        First stage of the read-ahead mode: decide whether the experiment needs converting, resolve its output cache key
+        and read the start of its source ahead, unless its outputs are cached.
+        """
+        with use_ctx(self.ctx):
+            prepared = self._prepare(group)
+            if not isinstance(prepared, PreparedConversion):
+                return prepared
+            cache = self.ctx.output_cache
+            if cache is not None:
+                prepared = prepared._replace(cache_key=self._cache_key(cache, prepared.state, prepared.fingerprint))
+                if prepared.cache_key is not None and cache.has(prepared.cache_key):
+                    return prepared
+            _read_ahead(prepared.state.original_image)
+            return prepared
+
+    def convert(self, prepared: PreparedConversion | ConvertOutcome) -> ConvertOutcome:
+        """
+        Second stage of the read-ahead mode: convert a prefetched experiment (skipped experiments pass through).
+        """
+        with use_ctx(self.ctx):
+            return self._finish(prepared)
+
+    def _prepare(self, group: SourceGroup) -> PreparedConversion | ConvertOutcome:
+        logger.debug("Conversion will be executed with parameters: %s", self.payload)
+        st = group[0]
+        stat_cache = self.ctx.stat_cache
+
+        # Check if needed: each series, then the source once for all of them (only if they are all up to date)
+        needed = any(m.needs_run(self.step_name, self.settings_hash, self.overwrite, required_output=self.output_name, stat_cache=stat_cache, check_source=False) for m in group)
+        if not needed:
+            fingerprints = {m.source_fingerprint for m in group if m.source_fingerprint is not None}
+            needed = any(fp.changed(st.original_image, stat_cache) for fp in fingerprints)
+            if needed:
+                logger.info("Source %s changed since it was processed; %s will run again.", st.original_image, self.step_name)
+        if not needed:
+            logger.debug("Skipping conversion for %s as it is up to date.", st.original_image)
+            return ConvertOutcome(list(group), False)
+        
+        # Fingerprint before reading, so a source modified during conversion is detected on the next run
+        return PreparedConversion(group, compute_fingerprint(st.original_image))
+
+    def _finish(self, prepared: PreparedConversion | ConvertOutcome) -> ConvertOutcome:
+        if isinstance(prepared, ConvertOutcome):
+            return prepared
+        ctx = self.ctx
+        st, fingerprint, key = prepared.state, prepared.fingerprint, prepared.cache_key
+        cache = ctx.output_cache
+        if cache is not None and key is None:
+            key = self._cache_key(cache, st, fingerprint)
+        save_paths = _cache_get(cache, key, st.original_image.parent)
+        if save_paths is not None:
+            logger.info("Reused cached conversion for %s", st.original_image)
+        else:
+            payload = self.payload if key is None else {**self.payload, "user_name": CACHE_USER_NAME}
+            reader = FitsIO.from_path(st.original_image, channel_labels=self.payload.get("channel_labels", None),)
+            save_paths = reader.convert_to_fits(**payload)
+            _cache_put(cache, key, st.original_image.parent, save_paths)
+        if ctx.stat_cache is not None:
+            for p in save_paths:
+                ctx.stat_cache.invalidate(p)
+        logger.info("Conversion completed for %s", st.original_image)
+        logger.debug("Saved FITS files at: %s", save_paths)
+
+        out_states = [st.with_image(image_path=p, last_step=self.step_name,)
+                        .with_settings_hash(self.step_name, self.settings_hash)
+                        .with_fingerprint(fingerprint)
+                        .mark_done(self.step_name)
+                                    for p in save_paths]
+        for out_st in out_states:
+            logger.debug("Produced new ExperimentState: %s", out_st)
+        if self.persist:
+            save_states(out_states, ctx.state_store)
+        return ConvertOutcome(out_states, True)
+
+    def _cache_key(self, cache: OutputCache, st: ExperimentState, fingerprint: SourceFingerprint) -> str | None:
+        # The user is left out: cached outputs are converted under CACHE_USER_NAME and shared by all users
+        try:
+            digest = cache.source_digest(st.original_image, fingerprint)
+        except OSError as e:
+            logger.warning(f"Cannot hash {st.original_image} for the output cache: {e}")
+            return None
+        return OutputCache.key(digest, self.step_name, self.settings_hash, distribution_version(self.payload.get("distribution")))
+
+    def failed(self, item: SourceGroup | PreparedConversion, err: Exception) -> ConvertOutcome:
+        """
+        Outcome of a raw file whose conversion raised: its states are marked failed (and persisted by the caller).
+        """
+        group = item.states if isinstance(item, PreparedConversion) else item
+        message = f"{type(err).__name__}: {err}"
+        return ConvertOutcome([st.mark_failed(self.step_name, message) for st in group], True, error=message)
+
+
+def _cache_get(cache: OutputCache | None, key: str | None, base_dir: Path) -> list[Path] | None:
+    if cache is None or key is None:
+        return None
+    try:
+        return cache.get(key, base_dir)
+    except OSError as e:
+        logger.warning(f"Output cache lookup failed, converting instead: {e}")
+        return None
+
+
+def _cache_put(cache: OutputCache | None, key: str | None, base_dir: Path, save_paths: Sequence[Path]) -> None:
+    if cache is None or key is None:
+        return
+    try:
+        cache.put(key, base_dir, save_paths)
+    except OSError as e:
+        logger.warning(f"Could not store outputs of {base_dir} in the output cache: {e}")
+
+
+def _read_ahead(path: Path, limit: int = READ_AHEAD_LIMIT, block_size: int = READ_AHEAD_BLOCK_SIZE) -> None:
+    """
+    Read the start of a file (at most limit bytes) so the conversion finds it in the page cache instead of waiting on
+    the disk or the network. The rest of a larger file is read by the conversion itself.
+    """
+    buffer = bytearray(min(block_size, limit))
+    remaining = limit
+    with open(path, "rb", buffering=0) as handle:
+        while remaining > 0:
+            n = handle.readinto(buffer)
+            if not n:
+                break
+            remaining -= n
+
+
+def _by_source(states: Iterable[ExperimentState]) -> Iterator[SourceGroup]:
+    """
+    Group consecutive states of the same raw file. Discovery and the state stores yield the series of a file together
+    (their workdirs sort next to each other), so a multi-series file is checked and converted once per step.
+    """
+    group: list[ExperimentState] = []
+    for st in states:
+        if group and st.original_image_rel != group[0].original_image_rel:
+            yield tuple(group)
+            group = []
+        group.append(st)
+    if group:
+        yield tuple(group)
+
+
+def _source_size(group: SourceGroup) -> int:
+    """Scheduling weight of a raw file: its size (conversion time grows with it)."""
+    return file_size_footprint(group[0].original_image, 1.0)
+
+
+def _source_of(item: SourceGroup | PreparedConversion | ConvertOutcome) -> ExperimentState:
+    if isinstance(item, ConvertOutcome):
+        return item.states[0]
+    return item.state if isinstance(item, PreparedConversion) else item[0]
+
+
+def _label(item: SourceGroup | PreparedConversion | ConvertOutcome) -> str:
+    return str(_source_of(item).original_image)
+
+
+def _input_size(item: SourceGroup | PreparedConversion | ConvertOutcome) -> int:
+    # Up-to-date experiments pass through without reading their source
+    return 0 if isinstance(item, ConvertOutcome) else file_size_footprint(_source_of(item).original_image, 1.0)
+
+
+def _output_size(result: PreparedConversion | ConvertOutcome) -> int:
+    if not isinstance(result, ConvertOutcome) or not result.changed or result.error is not None:
+        return 0
+    return sum(file_size_footprint(st.image, 1.0) for st in result.states if st.image is not None)
+
+
+class _Intake:
+    """
+    Iterator over the raw files of a step remembering those handed to the executor, to tell on cancellation which
+    experiments were never started.
+    """
+
+    def __init__(self, states: Iterable[ExperimentState]) -> None:
+        self._source = _by_source(states)
+        self._pulled: list[SourceGroup] = []
+
+    def __iter__(self) -> Iterator[SourceGroup]:
+        return self
+
+    def __next__(self) -> SourceGroup:
+        group = next(self._source)
+        self._pulled.append(group)
+        return group
+
+    def not_started(self, started: set[Path]) -> list[ExperimentState]:
+        """Experiments without an outcome: pulled but dropped from the queue, or never pulled."""
+        return [st for group in self._pulled for st in group if st.original_image not in started] + [st for group in self._source for st in group]
+
+
+def _record(results: Iterable[ConvertOutcome], ctx: ExecutionContext, step_name: str, *, in_parent: bool, telemetry: Sequence[Telemetry[Any, Any]] = (), intake: _Intake | None = None) -> Iterator[list[ExperimentState]]:
+    """
+    Pass results through, then make every state saved during the step durable, summarize the failures and write the
+    telemetry of the step (if enabled). On cancellation, the experiments of intake that were not started are listed.
+
+    Failed states are saved here, as well as new states when in_parent (the worker processes could not save them).
+    """
+    failures: list[tuple[ExperimentState, str]] = []
+    started: set[Path] = set()
+    n_results = 0
+    for outcome in results:
+        n_results += 1
+        started.update(st.original_image for st in outcome.states)
+        if outcome.error is not None:
+            failures.extend((st, outcome.error) for st in outcome.states)
+        if outcome.changed and (in_parent or outcome.error is not None):
+            if ctx.stat_cache is not None:
+                for out_st in outcome.states:
+                    if out_st.image is not None:
+                        ctx.stat_cache.invalidate(out_st.image)
+            save_states(outcome.states, ctx.state_store)
+        yield outcome.states
+    if ctx.state_store is not None:
+        ctx.state_store.flush()
+    if telemetry and ctx.telemetry_dir is not None:
+        write_telemetry(ctx.telemetry_dir, step_name, telemetry)
+    if ctx.cancel is not None and ctx.cancel.cancelled:
+        not_started = intake.not_started(started) if intake is not None else []
+        lines = "".join(f"\n  - {st.original_image}" for st in not_started)
+        logger.warning(f"Step '{step_name}' interrupted after {n_results} experiment(s); their states are saved and the next run resumes with "
+                       f"the {len(not_started)} experiment(s) not started:{lines}")
+    _log_failures(step_name, failures)
+
+
+def _log_failures(step_name: str, failures: Sequence[tuple[ExperimentState, str]]) -> None:
+    if failures:
+        lines = "".join(f"\n  - {st.original_image}: {error}" for st, error in failures)
+        logger.warning(f"Step '{step_name}' failed for {len(failures)} experiment(s):{lines}")
+
 
 @pbar(desc="Convert")
-def run_convert(settings: ConvertSettings, exp_state: list[ExperimentState], step_profile: StepProfile, output_name: FitsName) -> Iterator[list[ExperimentState]]:
+def run_convert(settings: ConvertSettings, exp_state: Iterable[ExperimentState], step_profile: StepProfile, output_name: FitsName) -> Iterator[list[ExperimentState]]:
     # Get the current execution context
     ctx = get_ctx()
     
     # Prepare input and payload
     payload = build_payload(settings, step_profile, ctx.user_name, output_name)
     settings_hash = hash_payload(payload)
-    channel_labels = payload.get("channel_labels", None)
     logger.debug(f"Payload for conversion: {payload}")
     
     # Prepare the executor
     exec_mode: ExecMode = settings.execution
     workers: int | None = settings.workers
     ordered: bool = settings.ordered_execution
-    logger.debug(f"Executing conversion with mode: {exec_mode} and workers: {workers} in ordered mode: {ordered}")
+    max_in_flight: int | None = settings.max_in_flight
+    policy = ErrorPolicy(settings.on_error, settings.retries, settings.retry_backoff, settings.task_timeout)
+    budget = ctx.memory_budget
+    memory_factor = settings.memory_factor
+    def footprint(item: SourceGroup | PreparedConversion | ConvertOutcome) -> int:
+        if isinstance(item, ConvertOutcome):
+            return 0  # up to date, passing through
+        return file_size_footprint(_source_of(item).original_image, memory_factor)
+    cost = footprint if budget is not None else None
+    weight = _source_size if settings.schedule != "input" else None
+    telemetry: list[Telemetry[Any, ConvertOutcome]] = []
+    def new_telemetry(name: str) -> Telemetry[Any, Any] | None:
+        if ctx.telemetry_dir is None:
+            return None
+        telemetry.append(Telemetry(name, bytes_in=_input_size, bytes_out=_output_size, label=_label))
+        return telemetry[-1]
+    logger.debug(f"Executing conversion with mode: {exec_mode} and workers: {workers} in ordered mode: {ordered} (max in flight: {max_in_flight}, read ahead: {settings.read_ahead}, schedule: {settings.schedule})")
     
-    # Set up worker (per experiment)
-    def worker(st: ExperimentState) -> list[ExperimentState]:
-        logger.debug("Conversion will be executed with parameters: %s", payload)
-
-        # Check if needed
-        if not st.needs_run(step_profile.step_name, settings_hash, settings.overwrite, required_output=output_name):
-            logger.debug("Skipping conversion for %s as it is up to date.", st.original_image)
-            return [st]
+    # Set up the task (per experiment). Worker processes (local or remote) get a portable context and leave persistence to this process
+    in_process_pool = exec_mode in ("process", "distributed")
+    task = ConvertTask(ctx=ctx.portable() if in_process_pool else ctx,
+                       payload=payload,
+                       settings_hash=settings_hash,
+                       step_name=step_profile.step_name,
+                       overwrite=settings.overwrite,
+                       output_name=output_name,
+                       persist=not in_process_pool)
+    init_kwargs: dict[str, Any] = {"initializer": init_worker_ctx, "initargs": (task.ctx,), "broker": ctx.broker} if in_process_pool else {}
         
-        reader = FitsIO.from_path(st.original_image, channel_labels=channel_labels,)
+    logger.info("Starting conversion with settings: %s", payload)
+    groups = intake = _Intake(exp_state)
+    if settings.read_ahead:
+        # Read the start of the next sources on I/O threads while the previous ones are being converted
+        stages = [Stage("read_ahead", task.prefetch, mode="thread", workers=settings.read_ahead_workers, telemetry=new_telemetry("read_ahead")),
+                  Stage("convert", task.convert, mode=exec_mode, workers=workers, budget=budget, cost=cost, telemetry=new_telemetry(step_profile.step_name), **init_kwargs)]
+        results = execute_staged(groups, stages, ordered=ordered, max_in_flight=max_in_flight, policy=policy, on_failure=task.failed, pools=ctx.worker_pools, cancel=ctx.cancel, schedule=settings.schedule, weight=weight)
+    else:
+        results = execute(groups, task, mode=exec_mode, workers=workers, ordered=ordered, max_in_flight=max_in_flight, policy=policy, on_failure=task.failed, budget=budget, cost=cost, pools=ctx.worker_pools, cancel=ctx.cancel, schedule=settings.schedule, weight=weight, telemetry=new_telemetry(step_profile.step_name), **init_kwargs)
+    return _record(results, ctx, step_profile.step_name, in_parent=in_process_pool, telemetry=telemetry, intake=intake)
 
-        save_paths = reader.convert_to_fits(**payload)
-        logger.info("Conversion completed for %s", st.original_image)
-        logger.debug("Saved FITS files at: %s", save_paths)
 
-        out_states = [st.with_image(image_path=p, last_step=step_profile.step_name,)
-                        .with_settings_hash(step_profile.step_name, settings_hash)
-                        .mark_done(step_profile.step_name)
-                                    for p in save_paths]
-        for out_st in out_states:
-            logger.debug("Produced new ExperimentState: %s", out_st)
-            out_st.to_json()
-        return out_states
-        
-    logger.info("Starting conversion with settings: %s", payload)
-    return execute(exp_state, worker, mode=exec_mode, workers=workers, ordered=ordered)
-    
\ No newline at end of file
+def convert_job(settings: ConvertSettings, step_profile: StepProfile, output_name: FitsName) -> StepJob | None:
+    """
+    Per-experiment form of the convert step, run by the DAG engine (see fits.workflows.dag).
+
+    Experiments are converted on the shared threads of the engine: ``workers`` is the concurrency limit of the step (1
+    with serial execution). States are saved as each experiment completes. A multi-series raw file is converted by the
+    first of its series that needs it; its other series are then dropped from the step output, as that conversion writes
+    them too. Returns None (the workflow then runs step by
+    step with run_convert) when the settings need what only run_convert provides: worker processes, the read-ahead
+    mode, the run memory budget, telemetry, a largest_first schedule, max_in_flight or ordered execution.
+    """
+    ctx = get_ctx()
+    needs_runner = {
+        f"execution: {settings.execution}": settings.execution in ("process", "distributed"),
+        "read_ahead": settings.read_ahead,
+        "max_memory": ctx.memory_budget is not None,
+        "telemetry": ctx.telemetry_dir is not None,
+        f"schedule: {settings.schedule}": settings.schedule != "input",
+        "max_in_flight": settings.max_in_flight is not None,
+        "ordered_execution": settings.ordered_execution,
+    }
+    if any(needs_runner.values()):
+        logger.info(f"Convert runs as a whole step ({', '.join(k for k, v in needs_runner.items() if v)})")
+        return None
+    payload = build_payload(settings, step_profile, ctx.user_name, output_name)
+    step_name = step_profile.step_name
+    task = ConvertTask(ctx=ctx,
+                       payload=payload,
+                       settings_hash=hash_payload(payload),
+                       step_name=step_name,
+                       overwrite=settings.overwrite,
+                       output_name=output_name)
+    failures: list[tuple[ExperimentState, str]] = []
+    claimed: set[Path] = set()
+    claim_lock = threading.Lock()
+
+    def run(st: ExperimentState) -> list[ExperimentState]:
+        with use_ctx(ctx):
+            prepared = task._prepare((st,))
+            if isinstance(prepared, PreparedConversion):
+                with claim_lock:
+                    if st.original_image in claimed:
+                        # Another series of the file is converting it, which writes this series too
+                        return []
+                    claimed.add(st.original_image)
+            return task._finish(prepared).states
+
+    def on_failure(st: ExperimentState, err: Exception) -> list[ExperimentState]:
+        outcome = task.failed((st,), err)
+        save_states(outcome.states, ctx.state_store)
+        failures.extend((out_st, str(outcome.error)) for out_st in outcome.states)
+        return outcome.states
+
+    def close() -> None:
+        if ctx.state_store is not None:
+            ctx.state_store.flush()
+        _log_failures(step_name, failures)
+
+    logger.debug("Conversion jobs will run with settings: %s", payload)
+    return StepJob(run=run,
+                   concurrency=1 if settings.execution == "serial" else settings.workers,
+                   policy=ErrorPolicy(settings.on_error, settings.retries, settings.retry_backoff, settings.task_timeout),
+                   on_failure=on_failure,
+                   close=close)
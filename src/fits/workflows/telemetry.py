@@ -0,0 +1,207 @@
+from __future__ import annotations
+from collections.abc import Callable, Sequence
+from dataclasses import asdict, dataclass
+import json
+import logging
+import os
+from pathlib import Path
+import socket
+import threading
+import time
+from typing import Any, Generic, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass(frozen=True)
+class TimedOutcome:
+    """
+    Result of a task run by Timed in a worker: its value or exception, when it ran and where.
+    """
+
+    value: Any
+    error: Exception | None
+    start: float
+    end: float
+    worker: str
+
+
+@dataclass(frozen=True)
+class Timed(Generic[T, R]):
+    """
+    Picklable wrapper timing func in the worker. Errors are returned in the outcome, not raised, so the timing of a
+    failed task reaches the parent as well; execute raises them again.
+    """
+
+    func: Callable[[T], R]
+
+    def __call__(self, item: T) -> TimedOutcome:
+        worker = f"{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}"
+        start = time.time()
+        try:
+            value = self.func(item)
+        except Exception as e:
+            return TimedOutcome(None, e, start, time.time(), worker)
+        return TimedOutcome(value, None, start, time.time(), worker)
+
+
+@dataclass(frozen=True)
+class TaskRecord:
+    """
+    Timing of one task. Times are wall-clock seconds (epoch), so records of several processes and nodes line up.
+    """
+
+    item: str
+    submit: float
+    start: float | None
+    end: float
+    worker: str | None
+    bytes_in: int
+    bytes_out: int
+    error: str | None
+
+    @property
+    def queue_wait(self) -> float | None:
+        return None if self.start is None else self.start - self.submit
+
+    @property
+    def duration(self) -> float | None:
+        return None if self.start is None else self.end - self.start
+
+
+def _percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = q / 100 * (len(ordered) - 1)
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class Telemetry(Generic[T, R]):
+    """
+    Opt-in per-task instrumentation of one execute call (or one stage of execute_staged).
+
+    execute records the submit time of each task, its start and end times and worker (measured in the worker), the
+    bytes it read and wrote (estimated by bytes_in(item) and bytes_out(result)) and its exception. ``summary`` derives
+    the utilisation of the workers, the throughput and the latency percentiles, to tell an I/O-bound step from a
+    CPU-bound one.
+
+    Args:
+        name: Name of what is measured (e.g. step or stage name).
+        bytes_in: Optional estimate of the bytes read by the task of an item (e.g. the size of its source file).
+        bytes_out: Optional estimate of the bytes written for a result.
+        label: Optional label of an item in the records. Defaults to str.
+    """
+
+    def __init__(self, name: str, *, bytes_in: Callable[[T], int] | None = None, bytes_out: Callable[[R], int] | None = None, label: Callable[[T], str] = str) -> None:
+        self.name = name
+        self.mode: str | None = None
+        self.workers: int | None = None
+        self.records: list[TaskRecord] = []
+        self._bytes_in = bytes_in
+        self._bytes_out = bytes_out
+        self._label = label
+        self._lock = threading.Lock()
+
+    def started(self, mode: str, workers: int) -> None:
+        self.mode, self.workers = mode, workers
+
+    def record(self, item: T, submit: float, outcome: TimedOutcome | None, error: Exception | None = None) -> None:
+        """
+        Record a finished task. outcome is None if the task never ran (e.g. its worker crashed), with error set.
+        """
+        if outcome is not None:
+            error = outcome.error
+        ok = error is None and outcome is not None
+        rec = TaskRecord(item=self._label(item),
+                         submit=submit,
+                         start=outcome.start if outcome is not None else None,
+                         end=outcome.end if outcome is not None else time.time(),
+                         worker=outcome.worker if outcome is not None else None,
+                         bytes_in=self._bytes_in(item) if self._bytes_in is not None else 0,
+                         bytes_out=self._bytes_out(outcome.value) if ok and self._bytes_out is not None and outcome is not None else 0,
+                         error=None if error is None else f"{type(error).__name__}: {error}")
+        with self._lock:
+            self.records.append(rec)
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Aggregate metrics: wall time (first submit to last end), utilisation (busy time / (wall time x workers)),
+        throughput in files/s and MB/s, and p50/p95 of the task durations and queue waits.
+        """
+        with self._lock:
+            records = list(self.records)
+        durations = [r.duration for r in records if r.duration is not None]
+        waits = [r.queue_wait for r in records if r.queue_wait is not None]
+        wall = max(r.end for r in records) - min(r.submit for r in records) if records else 0.0
+        busy = sum(durations)
+        mb_in = sum(r.bytes_in for r in records) / 1e6
+        mb_out = sum(r.bytes_out for r in records) / 1e6
+        return {
+            "name": self.name,
+            "mode": self.mode,
+            "workers": self.workers,
+            "tasks": len(records),
+            "failed": sum(r.error is not None for r in records),
+            "distinct_workers": len({r.worker for r in records if r.worker is not None}),
+            "wall_s": wall,
+            "busy_s": busy,
+            "utilisation": busy / (wall * self.workers) if wall > 0 and self.workers else None,
+            "files_per_s": len(records) / wall if wall > 0 else None,
+            "mb_in_per_s": mb_in / wall if wall > 0 else None,
+            "mb_out_per_s": mb_out / wall if wall > 0 else None,
+            "latency_p50_s": _percentile(durations, 50),
+            "latency_p95_s": _percentile(durations, 95),
+            "queue_wait_p50_s": _percentile(waits, 50),
+            "queue_wait_p95_s": _percentile(waits, 95),
+        }
+
+
+def write_telemetry(log_dir: Path, step_name: str, telemetries: Sequence[Telemetry[Any, Any]]) -> Path:
+    """
+    Write the summaries and task records of a step to ``fits_telemetry_<step>_<timestamp>.json`` in log_dir.
+    """
+    log_dir.mkdir(parents=True, exist_ok=True)
+    now = time.time()
+    path = log_dir / f"fits_telemetry_{step_name}_{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 1000) % 1000:03d}.json"
+    data = {
+        "step": step_name,
+        "host": socket.gethostname(),
+        "stages": [{"summary": t.summary(), "tasks": [asdict(r) for r in t.records]} for t in telemetries],
+    }
+    path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    for t in telemetries:
+        s = t.summary()
+        if s["tasks"]:
+            logger.info(f"Telemetry '{s['name']}': {s['tasks']} tasks in {s['wall_s']:.1f}s on {s['workers']} {s['mode']} worker(s), "
+                        f"utilisation {_fmt(s['utilisation'], '.0%')}, {_fmt(s['files_per_s'], '.2f')} files/s, {_fmt(s['mb_in_per_s'], '.1f')} MB/s in, "
+                        f"latency p50 {_fmt(s['latency_p50_s'], '.2f')}s p95 {_fmt(s['latency_p95_s'], '.2f')}s")
+    logger.debug(f"Telemetry written to {path}")
+    return path
+
+
+def _fmt(value: float | None, spec: str) -> str:
+    return "n/a" if value is None else format(value, spec)
+
+
+def read_telemetry(log_dir: Path, step_name: str, *, limit: int = 5) -> list[dict[str, Any]]:
+    """
+    Load the telemetry files of the last ``limit`` runs of a step in log_dir, most recent first. Unreadable files are
+    skipped.
+    """
+    paths = sorted(log_dir.glob(f"fits_telemetry_{step_name}_*.json"), reverse=True)  # timestamped names sort by date
+    out: list[dict[str, Any]] = []
+    for path in paths:
+        if len(out) >= limit:
+            break
+        try:
+            out.append(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError) as e:
+            logger.debug(f"Ignoring unreadable telemetry file {path}: {e}")
+    return out
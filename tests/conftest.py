@@ -41,6 +41,14 @@ class DummyFitsIO:
 class DummyCtx:
     """Mock ExecutionContext for testing."""
     user_name: str
+    state_store: Any = None
+    stat_cache: Any = None
+    memory_budget: Any = None
+    worker_pools: Any = None
+    cancel: Any = None
+    broker: Any = None
+    telemetry_dir: Any = None
+    output_cache: Any = None
 
 
 # ============================================================
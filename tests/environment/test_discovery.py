@@ -1,8 +1,10 @@
 from __future__ import annotations
+import os
 from pathlib import Path
 
-from fits.environment.discovery import collect_supported_files, find_fits_outputs
-from fits.environment.constant import FITS_ARRAY_NAME, FITS_MASK_NAME
+from fits.environment.discovery import collect_supported_files, find_fits_outputs, index_run_dir, rediscover_run_dir, walk_run_dir
+from fits.environment.statcache import StatCache
+from fits.environment.constant import DISCOVERY_SNAPSHOT_NAME, FITS_ARRAY_NAME, FITS_MASK_NAME, RUN_META_DIR, STATE_FILE_NAME
 
 
 def test_collect_supported_files_recursive_and_filters(tmp_path: Path, touch) -> None:
@@ -48,3 +50,124 @@ def test_find_fits_outputs_does_not_match_similar_names(tmp_path: Path, touch) -
     touch(tmp_path / f"copy_{FITS_MASK_NAME}")
     out = find_fits_outputs(tmp_path)
     assert out == []
+
+
+def test_index_run_dir_classifies_all_entries_in_one_walk(tmp_path: Path, touch) -> None:
+    raw_a = touch(tmp_path / "a.nd2")
+    raw_b = touch(tmp_path / "sub" / "b.TIF")
+    fits_out = touch(tmp_path / "a_s0" / FITS_ARRAY_NAME)
+    mask_out = touch(tmp_path / "a_s0" / FITS_MASK_NAME)
+    state = touch(tmp_path / "a_s0" / STATE_FILE_NAME)
+    touch(tmp_path / "sub" / "notes.csv")
+    touch(tmp_path / "fits_skip.tif")
+
+    index = index_run_dir(tmp_path)
+
+    assert index.root == tmp_path
+    assert index.raw_files == [raw_a, raw_b]
+    assert index.fits_outputs == sorted([fits_out, mask_out])
+    assert index.state_files == [state]
+
+
+def test_collect_and_find_reuse_given_index(tmp_path: Path, touch) -> None:
+    raw = touch(tmp_path / "a.nd2")
+    out = touch(tmp_path / "a_s0" / FITS_ARRAY_NAME)
+    index = index_run_dir(tmp_path)
+
+    # files created after indexing are not seen when the index is reused
+    touch(tmp_path / "late.nd2")
+
+    assert collect_supported_files(tmp_path, index=index) == [raw]
+    assert find_fits_outputs(tmp_path, index=index) == [out]
+
+
+def test_rediscover_run_dir_matches_full_index_and_reports_changes(tmp_path: Path, touch) -> None:
+    a = touch(tmp_path / "acq1" / "a.nd2")
+    b = touch(tmp_path / "acq1" / "b.nd2")
+    touch(tmp_path / "acq1" / "a_s0" / FITS_ARRAY_NAME)
+    os.utime(tmp_path / "acq1" / "a_s0", (0, 0))  # settled long before the scan
+
+    first = rediscover_run_dir(tmp_path)
+    assert first.index == index_run_dir(tmp_path)
+    assert first.added == [a, b]
+    assert first.removed == []
+    assert (tmp_path / RUN_META_DIR / DISCOVERY_SNAPSHOT_NAME).exists()
+
+    c = touch(tmp_path / "acq2" / "c.nd2")
+    b.unlink()
+
+    second = rediscover_run_dir(tmp_path)
+    assert second.index == index_run_dir(tmp_path)
+    assert collect_supported_files(tmp_path, index=second.index) == [a, c]
+    assert second.added == [c]
+    assert second.removed == [b]
+    # only the root, acq1 and acq2 changed; acq1/a_s0 comes from the snapshot
+    assert second.reused_dirs == 1
+    assert second.scanned_dirs == 3
+
+
+def test_rediscover_run_dir_lists_again_directories_changed_around_the_scan(tmp_path: Path, touch) -> None:
+    a = touch(tmp_path / "acq" / "a.nd2")
+    mtime_ns = (tmp_path / "acq").stat().st_mtime_ns
+    rediscover_run_dir(tmp_path)
+
+    # Added in the same mtime tick as the scan: the directory mtime does not move
+    b = touch(tmp_path / "acq" / "b.nd2")
+    os.utime(tmp_path / "acq", ns=(mtime_ns, mtime_ns))
+    stat_cache = StatCache()
+    out = rediscover_run_dir(tmp_path, stat_cache=stat_cache)
+    assert out.added == [b]
+    assert out.reused_dirs == 0
+
+    # Settled directories come from the snapshot, and still prime the cache
+    os.utime(tmp_path / "acq", (0, 0))
+    rediscover_run_dir(tmp_path)
+    stat_cache.clear()
+    out = rediscover_run_dir(tmp_path, stat_cache=stat_cache)
+    assert out.reused_dirs == 1
+    assert stat_cache.exists(a) and stat_cache.exists(b) and not stat_cache.exists(tmp_path / "acq" / "c.nd2")
+    assert stat_cache.listings_done == 0
+
+
+def test_rediscover_run_dir_settles_once_nothing_changes(tmp_path: Path, touch) -> None:
+    touch(tmp_path / "acq" / "a.nd2")
+    snapshot = tmp_path / RUN_META_DIR / DISCOVERY_SNAPSHOT_NAME
+    rediscover_run_dir(tmp_path)
+    for d in (tmp_path, tmp_path / "acq"):
+        os.utime(d, (0, 0))  # settled long before the next scan
+    rediscover_run_dir(tmp_path)  # settles both directories in the snapshot
+    os.utime(tmp_path, (0, 0))
+    saved_at = snapshot.stat().st_mtime_ns
+
+    out = rediscover_run_dir(tmp_path)
+
+    # Saving the snapshot did not touch the root: nothing is listed again, and the snapshot is not rewritten
+    assert (out.scanned_dirs, out.reused_dirs) == (0, 2)
+    assert snapshot.stat().st_mtime_ns == saved_at
+    assert index_run_dir(tmp_path) == out.index
+
+
+def test_rediscover_run_dir_ignores_corrupt_snapshot(tmp_path: Path, touch) -> None:
+    a = touch(tmp_path / "a.nd2")
+    (tmp_path / RUN_META_DIR).mkdir()
+    (tmp_path / RUN_META_DIR / DISCOVERY_SNAPSHOT_NAME).write_text("{ not json", encoding="utf-8")
+
+    out = rediscover_run_dir(tmp_path)
+
+    assert out.index.raw_files == [a]
+    assert out.added == [a]
+
+
+def test_walk_run_dir_yields_directories_bottom_up(tmp_path: Path, touch) -> None:
+    raw = touch(tmp_path / "a.nd2")
+    state = touch(tmp_path / "a_s0" / STATE_FILE_NAME)
+    deep = touch(tmp_path / "sub" / "deeper" / "b.nd2")
+    touch(tmp_path / "notes.csv")
+
+    walked = list(walk_run_dir(tmp_path))
+
+    dirs = [d for d, _ in walked]
+    assert dirs == [tmp_path / "a_s0", tmp_path / "sub" / "deeper", tmp_path / "sub", tmp_path]
+    assert dict(walked)[tmp_path] == [(raw, "raw")]
+    assert dict(walked)[tmp_path / "a_s0"] == [(state, "state")]
+    assert dict(walked)[tmp_path / "sub" / "deeper"] == [(deep, "raw")]
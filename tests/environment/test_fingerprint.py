@@ -0,0 +1,42 @@
+from __future__ import annotations
+import os
+from pathlib import Path
+
+from fits.environment.fingerprint import compute_fingerprint
+
+
+def _write(p: Path, data: bytes) -> Path:
+    p.write_bytes(data)
+    return p
+
+
+def test_fingerprint_unchanged_after_touch(tmp_path: Path) -> None:
+    raw = _write(tmp_path / "a.nd2", b"x" * 3_000_000)
+    fp = compute_fingerprint(raw)
+
+    st = os.stat(raw)
+    os.utime(raw, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert not fp.changed(raw)
+
+
+def test_fingerprint_detects_rewrite_with_same_size(tmp_path: Path) -> None:
+    raw = _write(tmp_path / "a.nd2", b"x" * 3_000_000)
+    fp = compute_fingerprint(raw)
+
+    _write(raw, b"x" * 2_999_999 + b"y")
+    st = os.stat(raw)
+    os.utime(raw, ns=(st.st_atime_ns, fp.mtime_ns + 10**9))
+
+    assert fp.changed(raw)
+
+
+def test_fingerprint_detects_size_change_and_ignores_missing_file(tmp_path: Path) -> None:
+    raw = _write(tmp_path / "a.nd2", b"abc")
+    fp = compute_fingerprint(raw)
+
+    _write(raw, b"abcd")
+    assert fp.changed(raw)
+
+    raw.unlink()
+    assert not fp.changed(raw)
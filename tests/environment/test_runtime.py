@@ -1,7 +1,12 @@
+import contextvars
+import os
+import signal
+
 import pytest
-from fits.environment.runtime import get_ctx, use_ctx
+from fits.environment.runtime import get_ctx, handle_signals, use_ctx
 from fits.environment import runtime
 from fits.environment.context import ExecutionContext
+from fits.workflows.executors import CancelToken
 
 
 def test_get_ctx_raises_when_unset() -> None:
@@ -38,4 +43,32 @@ def test_detect_mode_notebook_when_no_gui(monkeypatch) -> None:
 def test_detect_mode_cli_fallback(monkeypatch) -> None:
     monkeypatch.setattr(runtime, "detect_qt_gui_running", lambda: False)
     monkeypatch.setattr(runtime, "detect_notebook", lambda: False)
-    assert runtime.detect_mode() == "cli"
\ No newline at end of file
+    assert runtime.detect_mode() == "cli"
+
+def test_handle_signals_cancels_token_then_restores_handlers() -> None:
+    token = CancelToken()
+    previous = signal.getsignal(signal.SIGTERM)
+    with handle_signals(token):
+        os.kill(os.getpid(), signal.SIGTERM)
+        assert token.cancelled
+        assert token.reason == "SIGTERM"
+    assert signal.getsignal(signal.SIGTERM) is previous
+
+def test_handle_signals_second_sigint_aborts() -> None:
+    token = CancelToken()
+    with pytest.raises(KeyboardInterrupt):
+        with handle_signals(token):
+            os.kill(os.getpid(), signal.SIGINT)
+            assert token.cancelled
+            os.kill(os.getpid(), signal.SIGINT)
+
+def test_init_worker_ctx_ignores_interrupts_and_sets_ctx() -> None:
+    ctx = ExecutionContext(user_name='worker')
+    previous = {sig: signal.getsignal(sig) for sig in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        assert contextvars.copy_context().run(lambda: (runtime.init_worker_ctx(ctx), get_ctx())[1]) is ctx
+        assert signal.getsignal(signal.SIGINT) is signal.SIG_IGN
+        assert signal.getsignal(signal.SIGTERM) is signal.SIG_IGN
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+import os
+from pathlib import Path
+
+from fits.environment.discovery import index_run_dir
+from fits.environment.state import ExperimentState
+from fits.environment.statcache import StatCache
+
+
+def test_exists_lists_each_directory_once(tmp_path: Path, touch) -> None:
+    a = touch(tmp_path / "exp" / "a.tif")
+    cache = StatCache()
+
+    assert cache.exists(a)
+    assert not cache.exists(tmp_path / "exp" / "b.tif")
+    assert not cache.exists(tmp_path / "missing" / "c.tif")
+    assert cache.listings_done == 2
+
+
+def test_invalidate_picks_up_new_outputs(tmp_path: Path, touch) -> None:
+    cache = StatCache()
+    out = tmp_path / "exp" / "fits_array.tif"
+    assert not cache.exists(out)
+
+    touch(out)
+    assert not cache.exists(out)  # stale listing until invalidated
+
+    cache.invalidate(out)
+    assert cache.exists(out)
+
+
+def test_index_run_dir_primes_cache_for_needs_run(tmp_path: Path, touch) -> None:
+    image = touch(tmp_path / "a_s0" / "fits_array.tif")
+    touch(tmp_path / "a_s0" / "sidecar.json")
+    cache = StatCache()
+    index_run_dir(tmp_path, stat_cache=cache)
+
+    s = (
+        ExperimentState.init(tmp_path, tmp_path / "a.nd2")
+        .with_image(image)
+        .with_settings_hash("convert", "h1")
+        .mark_done("convert")
+    )
+
+    assert not s.needs_run("convert", "h1", False, required_files_rel=(Path("a_s0/sidecar.json"),), stat_cache=cache)
+    assert s.needs_run("convert", "h1", False, required_files_rel=(Path("a_s0/other.json"),), stat_cache=cache)
+    assert cache.listings_done == 0
+
+
+def test_source_check_stats_a_shared_source_once(monkeypatch, tmp_path: Path) -> None:
+    from fits.environment.fingerprint import compute_fingerprint
+
+    raw = tmp_path / "a.nd2"
+    raw.write_bytes(b"raw data")
+    fp = compute_fingerprint(raw)
+    cache = StatCache()
+    stats: list[Path] = []
+    real_stat = os.stat
+    monkeypatch.setattr("fits.environment.statcache.os.stat", lambda p, *a, **kw: stats.append(p) or real_stat(p, *a, **kw))
+
+    assert not any(fp.changed(raw, cache) for _ in range(3))  # e.g. three series of one file
+    assert stats == [raw]
+
+    raw.write_bytes(b"new data!")
+    assert not fp.changed(raw, cache)  # memoised until the directory is listed again
+    cache.invalidate(raw)
+    assert fp.changed(raw, cache)
@@ -1,12 +1,16 @@
 from dataclasses import replace
 from datetime import datetime
+import json
 from pathlib import Path
 import tempfile
+import time
 
 import pytest
 
-from fits.environment.constant import FITS_ARRAY_NAME, FITS_MASK_NAME
-from fits.environment.state import ExperimentState, _discover_saved_states, assemble_experiment_states
+from fits.environment.constant import FITS_ARRAY_NAME, FITS_MASK_NAME, STATE_FILE_NAME, STATE_JOURNAL_NAME
+from fits.environment.fingerprint import compute_fingerprint
+from fits.environment.serialization import STATE_SCHEMA_VERSION, deserialize_experiment_state, serialize_experiment_state
+from fits.environment.state import ExperimentState, StateJournal, _discover_saved_states, assemble_experiment_states, iter_experiment_states, replay_state_journal
 
 
 def test_init_stores_original_path_relative_to_run_dir() -> None:
@@ -124,6 +128,25 @@ def test_needs_run_true_when_hash_changed() -> None:
         assert s.needs_run("convert", settings_hash="new", overwrite=False)
 
 
+def test_run_reason_names_the_first_failing_gate() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        s = ExperimentState.init(run_dir, run_dir / "a.nd2")
+        image = run_dir / "a_s0" / "fits_array.tif"
+        image.parent.mkdir()
+        image.touch()
+        done = s.with_image(image).with_settings_hash("convert", "h1").mark_done("convert")
+
+        assert s.run_reason("convert", "h1", overwrite=False) == "new"
+        assert s.mark_failed("convert", "boom").run_reason("convert", "h1", overwrite=False) == "previously failed"
+        assert done.run_reason("convert", "h1", overwrite=True) == "overwrite"
+        assert done.run_reason("convert", "h2", overwrite=False) == "settings changed"
+        assert done.run_reason("convert", "h1", overwrite=False, required_files_rel=[Path("missing.json")]) == "sidecar missing"
+        assert done.run_reason("convert", "h1", overwrite=False) is None
+        image.unlink()
+        assert done.run_reason("convert", "h1", overwrite=False) == "output missing"
+
+
 def test_needs_run_true_when_required_image_missing() -> None:
     with tempfile.TemporaryDirectory() as tmpdir:
         run_dir = Path(tmpdir)
@@ -367,3 +390,189 @@ def test_to_json_atomic_cleanup_when_replace_fails(monkeypatch: pytest.MonkeyPat
         leftovers = list(image.parent.glob(".experiment_state.json.*.tmp"))
         assert leftovers == []
         assert not target.exists()
+
+
+def test_discover_saved_states_parallel_keeps_order_and_skips_invalid(caplog: pytest.LogCaptureFixture) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        raw = run_dir / "a.nd2"
+        raw.touch()
+
+        saved = [
+            ExperimentState.init(run_dir, raw).with_image(run_dir / f"a_s{i}" / "fits_array.tif").to_json()
+            for i in range(6)
+        ]
+        bad = run_dir / "a_s9" / "experiment_state.json"
+        bad.parent.mkdir()
+        bad.write_text("{ not json", encoding="utf-8")
+        state_files = [st.workdir / "experiment_state.json" for st in saved if st.workdir is not None]
+
+        caplog.set_level("WARNING")
+        loaded = _discover_saved_states(run_dir, [*state_files[:3], bad, *state_files[3:]], workers=4)
+
+        assert loaded == saved
+        assert "Failed to load experiment state" in caplog.text
+
+
+def test_deserialize_fast_path_matches_full_validation() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        s = (
+            ExperimentState.init(run_dir, run_dir / "a.nd2")
+            .with_image(run_dir / "a_s0" / "fits_array.tif")
+            .with_settings_hash("convert", "h1")
+            .mark_done("convert")
+        )
+        raw = serialize_experiment_state(s)
+        legacy = {k: v for k, v in raw.items() if k != "schema_version"}
+
+        assert raw["schema_version"] == STATE_SCHEMA_VERSION
+        assert deserialize_experiment_state(raw) == deserialize_experiment_state(legacy)
+        assert ExperimentState(**deserialize_experiment_state(raw)) == s
+
+
+class RecordingStore:
+    durable_batches = True
+
+    def __init__(self) -> None:
+        self.batches: list[list[ExperimentState]] = []
+
+    def save_many(self, states) -> None:
+        self.batches.append(list(states))
+
+
+def _converted(run_dir: Path, i: int) -> ExperimentState:
+    return ExperimentState.init(run_dir, run_dir / "a.nd2").with_image(run_dir / f"a_s{i}" / "fits_array.tif").mark_done("convert")
+
+
+def test_state_journal_groups_updates_into_batches() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        store = RecordingStore()
+        journal = StateJournal(run_dir, store, flush_interval=60, batch_size=2)  # type: ignore[arg-type]
+
+        states = [_converted(run_dir, i) for i in range(3)]
+        journal.save_many(states)
+        journal.save(states[2].mark_failed("convert", "boom"))
+        journal.close()
+
+        assert [len(b) for b in store.batches] == [2, 1]
+        assert store.batches[1][0].step_status["convert"] == "failed"
+
+
+def test_state_journal_json_flush_writes_files_and_removes_journal() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        states = [_converted(run_dir, i) for i in range(3)]
+
+        with StateJournal(run_dir, flush_interval=60) as journal:
+            journal.save_many(states)
+            journal.flush()
+            assert _discover_saved_states(run_dir) == states
+            # The files are synced at the flush: the journal does not grow over the run (e.g. in watch mode)
+            assert not (run_dir / STATE_JOURNAL_NAME).exists()
+            journal.save(states[0].mark_failed("convert", "boom"))
+
+        assert not (run_dir / STATE_JOURNAL_NAME).exists()
+        assert ExperimentState.from_json(run_dir / "a_s0").step_status == {"convert": "failed"}
+
+
+def test_state_journal_checkpoints_when_it_grows_without_flush() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        journal = StateJournal(run_dir, flush_interval=60, batch_size=1, checkpoint_size=1)
+        journal.save(_converted(run_dir, 0))
+
+        deadline = time.monotonic() + 5
+        while not (run_dir / "a_s0" / STATE_FILE_NAME).exists() or (run_dir / STATE_JOURNAL_NAME).exists():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        journal.close()
+
+
+def test_state_journal_reraises_writer_errors_on_flush() -> None:
+    class FailingStore(RecordingStore):
+        def save_many(self, states) -> None:
+            raise OSError("disk full")
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        journal = StateJournal(run_dir, FailingStore())  # type: ignore[arg-type]
+        journal.save(_converted(run_dir, 0))
+
+        with pytest.raises(RuntimeError, match="Failed to persist"):
+            journal.flush()
+        journal.close()
+
+
+def test_replay_state_journal_restores_states_of_interrupted_run() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        old = _converted(run_dir, 0)
+        new = old.with_settings_hash("convert", "h2")
+        lines = [json.dumps(serialize_experiment_state(st)) for st in (old, new)]
+        (run_dir / STATE_JOURNAL_NAME).write_text("\n".join(lines) + "\n{ torn", encoding="utf-8")
+
+        assert replay_state_journal(run_dir) == 1
+        assert _discover_saved_states(run_dir) == [new]
+        assert not (run_dir / STATE_JOURNAL_NAME).exists()
+        assert replay_state_journal(run_dir) == 0
+
+
+def test_needs_run_true_when_source_changed_since_processed() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        raw = run_dir / "a.nd2"
+        raw.write_bytes(b"first export")
+        image = run_dir / "a_s0" / "fits_array.tif"
+        image.parent.mkdir()
+        image.touch()
+
+        s = (
+            ExperimentState.init(run_dir, raw)
+            .with_image(image)
+            .with_settings_hash("convert", "h1")
+            .with_fingerprint(compute_fingerprint(raw))
+            .mark_done("convert")
+        )
+        assert not s.needs_run("convert", "h1", False)
+
+        raw.write_bytes(b"second export, longer")
+        assert s.needs_run("convert", "h1", False)
+        assert not s.needs_run("convert", "h1", False, check_source=False)
+
+        # the fingerprint survives a save/load roundtrip
+        assert ExperimentState.from_json(s.to_json().workdir).source_fingerprint == s.source_fingerprint
+
+
+def test_iter_experiment_states_streams_saved_then_only_new_raws() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        converted_raw = run_dir / "a.nd2"
+        new_raw = run_dir / "sub" / "b.nd2"
+        converted_raw.touch()
+        new_raw.parent.mkdir()
+        new_raw.touch()
+        _converted(run_dir, 0).to_json()
+        _converted(run_dir, 1).to_json()
+
+        stream = iter_experiment_states(run_dir)
+        first = next(stream)  # available before the walk is over
+        states = [first, *stream]
+
+        assert [s.original_image_rel for s in states].count(Path("a.nd2")) == 2
+        assert [s.original_image_rel for s in states].count(Path("sub/b.nd2")) == 1
+        assert len(states) == len(assemble_experiment_states(run_dir, [converted_raw, new_raw]))
+
+
+def test_iter_experiment_states_uses_given_saved_states() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        (run_dir / "a.nd2").touch()
+        (run_dir / "b.nd2").touch()
+        saved = _converted(run_dir, 0)
+
+        states = list(iter_experiment_states(run_dir, saved_states=[saved]))
+
+        assert states[0] is saved
+        assert [s.original_image_rel for s in states[1:]] == [Path("b.nd2")]
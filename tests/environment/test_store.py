@@ -0,0 +1,107 @@
+from __future__ import annotations
+from pathlib import Path
+
+import pytest
+
+from fits.environment.constant import FAILED_STATES_NAME, STATE_DB_NAME
+from fits.environment.state import ExperimentState, assemble_experiment_states
+from fits.environment.store import JsonStateStore, SqliteStateStore, open_state_store, save_states
+
+
+def _state(run_dir: Path, raw_name: str, workdir_name: str) -> ExperimentState:
+    return (
+        ExperimentState.init(run_dir, run_dir / raw_name)
+        .with_image(run_dir / workdir_name / "fits_array.tif", last_step="convert")
+        .with_settings_hash("convert", "h1")
+        .mark_done("convert")
+    )
+
+
+def test_sqlite_store_roundtrip_and_upsert(tmp_path: Path) -> None:
+    store = SqliteStateStore(tmp_path)
+    s0 = _state(tmp_path, "a.nd2", "a_s0")
+    s1 = _state(tmp_path, "a.nd2", "a_s1")
+
+    store.save_many([s0, s1])
+    assert (tmp_path / STATE_DB_NAME).exists()
+    assert store.load_all() == [s0, s1]
+
+    updated = s1.mark_failed("convert", "boom")
+    store.save(updated)
+
+    assert store.count() == 2
+    assert store.load_all() == [s0, updated]
+    store.close()
+
+
+def test_sqlite_store_indexed_lookups(tmp_path: Path) -> None:
+    store = SqliteStateStore(tmp_path)
+    a0 = _state(tmp_path, "a.nd2", "a_s0")
+    a1 = _state(tmp_path, "a.nd2", "a_s1").mark_failed("convert", "boom")
+    b0 = _state(tmp_path, "b.nd2", "b_s0")
+    store.save_many([a0, a1, b0])
+
+    assert store.get_by_original_image(Path("a.nd2")) == [a0, a1]
+    assert store.get_by_experiment_id("b_s0") == [b0]
+    assert store.find_by_step_status("convert", "failed") == [a1]
+    assert store.find_by_step_status("convert", "done") == [a0, b0]
+    store.close()
+
+
+def test_sqlite_store_json_import_and_export(tmp_path: Path) -> None:
+    s0 = _state(tmp_path, "a.nd2", "a_s0").to_json()
+    s1 = _state(tmp_path, "a.nd2", "a_s1").to_json()
+
+    store = open_state_store(tmp_path, "sqlite")
+    assert isinstance(store, SqliteStateStore)
+    assert store.load_all() == [s0, s1]
+
+    (tmp_path / "a_s0" / "experiment_state.json").unlink()
+    assert store.export_json() == 2
+    assert ExperimentState.from_json(tmp_path / "a_s0") == s0
+    store.close()
+
+
+def test_assemble_experiment_states_uses_store(tmp_path: Path) -> None:
+    saved = _state(tmp_path, "a.nd2", "a_s0")
+    store = SqliteStateStore(tmp_path)
+    store.save(saved)
+
+    states = assemble_experiment_states(tmp_path, [tmp_path / "a.nd2", tmp_path / "b.nd2"], store=store)
+
+    assert states[0] == saved
+    assert [s.original_image_rel for s in states] == [Path("a.nd2"), Path("b.nd2")]
+    store.close()
+
+
+def test_save_states_defaults_to_json(tmp_path: Path) -> None:
+    state = _state(tmp_path, "a.nd2", "a_s0")
+
+    save_states([state])
+
+    assert JsonStateStore(tmp_path).load_all() == [state]
+
+
+def test_json_store_records_failures_without_workdir(tmp_path: Path) -> None:
+    failed = ExperimentState.init(tmp_path, tmp_path / "corrupt.nd2").mark_failed("convert", "bad header")
+    store = JsonStateStore(tmp_path)
+
+    store.save(failed)
+
+    assert (tmp_path / FAILED_STATES_NAME).exists()
+    states = assemble_experiment_states(tmp_path, [tmp_path / "corrupt.nd2", tmp_path / "b.nd2"], store=store)
+    assert [(s.original_image_rel, s.step_status) for s in states] == [
+        (Path("corrupt.nd2"), {"convert": "failed"}),
+        (Path("b.nd2"), {}),
+    ]
+    assert states[0].last_error == "bad header"
+
+    # Converted on a later run: the failure record is dropped
+    store.save(_state(tmp_path, "corrupt.nd2", "corrupt_s0"))
+    assert not (tmp_path / FAILED_STATES_NAME).exists()
+    assert [s.step_status for s in store.load_all()] == [{"convert": "done"}]
+
+
+def test_open_state_store_rejects_unknown_backend(tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match="Invalid state backend"):
+        open_state_store(tmp_path, "redis")  # type: ignore[arg-type]
@@ -0,0 +1,66 @@
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from fits.environment.state import ExperimentState
+from fits.environment.table import StateTable
+
+
+def _states(run_dir: Path) -> list[ExperimentState]:
+    done = (
+        ExperimentState.init(run_dir, run_dir / "a.nd2")
+        .with_image(run_dir / "a_s0" / "fits_array.tif", last_step="convert")
+        .with_settings_hash("convert", "h1")
+        .mark_done("convert")
+    )
+    stale = (
+        ExperimentState.init(run_dir, run_dir / "a.nd2")
+        .with_image(run_dir / "a_s1" / "fits_array.tif", last_step="convert")
+        .with_settings_hash("convert", "h0")
+        .mark_done("convert")
+    )
+    failed = ExperimentState.init(run_dir, run_dir / "b.nd2").mark_failed("convert", "boom")
+    new = ExperimentState.init(run_dir, run_dir / "c.nd2")
+    return [done, stale, failed, new]
+
+
+def test_state_table_roundtrips_rows(tmp_path: Path) -> None:
+    states = _states(tmp_path)
+    table = StateTable.from_states(states)
+
+    assert len(table) == 4
+    assert table.to_states() == states
+    assert table[2].last_error == "boom"
+
+
+def test_state_table_needing_and_where_status(tmp_path: Path) -> None:
+    table = StateTable.from_states(_states(tmp_path))
+
+    assert table.needing("convert", "h1") == [1, 2, 3]
+    assert table.needing("convert", "unknown") == [0, 1, 2, 3]
+    assert table.needing("segment", "h1") == [0, 1, 2, 3]
+    assert table.where_status("convert", "failed") == [2]
+
+
+def test_state_table_bulk_mark_and_row_update(tmp_path: Path) -> None:
+    table = StateTable.from_states(_states(tmp_path))
+    stamp = datetime(2024, 1, 1, 12, 0)
+
+    table.mark(table.needing("convert", "h1"), "convert", "done", settings_hash="h1", updated_at=stamp)
+
+    assert table.needing("convert", "h1") == []
+    assert table[3].step_status == {"convert": "done"}
+    assert table[3].updated_at == stamp
+
+    table[3] = table[3].mark_running("segment")
+    assert table.where_status("segment", "running") == [3]
+    assert table[0].step_status == {"convert": "done"}
+
+
+def test_state_table_rejects_other_run_dir(tmp_path: Path) -> None:
+    table = StateTable(tmp_path / "run1")
+
+    with pytest.raises(ValueError, match="does not match table run_dir"):
+        table.append(ExperimentState.init(tmp_path / "run2", tmp_path / "run2" / "a.nd2"))
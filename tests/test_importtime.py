@@ -0,0 +1,53 @@
+"""
+Startup-time regression checks, from ``python -X importtime``.
+
+To see where the time goes: ``python -X importtime -c "import fits.cli.main" 2> importtime.log`` (cumulative
+microseconds per module; tools like tuna render the log).
+"""
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+# Heavy or workflow-only modules that light entry points must not import
+HEAVY = ("PySide6", "fits_io", "pydantic", "fits.pipeline", "fits.settings", "fits.workflows.registry", "fits.workflows.tasks")
+
+
+def import_times(statement: str) -> dict[str, int]:
+    """
+    Cumulative import time (us) of every module imported by statement in a fresh interpreter.
+    """
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], capture_output=True, text=True, env=env, check=True)
+    times: dict[str, int] = {}
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line.removeprefix("import time:").split("|"))
+        times[name] = int(cumulative)
+    return times
+
+
+def _heavy(times: dict[str, int]) -> list[str]:
+    return sorted(name for name in times if name.startswith(HEAVY))
+
+
+def _report(times: dict[str, int], top: int = 10) -> str:
+    return ", ".join(f"{name} {us / 1000:.1f}ms" for name, us in sorted(times.items(), key=lambda kv: -kv[1])[:top])
+
+
+def test_cli_startup_imports_no_heavy_module() -> None:
+    pytest.importorskip("typer")
+    times = import_times("import fits.cli.main")
+
+    assert _heavy(times) == [], _report(times)
+
+
+def test_environment_and_registry_import_lazily() -> None:
+    times = import_times("import fits.environment.log, fits.environment.state, fits.workflows.registry")
+
+    assert [name for name in _heavy(times) if not name.startswith("fits.workflows.registry")] == [], _report(times)
@@ -4,6 +4,7 @@ from contextlib import nullcontext
 from pathlib import Path
 
 from fits.environment.state import ExperimentState
+from fits.environment.table import StateTable
 from fits.pipeline import start_pipeline
 
 
@@ -41,12 +42,13 @@ def test_start_pipeline_states_one_raw_no_saved(monkeypatch, tmp_path: Path) ->
     monkeypatch.setattr("fits.pipeline.configure_logging", lambda **_: None)
     monkeypatch.setattr("fits.pipeline.coerce_mode", lambda _: "cli")
     monkeypatch.setattr("fits.pipeline.use_ctx", lambda _: nullcontext())
-    monkeypatch.setattr("fits.pipeline.collect_supported_files", lambda _: [raw])
+    monkeypatch.setattr("fits.pipeline.collect_supported_files", lambda *_, **__: [raw])
     monkeypatch.setattr("fits.pipeline.run_workflow", lambda _, states: captured.setdefault("states", states))
 
     start_pipeline(settings_path=run_dir / "settings.toml")
 
     states = captured["states"]
+    assert isinstance(states, StateTable)  # rows are materialised as the workflow reaches them
     assert len(states) == 1
     assert states[0].original_image_rel == Path("a.nd2")
     assert states[0].series_index == 0
@@ -66,7 +68,7 @@ def test_start_pipeline_states_raw_with_two_series_saved(monkeypatch, tmp_path:
     monkeypatch.setattr("fits.pipeline.configure_logging", lambda **_: None)
     monkeypatch.setattr("fits.pipeline.coerce_mode", lambda _: "cli")
     monkeypatch.setattr("fits.pipeline.use_ctx", lambda _: nullcontext())
-    monkeypatch.setattr("fits.pipeline.collect_supported_files", lambda _: [raw])
+    monkeypatch.setattr("fits.pipeline.collect_supported_files", lambda *_, **__: [raw])
     monkeypatch.setattr("fits.pipeline.run_workflow", lambda _, states: captured.setdefault("states", states))
 
     start_pipeline(settings_path=run_dir / "settings.toml")
@@ -93,7 +95,7 @@ def test_start_pipeline_states_two_raw_only_one_converted(monkeypatch, tmp_path:
     monkeypatch.setattr("fits.pipeline.configure_logging", lambda **_: None)
     monkeypatch.setattr("fits.pipeline.coerce_mode", lambda _: "cli")
     monkeypatch.setattr("fits.pipeline.use_ctx", lambda _: nullcontext())
-    monkeypatch.setattr("fits.pipeline.collect_supported_files", lambda _: [converted_raw, new_raw])
+    monkeypatch.setattr("fits.pipeline.collect_supported_files", lambda *_, **__: [converted_raw, new_raw])
     monkeypatch.setattr("fits.pipeline.run_workflow", lambda _, states: captured.setdefault("states", states))
 
     start_pipeline(settings_path=run_dir / "settings.toml")
@@ -104,3 +106,28 @@ def test_start_pipeline_states_two_raw_only_one_converted(monkeypatch, tmp_path:
     assert states[0].experiment_id == saved.experiment_id
     assert states[1].original_image_rel == Path("b.nd2")
     assert states[1].experiment_id is None
+
+
+def test_start_pipeline_streaming_discovery_feeds_a_stream(monkeypatch, tmp_path: Path) -> None:
+    run_dir = tmp_path
+    converted_raw = run_dir / "a.nd2"
+    new_raw = run_dir / "b.nd2"
+    converted_raw.touch()
+    new_raw.touch()
+    saved = _saved_state(run_dir, converted_raw, "a_s0", 0)
+
+    cfg = _base_cfg(run_dir)
+    cfg["runtime"]["streaming_discovery"] = True
+    captured: dict[str, list[ExperimentState]] = {}
+
+    monkeypatch.setattr("fits.pipeline.load_settings", lambda _: cfg)
+    monkeypatch.setattr("fits.pipeline.configure_logging", lambda **_: None)
+    monkeypatch.setattr("fits.pipeline.coerce_mode", lambda _: "cli")
+    monkeypatch.setattr("fits.pipeline.use_ctx", lambda _: nullcontext())
+    monkeypatch.setattr("fits.pipeline.run_workflow", lambda _, states: captured.setdefault("states", list(states)))
+
+    start_pipeline(settings_path=run_dir / "settings.toml")
+
+    states = captured["states"]
+    assert [state.original_image_rel for state in states] == [Path("a.nd2"), Path("b.nd2")]
+    assert states[0].experiment_id == saved.experiment_id
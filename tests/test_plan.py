@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from fits.environment.state import ExperimentState
+from fits.pipeline import RunConfig
+from fits.plan import format_plan, plan_run
+from fits.workflows.payload import build_payload, hash_payload
+from fits.workflows.registry import REGISTRY
+
+
+def _cfg(run_dir: Path, **params) -> RunConfig:
+    user_cfg = {"run_dir": str(run_dir), "user_name": "tester", "convert": {"enabled": True, "params": params}}
+    return RunConfig(user_cfg=user_cfg, run_dir=run_dir, user_name="tester")
+
+
+def _settings_hash(**params) -> str:
+    spec = REGISTRY["convert"]
+    return hash_payload(build_payload(spec.model_validate(params), spec.step_profile, "tester", spec.output_name))
+
+
+def _converted(run_dir: Path, raw: Path, settings_hash: str) -> ExperimentState:
+    image = run_dir / f"{raw.stem}_s0" / "fits_array.tif"
+    image.parent.mkdir()
+    image.write_bytes(b"x" * 50)
+    state = (ExperimentState.init(run_dir, raw)
+             .with_image(image)
+             .with_settings_hash("convert", settings_hash)
+             .mark_done("convert")
+             .commit(series_index=0, experiment_id=f"{raw.stem}-s0"))
+    state.to_json()
+    return state
+
+
+def test_plan_reports_runs_and_skips_with_reasons(tmp_path: Path) -> None:
+    new = tmp_path / "new.nd2"
+    new.write_bytes(b"n" * 100)
+    done = tmp_path / "done.nd2"
+    done.write_bytes(b"d" * 100)
+    _converted(tmp_path, done, _settings_hash())
+
+    plan = plan_run(_cfg(tmp_path))
+
+    (step,) = plan.steps
+    assert plan.experiments == 2
+    assert (step.to_run, step.skipped) == (1, 1)
+    assert step.reasons == {"new": 1, "up to date": 1}
+    assert step.bytes_in == 100
+    # No telemetry: the output size comes from the outputs already converted, the wall time is unknown
+    assert step.bytes_out == 50
+    assert step.wall_s is None
+    assert "to run" in format_plan(plan)
+
+
+def test_plan_detects_changed_settings(tmp_path: Path) -> None:
+    done = tmp_path / "done.nd2"
+    done.write_bytes(b"d" * 100)
+    _converted(tmp_path, done, _settings_hash())
+
+    plan = plan_run(_cfg(tmp_path, overwrite=True))
+
+    assert plan.steps[0].reasons == {"overwrite": 1}
+
+
+def test_plan_reads_a_multi_series_source_once(tmp_path: Path) -> None:
+    raw = tmp_path / "a.nd2"
+    raw.write_bytes(b"r" * 100)
+    for i in range(2):
+        image = tmp_path / f"a_s{i}" / "fits_array.tif"
+        image.parent.mkdir()
+        image.write_bytes(b"x" * 50)
+        ExperimentState.init(tmp_path, raw).with_image(image).with_settings_hash("convert", "old").mark_done("convert").commit(series_index=i).to_json()
+
+    (step,) = plan_run(_cfg(tmp_path)).steps
+
+    assert step.reasons == {"settings changed": 2}
+    assert step.bytes_in == 100
+
+
+def test_plan_reports_a_touched_source_without_opening_it(monkeypatch, tmp_path: Path) -> None:
+    import os
+
+    from fits.environment.fingerprint import compute_fingerprint
+
+    done = tmp_path / "done.nd2"
+    done.write_bytes(b"d" * 100)
+    fingerprint = compute_fingerprint(done)
+    _converted(tmp_path, done, _settings_hash()).with_fingerprint(fingerprint).to_json()
+    os.utime(done, ns=(fingerprint.mtime_ns + 10**9, fingerprint.mtime_ns + 10**9))
+    monkeypatch.setattr("fits.environment.fingerprint._digest", lambda *args: (_ for _ in ()).throw(AssertionError("source opened")))
+
+    assert plan_run(_cfg(tmp_path)).steps[0].reasons == {"source modified (mtime)": 1}
+
+
+def test_plan_estimates_wall_time_from_telemetry(tmp_path: Path) -> None:
+    for name in ("a.nd2", "b.nd2"):
+        (tmp_path / name).write_bytes(b"r" * 1000)
+    tasks = [{"item": "x", "submit": 0.0, "start": 0.0, "end": 4.0, "worker": "w", "bytes_in": 1000, "bytes_out": 3000, "error": None},
+             {"item": "y", "submit": 0.0, "start": 0.0, "end": 0.1, "worker": "w", "bytes_in": 1000, "bytes_out": 0, "error": None}]
+    (tmp_path / "fits_telemetry_convert_20260101-000000-000.json").write_text(
+        json.dumps({"step": "convert", "stages": [{"summary": {"name": "convert"}, "tasks": tasks}]}), encoding="utf-8")
+
+    plan = plan_run(_cfg(tmp_path, execution="serial"))
+
+    step = plan.steps[0]
+    assert step.to_run == 2
+    assert step.bytes_out == 6000
+    # 4 s per 1000 bytes on one worker; the skipped task (no output) is not counted
+    assert step.wall_s == 8.0
+
+
+def test_plan_writes_nothing(tmp_path: Path) -> None:
+    (tmp_path / "a.nd2").write_bytes(b"r" * 10)
+    before = sorted(tmp_path.rglob("*"))
+
+    plan_run(_cfg(tmp_path))
+
+    assert sorted(tmp_path.rglob("*")) == before
+
+
+def test_plan_leaves_the_sqlite_store_alone(tmp_path: Path) -> None:
+    from dataclasses import replace
+
+    from fits.environment.constant import STATE_DB_NAME
+    from fits.environment.store import SqliteStateStore
+
+    done = tmp_path / "done.nd2"
+    done.write_bytes(b"d" * 100)
+    saved = _converted(tmp_path, done, _settings_hash())
+    cfg = replace(_cfg(tmp_path), state_backend="sqlite")
+
+    # No database yet: the JSON states are read, and no database is created
+    assert plan_run(cfg).steps[0].reasons == {"up to date": 1}
+    assert not (tmp_path / STATE_DB_NAME).exists()
+
+    store = SqliteStateStore(tmp_path)
+    store.save(saved.mark_failed("convert", "boom"))
+    store.close()
+    before = (tmp_path / STATE_DB_NAME).read_bytes()
+    assert plan_run(cfg).steps[0].reasons == {"previously failed": 1}
+    assert (tmp_path / STATE_DB_NAME).read_bytes() == before
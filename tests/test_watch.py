@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from fits.environment.state import ExperimentState
+from fits.watch import SettleTracker, watch_pipeline
+
+
+def _base_cfg(run_dir: Path) -> dict:
+    return {
+        "run_dir": str(run_dir),
+        "user_name": "tester",
+        "runtime": {"mode": "cli", "write_behind": False},
+    }
+
+
+def test_settle_tracker_waits_for_stable_size(tmp_path: Path) -> None:
+    raw = tmp_path / "a.nd2"
+    raw.write_bytes(b"x")
+    tracker = SettleTracker(settle=5.0)
+
+    assert tracker.update([raw], now=0.0) == []
+    assert tracker.update([raw], now=3.0) == []
+
+    raw.write_bytes(b"xx")  # still being written
+    assert tracker.update([raw], now=6.0) == []
+    assert tracker.update([raw], now=10.0) == []
+    assert tracker.update([raw], now=11.0) == [raw]
+    assert len(tracker) == 0
+
+
+def test_settle_tracker_forgets_removed_files(tmp_path: Path) -> None:
+    raw = tmp_path / "a.nd2"
+    raw.touch()
+    tracker = SettleTracker(settle=0.0)
+
+    tracker.update([raw], now=0.0)
+    raw.unlink()
+    assert tracker.update([raw], now=1.0) == []
+    assert len(tracker) == 0
+
+
+def test_watch_pipeline_feeds_only_new_files(monkeypatch, tmp_path: Path) -> None:
+    run_dir = tmp_path
+    old_raw = run_dir / "old.nd2"
+    old_raw.touch()
+    saved = ExperimentState.init(run_dir, old_raw).commit(series_index=0)
+    (run_dir / "old_s0").mkdir()
+    saved.with_image(run_dir / "old_s0" / "fits_array.tif").to_json()
+    new_raw = run_dir / "new.nd2"
+    new_raw.touch()
+
+    calls: list[list[ExperimentState]] = []
+    monkeypatch.setattr("fits.pipeline.load_settings", lambda _: _base_cfg(run_dir))
+    monkeypatch.setattr("fits.pipeline.configure_logging", lambda **_: None)
+    monkeypatch.setattr("fits.watch.run_workflow", lambda _, states: calls.append(list(states)))
+
+    watch_pipeline(settings_path=run_dir / "settings.toml", interval=0.0, settle=0.0, max_cycles=3)
+
+    # catch-up over the saved state, then the new raw file once it was seen stable twice
+    assert len(calls) == 2
+    assert [s.original_image_rel for s in calls[0]] == [Path("old.nd2")]
+    assert [s.original_image_rel for s in calls[1]] == [Path("new.nd2")]
+
+
+def test_watch_pipeline_keeps_watching_after_a_failing_cycle(monkeypatch, tmp_path: Path) -> None:
+    run_dir = tmp_path
+    (run_dir / "bad.nd2").touch()
+    calls: list[list[Path]] = []
+
+    def run_workflow(_, states) -> None:
+        calls.append([s.original_image_rel for s in states])
+        if len(calls) == 1:
+            (run_dir / "good.nd2").touch()
+            raise ValueError("corrupt file")
+
+    monkeypatch.setattr("fits.pipeline.load_settings", lambda _: _base_cfg(run_dir))
+    monkeypatch.setattr("fits.pipeline.configure_logging", lambda **_: None)
+    monkeypatch.setattr("fits.watch.run_workflow", run_workflow)
+
+    failures = watch_pipeline(settings_path=run_dir / "settings.toml", interval=0.0, settle=0.0, max_cycles=4)
+
+    assert calls == [[Path("bad.nd2")], [Path("good.nd2")]]
+    assert failures == {run_dir / "bad.nd2": "ValueError: corrupt file"}
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 from pathlib import Path
+import json
+import os
 import tempfile
 
 import pytest
 
-from fits.workflows.tasks.convert import run_convert
+from fits.workflows.tasks.convert import convert_job, run_convert
 from fits.environment.state import ExperimentState
 from fits.workflows.provenance import StepProfile
 from fits.settings.models import ConvertSettings
@@ -129,4 +131,355 @@ def test_run_convert_raises_when_ctx_missing(monkeypatch) -> None:
     with pytest.raises(RuntimeError):
         with tempfile.TemporaryDirectory() as tmpdir:
             run_dir = Path(tmpdir)
-            run_convert(ConvertSettings(), [ExperimentState.init(run_dir, run_dir / "in.nd2")], StepProfile("io", "convert"), "fits_array.tif")
\ No newline at end of file
+            run_convert(ConvertSettings(), [ExperimentState.init(run_dir, run_dir / "in.nd2")], StepProfile("io", "convert"), "fits_array.tif")
+
+def test_run_convert_process_mode_sends_picklable_task_and_saves_in_parent(monkeypatch) -> None:
+    import pickle
+
+    from fits.environment.context import ExecutionContext
+    from fits.environment.statcache import StatCache
+
+    class RecordingStore:
+        def __init__(self) -> None:
+            self.saved: list[ExperimentState] = []
+            self.flushed = False
+
+        def save_many(self, states) -> None:
+            self.saved.extend(states)
+
+        def flush(self) -> None:
+            self.flushed = True
+
+    store = RecordingStore()
+    ctx = ExecutionContext(user_name="ben", state_store=store, stat_cache=StatCache())
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: ctx)
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+
+    seen: dict = {}
+    def fake_execute(items, task, **kwargs):
+        # what a process pool would do: pickle the task, run it elsewhere
+        remote = pickle.loads(pickle.dumps(task))
+        seen["remote_ctx"] = remote.ctx
+        seen["initargs"] = kwargs["initargs"]
+        return (remote(it) for it in items)
+
+    monkeypatch.setattr("fits.workflows.tasks.convert.execute", fake_execute)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        in_path = run_dir / "in.nd2"
+        in_path.write_bytes(b"raw")
+        monkeypatch.setattr(
+            "fits.workflows.tasks.convert.FitsIO.from_path",
+            lambda p, channel_labels=None: DummyReader([run_dir / "in_s0" / "fits_array.tif"]),
+        )
+
+        out = run_convert(ConvertSettings(execution="process"), [ExperimentState.init(run_dir, in_path)], StepProfile("io", "convert"), "fits_array.tif")
+
+    assert seen["remote_ctx"].state_store is None and seen["remote_ctx"].stat_cache is None
+    assert seen["initargs"] == (seen["remote_ctx"],)
+    assert [s.image_rel for s in store.saved] == [s.image_rel for s in out] == [Path("in_s0/fits_array.tif")]
+    assert store.flushed
+
+
+def test_run_convert_continue_marks_failed_states_and_summarizes(monkeypatch, DummyCtx_class, caplog) -> None:
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name="ben"))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        good, bad = run_dir / "good.nd2", run_dir / "bad.nd2"
+        good.write_bytes(b"raw")
+        bad.write_bytes(b"raw")
+
+        def fake_from_path(p: Path, channel_labels=None):
+            if p == bad:
+                raise ValueError("corrupt file")
+            return DummyReader([run_dir / "good_s0" / "fits_array.tif"])
+
+        monkeypatch.setattr("fits.workflows.tasks.convert.FitsIO.from_path", fake_from_path)
+
+        settings = ConvertSettings(execution="serial", on_error="continue")
+        out = run_convert(settings, [ExperimentState.init(run_dir, good), ExperimentState.init(run_dir, bad)], StepProfile("io", "convert"), "fits_array.tif")
+
+    assert [s.step_status["convert"] for s in out] == ["done", "failed"]
+    assert out[1].last_error == "ValueError: corrupt file"
+    assert "failed for 1 experiment(s)" in caplog.text
+    assert "bad.nd2: ValueError: corrupt file" in caplog.text
+
+
+def test_run_convert_read_ahead_prefetches_then_converts(monkeypatch, DummyCtx_class) -> None:
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name="ben"))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+    read_ahead: list[Path] = []
+    monkeypatch.setattr("fits.workflows.tasks.convert._read_ahead", read_ahead.append)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        inputs = [run_dir / f"{name}.nd2" for name in ("a", "b")]
+        for p in inputs:
+            p.write_bytes(b"raw")
+        monkeypatch.setattr(
+            "fits.workflows.tasks.convert.FitsIO.from_path",
+            lambda p, channel_labels=None: DummyReader([run_dir / f"{p.stem}_s0" / "fits_array.tif"]),
+        )
+
+        settings = ConvertSettings(execution="thread", workers=2, read_ahead=True, ordered_execution=True)
+        out = run_convert(settings, [ExperimentState.init(run_dir, p) for p in inputs], StepProfile("io", "convert"), "fits_array.tif")
+
+    assert sorted(read_ahead) == inputs
+    assert [s.image_rel for s in out] == [Path("a_s0/fits_array.tif"), Path("b_s0/fits_array.tif")]
+    assert all(s.source_fingerprint is not None for s in out)
+
+
+def test_run_convert_read_ahead_resolves_the_cache_key_once_and_skips_cached_sources(monkeypatch, DummyCtx_class, tmp_path: Path) -> None:
+    from fits.environment.fingerprint import content_digest
+    from fits.workflows.cache import OutputCache
+
+    cache = OutputCache(tmp_path / "cache")
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name="ben", output_cache=cache))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+    read_ahead: list[Path] = []
+    monkeypatch.setattr("fits.workflows.tasks.convert._read_ahead", read_ahead.append)
+    hashed: list[Path] = []
+    monkeypatch.setattr("fits.workflows.cache.content_digest", lambda p: hashed.append(p) or content_digest(p))
+
+    def reader(p: Path, channel_labels=None) -> DummyReader:
+        out = p.parent / f"{p.stem}_s0" / "fits_array.tif"
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_bytes(b"converted")
+        return DummyReader([out])
+    monkeypatch.setattr("fits.workflows.tasks.convert.FitsIO.from_path", reader)
+
+    raws = []
+    for run_name, mtime in (("run1", 1), ("run2", 2)):
+        raw = tmp_path / run_name / "a.nd2"
+        raw.parent.mkdir()
+        raw.write_bytes(b"same acquisition")
+        os.utime(raw, ns=(mtime, mtime))
+        raws.append(raw)
+        run_convert(ConvertSettings(execution="thread", read_ahead=True), [ExperimentState.init(raw.parent, raw)], StepProfile("io", "convert"), "fits_array.tif")
+
+    assert hashed == raws  # once per source, in the read-ahead stage only
+    assert read_ahead == raws[:1]  # the outputs of the second source were cached
+    assert (tmp_path / "run2" / "a_s0" / "fits_array.tif").read_bytes() == b"converted"
+
+
+def test_run_convert_largest_first_converts_big_sources_first(monkeypatch, DummyCtx_class) -> None:
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name="ben"))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+    converted: list[str] = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        run_dir = Path(tmpdir)
+        inputs = [run_dir / f"{name}.nd2" for name in ("a", "b", "c")]
+        for p, size in zip(inputs, (1, 30, 20)):
+            p.write_bytes(b"x" * size)
+
+        def from_path(p, channel_labels=None):
+            converted.append(p.stem)
+            return DummyReader([run_dir / f"{p.stem}_s0" / "fits_array.tif"])
+        monkeypatch.setattr("fits.workflows.tasks.convert.FitsIO.from_path", from_path)
+
+        settings = ConvertSettings(execution="serial", schedule="largest_first")
+        run_convert(settings, [ExperimentState.init(run_dir, p) for p in inputs], StepProfile("io", "convert"), "fits_array.tif")
+
+    assert converted == ["b", "c", "a"]
+
+
+def test_run_convert_writes_telemetry_to_log_dir(monkeypatch, DummyCtx_class, tmp_path: Path) -> None:
+    log_dir = tmp_path / "logs"
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name="ben", telemetry_dir=log_dir))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+    raw = tmp_path / "a.nd2"
+    raw.write_bytes(b"x" * 100)
+    monkeypatch.setattr(
+        "fits.workflows.tasks.convert.FitsIO.from_path",
+        lambda p, channel_labels=None: DummyReader([tmp_path / "a_s0" / "fits_array.tif"]),
+    )
+
+    run_convert(ConvertSettings(execution="thread", workers=1), [ExperimentState.init(tmp_path, raw)], StepProfile("io", "convert"), "fits_array.tif")
+
+    [report] = log_dir.glob("fits_telemetry_convert_*.json")
+    data = json.loads(report.read_text())
+    [task] = data["stages"][0]["tasks"]
+    assert task["item"] == str(raw) and task["bytes_in"] == 100 and task["error"] is None
+
+
+def _changed_multi_series_source(run_dir: Path) -> list[ExperimentState]:
+    from fits.environment.fingerprint import compute_fingerprint
+    from fits.workflows.payload import hash_payload
+
+    raw = run_dir / "a.nd2"
+    raw.write_bytes(b"old acquisition")
+    old = compute_fingerprint(raw)
+    raw.write_bytes(b"re-exported acquisition")
+    return [ExperimentState.init(run_dir, raw)
+            .with_image(run_dir / f"a_s{i}" / "fits_array.tif", last_step="convert")
+            .with_settings_hash("convert", hash_payload({"p": 1}))
+            .with_fingerprint(old)
+            .mark_done("convert")
+            .commit(series_index=i) for i in range(2)]
+
+
+def test_run_convert_converts_a_changed_multi_series_file_once(monkeypatch, DummyCtx_class, tmp_path: Path) -> None:
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name="ben"))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+    conversions: list[Path] = []
+    series = [tmp_path / f"a_s{i}" / "fits_array.tif" for i in range(2)]
+    monkeypatch.setattr("fits.workflows.tasks.convert.FitsIO.from_path", lambda p, channel_labels=None: conversions.append(p) or DummyReader(series))
+
+    out = run_convert(ConvertSettings(execution="thread", workers=2), _changed_multi_series_source(tmp_path), StepProfile("io", "convert"), "fits_array.tif")
+
+    assert conversions == [tmp_path / "a.nd2"]
+    assert [s.image for s in out] == series
+    assert all(s.source_fingerprint is not None and s.source_fingerprint.size == len(b"re-exported acquisition") for s in out)
+
+
+def test_convert_job_converts_a_changed_multi_series_file_once(monkeypatch, DummyCtx_class, tmp_path: Path) -> None:
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name="ben"))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+    conversions: list[Path] = []
+    series = [tmp_path / f"a_s{i}" / "fits_array.tif" for i in range(2)]
+    monkeypatch.setattr("fits.workflows.tasks.convert.FitsIO.from_path", lambda p, channel_labels=None: conversions.append(p) or DummyReader(series))
+    job = convert_job(ConvertSettings(execution="thread"), StepProfile("io", "convert"), "fits_array.tif")
+    assert job is not None
+
+    s0, s1 = _changed_multi_series_source(tmp_path)
+    assert [s.image for s in job.run(s0)] == series
+    assert job.run(s1) == []  # written by the conversion of its sibling
+    assert conversions == [tmp_path / "a.nd2"]
+
+
+def test_convert_job_converts_one_experiment_and_defers_to_run_convert_for_processes(monkeypatch, DummyCtx_class, tmp_path: Path) -> None:
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name="ben"))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+    raw = tmp_path / "a.nd2"
+    raw.write_bytes(b"raw")
+    monkeypatch.setattr(
+        "fits.workflows.tasks.convert.FitsIO.from_path",
+        lambda p, channel_labels=None: DummyReader([tmp_path / "a_s0" / "fits_array.tif"]),
+    )
+    profile = StepProfile("io", "convert")
+
+    assert convert_job(ConvertSettings(execution="process"), profile, "fits_array.tif") is None
+    assert convert_job(ConvertSettings(execution="thread", read_ahead=True), profile, "fits_array.tif") is None
+    # Features only run_convert implements keep the whole-step runner
+    assert convert_job(ConvertSettings(schedule="largest_first"), profile, "fits_array.tif") is None
+    assert convert_job(ConvertSettings(max_in_flight=2), profile, "fits_array.tif") is None
+    assert convert_job(ConvertSettings(ordered_execution=True), profile, "fits_array.tif") is None
+
+    job = convert_job(ConvertSettings(execution="serial"), profile, "fits_array.tif")
+    assert job is not None and job.concurrency == 1
+    [out] = job.run(ExperimentState.init(tmp_path, raw))
+    assert out.image_rel == Path("a_s0/fits_array.tif")
+    assert out.step_status == {"convert": "done"}
+
+
+def test_run_convert_reuses_the_output_cache_across_run_dirs(monkeypatch, DummyCtx_class, tmp_path: Path) -> None:
+    from fits.workflows.cache import OutputCache
+
+    cache = OutputCache(tmp_path / "cache")
+    user = {"name": "ben"}
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name=user["name"], output_cache=cache))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1, "user_name": user["name"]})
+    conversions: list[Path] = []
+    users: list[str] = []
+
+    class WritingReader:
+        def __init__(self, path: Path) -> None:
+            self.path = path
+
+        def convert_to_fits(self, **payload: dict) -> list[Path]:
+            conversions.append(self.path)
+            users.append(payload["user_name"])
+            out = self.path.parent / f"{self.path.stem}_s0" / "fits_array.tif"
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_bytes(b"converted")
+            return [out]
+
+    monkeypatch.setattr("fits.workflows.tasks.convert.FitsIO.from_path", lambda p, channel_labels=None: WritingReader(p))
+    outs = []
+    for run_name in ("run1", "run2"):
+        run_dir = tmp_path / run_name
+        run_dir.mkdir()
+        raw = run_dir / "a.nd2"
+        raw.write_bytes(b"same acquisition")
+        outs.extend(run_convert(ConvertSettings(execution="serial"), [ExperimentState.init(run_dir, raw)], StepProfile("io", "convert"), "fits_array.tif"))
+
+    assert conversions == [tmp_path / "run1" / "a.nd2"]
+    assert (tmp_path / "run2" / "a_s0" / "fits_array.tif").read_bytes() == b"converted"
+    assert [s.step_status for s in outs] == [{"convert": "done"}, {"convert": "done"}]
+
+    # Cached outputs do not name their converter, so another user reuses them too
+    assert users == ["output-cache"]
+    user["name"] = "ana"
+    run_dir = tmp_path / "run3"
+    run_dir.mkdir()
+    (run_dir / "a.nd2").write_bytes(b"same acquisition")
+    run_convert(ConvertSettings(execution="serial"), [ExperimentState.init(run_dir, run_dir / "a.nd2")], StepProfile("io", "convert"), "fits_array.tif")
+    assert conversions == [tmp_path / "run1" / "a.nd2"]
+    assert (run_dir / "a_s0" / "fits_array.tif").read_bytes() == b"converted"
+
+
+def test_run_convert_lists_experiments_not_started_when_cancelled(monkeypatch, DummyCtx_class, tmp_path: Path, caplog) -> None:
+    from fits.workflows.executors import CancelToken
+
+    token = CancelToken()
+    monkeypatch.setattr("fits.workflows.tasks.convert.get_ctx", lambda: DummyCtx_class(user_name="ben", cancel=token))
+    monkeypatch.setattr("fits.workflows.tasks.convert.build_payload", lambda *args, **kwargs: {"p": 1})
+
+    class CancellingReader:
+        def __init__(self, path: Path) -> None:
+            self.path = path
+
+        def convert_to_fits(self, **payload: dict) -> list[Path]:
+            token.cancel("SIGTERM")
+            out = self.path.parent / f"{self.path.stem}_s0" / "fits_array.tif"
+            out.parent.mkdir()
+            out.write_bytes(b"converted")
+            return [out]
+
+    monkeypatch.setattr("fits.workflows.tasks.convert.FitsIO.from_path", lambda p, channel_labels=None: CancellingReader(p))
+    raws = [tmp_path / f"{name}.nd2" for name in "abc"]
+    for raw in raws:
+        raw.write_bytes(b"raw")
+
+    out = run_convert(ConvertSettings(execution="serial"), [ExperimentState.init(tmp_path, raw) for raw in raws], StepProfile("io", "convert"), "fits_array.tif")
+
+    assert [s.original_image for s in out] == [raws[0]]
+    [warning] = [r.getMessage() for r in caplog.records if "interrupted" in r.getMessage()]
+    assert "2 experiment(s) not started" in warning
+    assert str(raws[1]) in warning and str(raws[2]) in warning and str(raws[0]) not in warning
+
+
+def test_read_ahead_reads_at_most_limit_bytes(monkeypatch, tmp_path: Path) -> None:
+    from fits.workflows.tasks import convert
+
+    raw = tmp_path / "big.nd2"
+    raw.write_bytes(b"x" * 1000)
+    read: list[int] = []
+    real_open = open
+
+    class CountingHandle:
+        def __init__(self, handle) -> None:
+            self.handle = handle
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info) -> None:
+            self.handle.close()
+
+        def readinto(self, buffer) -> int:
+            n = self.handle.readinto(buffer)
+            read.append(n)
+            return n
+
+    monkeypatch.setattr(convert, "open", lambda *args, **kwargs: CountingHandle(real_open(*args, **kwargs)), raising=False)
+    convert._read_ahead(raw, limit=300, block_size=128)
+    assert sum(read) < 1000 and sum(read) >= 300
+
+    read.clear()
+    convert._read_ahead(raw, limit=10_000, block_size=128)
+    assert sum(read) == 1000
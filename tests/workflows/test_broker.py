@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import math
+import multiprocessing
+import pickle
+import threading
+from pathlib import Path
+
+import pytest
+
+from fits.workflows import broker as broker_mod
+from fits.workflows.broker import BrokerExecutor, RemoteTaskError, TaskBroker, run_worker
+from fits.workflows.executors import ErrorPolicy, execute
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch) -> None:
+    monkeypatch.setattr(broker_mod, "BROKER_POLL_INTERVAL", 0.01)
+
+
+class PickyError(Exception):
+    # Pickles fine but cannot be unpickled: pickle calls PickyError(message)
+    def __init__(self, code: int, detail: str) -> None:
+        super().__init__(f"{code}: {detail}")
+
+
+def _raise_picky(x: float) -> float:
+    raise PickyError(1, "bad frame")
+
+
+def _start_workers(path: Path, n: int) -> tuple[threading.Event, list[threading.Thread]]:
+    stop = threading.Event()
+    threads = [threading.Thread(target=run_worker, args=(path,), kwargs={"name": f"w{i}", "poll": 0.01, "stop": stop}) for i in range(n)]
+    for t in threads:
+        t.start()
+    return stop, threads
+
+
+def test_execute_distributed_runs_tasks_on_broker_workers(tmp_path: Path) -> None:
+    stop, threads = _start_workers(tmp_path, 2)
+    try:
+        out = list(execute([4.0, 9.0, 16.0, 25.0], math.sqrt, mode="distributed", workers=2, ordered=True, broker=tmp_path))
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert out == [2.0, 3.0, 4.0, 5.0]
+    assert (tmp_path / ".fits_broker.sqlite").exists()
+
+
+def test_execute_distributed_sends_task_errors_back(tmp_path: Path) -> None:
+    stop, threads = _start_workers(tmp_path, 1)
+    try:
+        out = list(execute([4.0, -1.0], math.sqrt, mode="distributed", workers=1, ordered=True, broker=tmp_path,
+                           policy=ErrorPolicy("continue"), on_failure=lambda item, err: type(err).__name__))
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert out == [2.0, "ValueError"]
+
+
+def test_execute_distributed_fails_a_task_whose_error_cannot_be_unpickled(tmp_path: Path) -> None:
+    stop, threads = _start_workers(tmp_path, 1)
+    try:
+        out = list(execute([4.0, 9.0], _raise_picky, mode="distributed", workers=1, ordered=True, broker=tmp_path,
+                           policy=ErrorPolicy("continue"), on_failure=lambda item, err: (type(err).__name__, "Cannot unpickle" in str(err))))
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+    assert out == [("RemoteTaskError", True), ("RemoteTaskError", True)]
+
+
+def test_broker_executor_fails_pending_futures_when_its_collector_dies(monkeypatch, tmp_path: Path) -> None:
+    ex = BrokerExecutor(tmp_path)
+
+    def crash() -> None:
+        if ex._futures:
+            raise MemoryError("collector out of memory")
+    monkeypatch.setattr(ex, "_collect_once", crash)
+    fut = ex.submit(math.sqrt, 4.0)
+
+    assert isinstance(fut.exception(timeout=10), RemoteTaskError)
+    assert "collector out of memory" in str(fut.exception())
+    with pytest.raises(RemoteTaskError):
+        ex.submit(math.sqrt, 9.0)
+    monkeypatch.undo()
+    ex.shutdown()
+
+
+def test_execute_distributed_with_worker_processes(tmp_path: Path) -> None:
+    spawn = multiprocessing.get_context("spawn")
+    workers = [spawn.Process(target=run_worker, args=(tmp_path,), kwargs={"poll": 0.05, "idle_exit": 3.0}) for _ in range(2)]
+    for w in workers:
+        w.start()
+    try:
+        out = sorted(execute([1.0, 4.0, 9.0, 16.0], math.sqrt, mode="distributed", workers=2, broker=tmp_path))
+    finally:
+        for w in workers:
+            w.join(timeout=30)
+    assert out == [1.0, 2.0, 3.0, 4.0]
+
+
+def test_execute_distributed_requires_a_broker() -> None:
+    with pytest.raises(ValueError, match="broker"):
+        list(execute([1.0], math.sqrt, mode="distributed"))
+
+
+def test_broker_requeues_tasks_of_dead_workers(tmp_path: Path) -> None:
+    broker = TaskBroker(tmp_path)
+    batch = broker.register_batch(math.sqrt)
+    task_id = broker.submit(batch, 4.0)
+
+    claimed = broker.claim("dead-worker")
+    assert claimed is not None and claimed.task_id == task_id
+    assert broker.claim("other") is None
+    assert broker.requeue_stale(lease=-1.0) == 1
+
+    retry = broker.claim("other")
+    assert retry is not None and retry.item == 4.0
+    assert not broker.finish(task_id, "dead-worker", ok=True, result=pickle.dumps(-1.0))  # late result is dropped
+    assert broker.finish(retry.task_id, "other", ok=True, result=pickle.dumps(2.0))
+    assert not broker.finish(retry.task_id, "other", ok=True, result=pickle.dumps(-2.0))
+    assert [(tid, status, pickle.loads(res)) for tid, status, res in broker.poll([task_id])] == [(task_id, "done", 2.0)]
+    assert broker.poll([task_id]) == []  # collected results are removed
+    broker.close()
+
+
+def test_broker_cancel_only_removes_queued_tasks(tmp_path: Path) -> None:
+    broker = TaskBroker(tmp_path)
+    batch = broker.register_batch(math.sqrt)
+    running = broker.submit(batch, 1.0)
+    queued = broker.submit(batch, 4.0)
+    broker.claim("w")
+
+    assert broker.cancel([running, queued]) == 1
+    assert [row[:2] for row in broker.poll([running, queued])] == [(running, "running")]
+    broker.close()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+from fits.environment.fingerprint import FINGERPRINT_BLOCK_SIZE, compute_fingerprint, content_digest
+from fits.workflows.cache import OutputCache
+
+
+def _outputs(base: Path, content: bytes = b"tif") -> list[Path]:
+    out = base / "a_s0" / "fits_array.tif"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_bytes(content)
+    return [out]
+
+
+def test_output_cache_materialises_outputs_in_another_run(tmp_path: Path) -> None:
+    cache = OutputCache(tmp_path / "cache")
+    first, second = tmp_path / "run1", tmp_path / "run2"
+    assert cache.put("k" * 32, first, _outputs(first))
+
+    assert cache.get("x" * 32, second) is None
+    [out] = cache.get("k" * 32, second) or []
+    assert out == second / "a_s0" / "fits_array.tif"
+    assert out.read_bytes() == b"tif"
+
+
+def test_output_cache_key_ignores_path_and_mtime(tmp_path: Path) -> None:
+    a, b = tmp_path / "a.nd2", tmp_path / "copy" / "b.nd2"
+    b.parent.mkdir()
+    a.write_bytes(b"raw data")
+    b.write_bytes(b"raw data")
+    os.utime(b, ns=(1, 1))
+    key_a = OutputCache.key(content_digest(a), "convert", "hash", "1.0")
+    assert key_a == OutputCache.key(content_digest(b), "convert", "hash", "1.0")
+    assert key_a != OutputCache.key(content_digest(a), "convert", "other-hash", "1.0")
+    assert key_a != OutputCache.key(content_digest(a), "convert", "hash", "2.0")
+
+
+def test_source_digest_hashes_a_fingerprint_once(monkeypatch, tmp_path: Path) -> None:
+    cache = OutputCache(tmp_path / "cache")
+    raw = tmp_path / "a.nd2"
+    raw.write_bytes(b"raw data")
+    hashed: list[Path] = []
+    monkeypatch.setattr("fits.workflows.cache.content_digest", lambda p: hashed.append(p) or content_digest(p))
+
+    fingerprint = compute_fingerprint(raw)
+    assert cache.source_digest(raw, fingerprint) == content_digest(raw)
+    assert cache.source_digest(raw, fingerprint) == content_digest(raw)
+    assert hashed == [raw]
+
+    raw.write_bytes(b"new data")
+    assert cache.source_digest(raw, compute_fingerprint(raw)) == content_digest(raw)
+    assert hashed == [raw, raw]
+
+
+def test_content_digest_sees_changes_between_head_and_tail(tmp_path: Path) -> None:
+    a, b = tmp_path / "a.nd2", tmp_path / "b.nd2"
+    data = bytearray(3 * FINGERPRINT_BLOCK_SIZE)
+    a.write_bytes(data)
+    data[len(data) // 2] = 1
+    b.write_bytes(data)
+
+    assert content_digest(a) != content_digest(b)
+    assert content_digest(a, block_size=1000) == content_digest(a)
+
+
+def test_output_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = OutputCache(tmp_path / "cache")
+    run = tmp_path / "run"
+    for i, key in enumerate(("a" * 32, "b" * 32, "c" * 32)):
+        cache.put(key, run, _outputs(run, b"x" * 100))
+        os.utime(cache._entry(key) / "manifest.json", (i, i))
+    cache.get("a" * 32, tmp_path / "other")  # refreshes a
+
+    assert cache.evict(max_size=200) == 100
+    assert cache.get("b" * 32, tmp_path / "other") is None
+    assert cache.get("a" * 32, tmp_path / "other") is not None
+    assert cache.get("c" * 32, tmp_path / "other") is not None
+
+
+def test_output_cache_eviction_keeps_the_digest_index(tmp_path: Path) -> None:
+    cache = OutputCache(tmp_path / "cache")
+    raw = tmp_path / "a.nd2"
+    raw.write_bytes(b"raw data")
+    cache.source_digest(raw, compute_fingerprint(raw))
+    cache.put("a" * 32, tmp_path / "run", _outputs(tmp_path / "run", b"x" * 100))
+
+    assert cache.evict(max_size=0) == 100
+    assert len([p for p in (cache.root / "index").rglob("*") if p.is_file()]) == 1
+
+
+def test_output_cache_hardlink_shares_the_stored_file(tmp_path: Path) -> None:
+    cache = OutputCache(tmp_path / "cache", link="hardlink")
+    run = tmp_path / "run"
+    cache.put("k" * 32, run, _outputs(run))
+    [out] = cache.get("k" * 32, tmp_path / "other") or []
+    assert out.stat().st_ino == (cache._entry("k" * 32) / "files" / "a_s0" / "fits_array.tif").stat().st_ino
+
+
+def test_output_cache_from_setting() -> None:
+    assert OutputCache.from_setting("None") is None
+    cache = OutputCache.from_setting("/tmp/fits-cache", "1GB", "copy")
+    assert cache is not None and cache.max_size == 1 << 30 and cache.link == "copy"
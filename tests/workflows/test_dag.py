@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+import threading
+from typing import Any, Callable, Mapping
+
+import pytest
+
+from fits.environment.state import ExperimentState
+from fits.workflows.dag import StepJob, build_graph, run_dag
+from fits.workflows.execute import run_workflow
+from fits.workflows.executors import ErrorPolicy
+
+
+@dataclass
+class FakeSpec:
+    name: str
+    inputs: frozenset[str]
+    output_name: str
+    job: Callable[..., StepJob | None] | None
+
+    @property
+    def outputs(self) -> frozenset[str]:
+        return frozenset({self.output_name})
+
+    @property
+    def step_profile(self) -> Any:
+        return self.name
+
+    def model_validate(self, params: Mapping[str, Any]) -> Mapping[str, Any]:
+        return params
+
+
+def _spec(name: str, inputs: set[str], run: Callable[[ExperimentState], list[ExperimentState]], **job_kwargs: Any) -> FakeSpec:
+    return FakeSpec(name, frozenset(inputs), f"{name}.tif", lambda settings, profile, output: StepJob(run=run, **job_kwargs))
+
+
+def _mark(step: str) -> Callable[[ExperimentState], list[ExperimentState]]:
+    return lambda st: [st.mark_done(step)]
+
+
+def _states(*names: str) -> list[ExperimentState]:
+    run_dir = Path("/tmp")
+    return [ExperimentState.init(run_dir, run_dir / f"{name}.nd2") for name in names]
+
+
+def _enabled(*names: str) -> dict[str, Any]:
+    return {name: {"enabled": True} for name in names}
+
+
+def test_build_graph_links_steps_by_inputs_and_outputs() -> None:
+    registry = {"track": _spec("track", {"segment.tif"}, _mark("track")),
+                "segment": _spec("segment", {"convert.tif"}, _mark("segment")),
+                "convert": _spec("convert", set(), _mark("convert"))}
+    graph = build_graph(_enabled("convert", "segment", "track"), registry)
+    assert graph is not None
+    assert list(graph.nodes) == ["convert", "segment", "track"]
+    assert graph.roots == ["convert"]
+    assert graph.nodes["convert"].downstream == ("segment",)
+
+    # inputs of a disabled step are expected on disk
+    partial_graph = build_graph(_enabled("track"), registry)
+    assert partial_graph is not None and partial_graph.roots == ["track"]
+
+
+def test_build_graph_rejects_cycles_and_falls_back_without_jobs() -> None:
+    cyclic = {"a": _spec("a", {"b.tif"}, _mark("a")), "b": _spec("b", {"a.tif"}, _mark("b"))}
+    with pytest.raises(ValueError, match="cycle"):
+        build_graph(_enabled("a", "b"), cyclic)
+
+    no_job = {"a": FakeSpec("a", frozenset(), "a.tif", None)}
+    assert build_graph(_enabled("a"), no_job) is None
+    assert build_graph({}, cyclic) is None
+
+
+def test_run_dag_moves_experiments_on_without_a_step_barrier() -> None:
+    a_segmented = threading.Event()
+
+    def convert(st: ExperimentState) -> list[ExperimentState]:
+        if st.original_image.stem == "z":
+            # z only finishes converting once a went through segmentation
+            assert a_segmented.wait(5)
+        return [st.mark_done("convert")]
+
+    def segment(st: ExperimentState) -> list[ExperimentState]:
+        if st.original_image.stem == "a":
+            a_segmented.set()
+        return [st.mark_done("segment")]
+
+    registry = {"convert": _spec("convert", set(), convert, concurrency=2),
+                "segment": _spec("segment", {"convert.tif"}, segment, concurrency=1)}
+    graph = build_graph(_enabled("convert", "segment"), registry)
+    assert graph is not None
+    out = run_dag(graph, _states("a", "z"))
+    assert sorted(st.original_image.stem for st in out) == ["a", "z"]
+    assert all(st.step_status == {"convert": "done", "segment": "done"} for st in out)
+
+
+def test_run_dag_respects_per_step_concurrency() -> None:
+    lock = threading.Lock()
+    active = {"n": 0, "max": 0}
+
+    def slow(st: ExperimentState) -> list[ExperimentState]:
+        with lock:
+            active["n"] += 1
+            active["max"] = max(active["max"], active["n"])
+        threading.Event().wait(0.01)
+        with lock:
+            active["n"] -= 1
+        return [st.mark_done("segment")]
+
+    registry = {"convert": _spec("convert", set(), _mark("convert"), concurrency=4),
+                "segment": _spec("segment", {"convert.tif"}, slow, concurrency=2)}
+    graph = build_graph(_enabled("convert", "segment"), registry)
+    assert graph is not None
+    out = run_dag(graph, iter(_states(*"abcdefgh")))
+    assert len(out) == 8
+    assert active["max"] <= 2
+
+
+def test_run_dag_joins_branches_and_drops_failed_states() -> None:
+    def fail_b(st: ExperimentState) -> list[ExperimentState]:
+        if st.original_image.stem == "b":
+            raise ValueError("boom")
+        return [st.mark_done("masks")]
+
+    registry = {"convert": _spec("convert", set(), _mark("convert")),
+                "masks": _spec("masks", {"convert.tif"}, fail_b, policy=ErrorPolicy("continue"),
+                               on_failure=lambda st, err: [st.mark_failed("masks", err)]),
+                "stats": _spec("stats", {"convert.tif"}, _mark("stats")),
+                "report": FakeSpec("report", frozenset({"masks.tif", "stats.tif"}), "report.tif", lambda s, p, o: StepJob(run=_mark("report")))}
+    graph = build_graph(_enabled("convert", "masks", "stats", "report"), registry)
+    assert graph is not None
+    assert graph.nodes["report"].upstream == ("masks", "stats")
+
+    out = run_dag(graph, _states("a", "b"))
+    by_name = {(st.original_image.stem, st.step_status.get("report")) for st in out}
+    assert ("a", "done") in by_name
+    a_report = next(st for st in out if st.original_image.stem == "a" and "report" in st.step_status)
+    assert a_report.step_status == {"convert": "done", "masks": "done", "stats": "done", "report": "done"}
+    failed = [st for st in out if st.step_status.get("masks") == "failed"]
+    assert [st.original_image.stem for st in failed] == ["b"]
+
+
+def test_run_dag_fail_fast_raises_and_closes_steps() -> None:
+    closed: list[str] = []
+
+    def boom(st: ExperimentState) -> list[ExperimentState]:
+        raise ValueError("boom")
+
+    registry = {"convert": _spec("convert", set(), boom, close=lambda: closed.append("convert"))}
+    graph = build_graph(_enabled("convert"), registry)
+    assert graph is not None
+    with pytest.raises(RuntimeError, match="Step 'convert' failed"):
+        run_dag(graph, _states("a"))
+    assert closed == ["convert"]
+
+
+def test_run_dag_fail_fast_on_shared_pools_closes_steps_after_running_tasks() -> None:
+    from fits.workflows.executors import WorkerPools
+
+    events: list[str] = []
+    slow_started = threading.Event()
+
+    def run(st: ExperimentState) -> list[ExperimentState]:
+        if st.original_image.stem == "bad":
+            slow_started.wait(5)
+            raise ValueError("boom")
+        slow_started.set()
+        threading.Event().wait(0.3)
+        events.append("slow done")
+        return [st.mark_done("convert")]
+
+    registry = {"convert": _spec("convert", set(), run, concurrency=2, close=lambda: events.append("closed"))}
+    graph = build_graph(_enabled("convert"), registry)
+    assert graph is not None
+    with WorkerPools() as pools:
+        with pytest.raises(RuntimeError, match="Step 'convert' failed"):
+            run_dag(graph, _states("bad", "slow"), pools=pools)
+        assert events == ["slow done", "closed"]
+
+
+def test_run_workflow_uses_the_dag_when_every_step_has_a_job(monkeypatch) -> None:
+    registry = {"convert": _spec("convert", set(), _mark("convert"))}
+    monkeypatch.setattr("fits.workflows.execute.WORKFLOW_ORDER", ["convert"])
+    monkeypatch.setattr("fits.workflows.execute.REGISTRY", registry)
+
+    out = run_workflow({"runtime": {"workflow": "dag"}, **_enabled("convert")}, _states("a"))
+    assert [st.step_status for st in out] == [{"convert": "done"}]
+
+    with pytest.raises(ValueError, match="workflow engine"):
+        run_workflow({"runtime": {"workflow": "bogus"}, **_enabled("convert")}, _states("a"))
+
+
+def test_run_dag_lists_experiments_not_started_when_cancelled(caplog) -> None:
+    from fits.workflows.executors import CancelToken
+
+    token = CancelToken()
+
+    def convert(st: ExperimentState) -> list[ExperimentState]:
+        token.cancel("SIGTERM")
+        return [st.mark_done("convert")]
+
+    registry = {"convert": _spec("convert", set(), convert, concurrency=1)}
+    graph = build_graph(_enabled("convert"), registry)
+    assert graph is not None
+    out = run_dag(graph, iter(_states("a", "b", "c", "d")), cancel=token, max_in_flight=2)
+
+    assert [st.original_image.stem for st in out] == ["a"]
+    [warning] = [r.getMessage() for r in caplog.records if "cancelled" in r.getMessage()]
+    assert "3 experiment(s) were not started" in warning
+    assert all(f"/tmp/{name}.nd2" in warning for name in "bcd")
@@ -7,7 +7,7 @@ from typing import Any, Mapping
 import pytest
 
 from fits.environment.state import ExperimentState
-from fits.workflows.execute import run_workflow
+from fits.workflows.execute import run_workflow, step_order
 
 
 @dataclass
@@ -19,6 +19,8 @@ class DummyStepSpec:
     def __init__(self, name: str):
         self.name = name
         self.output_name = f"{name}_out"
+        self.inputs: frozenset[str] = frozenset()
+        self.outputs = frozenset({self.output_name})
         self.distribution = "test"
         self.step_profile = type("SP", (), {"step_name": name})()  # minimal shape
         self.validate_calls: list[Mapping[str, Any]] = []
@@ -118,3 +120,18 @@ def test_run_workflow_default_user_cfg_when_step_missing(monkeypatch) -> None:
     assert out == states
     assert convert.validate_calls == []
     assert convert.runner_calls == []
+
+
+def test_step_order_follows_inputs_and_outputs(monkeypatch) -> None:
+    monkeypatch.setattr("fits.workflows.execute.WORKFLOW_ORDER", ["convert"])
+    convert, analyse, segment, export = (DummyStepSpec(name) for name in ("convert", "analyse", "segment", "export"))
+    segment.inputs = frozenset({"convert_out"})
+    # analyse sorts before segment by name, but needs its masks
+    analyse.inputs = frozenset({"segment_out", "convert_out"})
+    registry = {"analyse": analyse, "export": export, "segment": segment, "convert": convert}
+
+    assert step_order(registry) == ["convert", "export", "segment", "analyse"]
+
+    convert.inputs = frozenset({"analyse_out"})
+    with pytest.raises(ValueError, match="cycle"):
+        step_order(registry)
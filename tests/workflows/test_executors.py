@@ -0,0 +1,339 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from fits.environment.context import ExecutionContext
+from fits.environment.runtime import get_ctx, init_worker_ctx
+from fits.environment.statcache import StatCache
+from fits.workflows.executors import CancelToken, ErrorPolicy, Stage, WorkerPools, execute, execute_staged, schedule_items, warm_cache
+from fits.workflows.memory import MemoryBudget
+from fits.workflows.telemetry import Telemetry
+
+
+def _user_of_current_ctx(_: int) -> str:
+    return get_ctx().user_name
+
+
+def _square(x: int) -> int:
+    return x * x
+
+
+def _fail_on_two(x: int) -> int:
+    if x == 2:
+        raise ValueError("boom")
+    return x
+
+
+@pytest.mark.parametrize("mode", ["serial", "thread", "process"])
+def test_execute_ordered_results_for_every_mode(mode) -> None:
+    assert list(execute(range(5), abs, mode=mode, workers=2, ordered=True)) == [0, 1, 2, 3, 4]
+
+
+def test_execute_accepts_lazy_iterables() -> None:
+    items = (i for i in range(4))
+    assert sorted(execute(items, abs, mode="thread", workers=2)) == [0, 1, 2, 3]
+
+
+def test_execute_process_initializer_sets_ctx_in_workers() -> None:
+    ctx = ExecutionContext(user_name="ben", stat_cache=StatCache()).portable()
+
+    out = list(execute(range(3), _user_of_current_ctx, mode="process", workers=2, ordered=True, initializer=init_worker_ctx, initargs=(ctx,)))
+
+    assert out == ["ben", "ben", "ben"]
+
+
+def test_execute_unordered_wraps_task_errors() -> None:
+    with pytest.raises(RuntimeError, match="Task failed for item: 2"):
+        list(execute(range(4), _fail_on_two, mode="thread", workers=2))
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_execute_bounds_items_in_flight(ordered) -> None:
+    pulled = 0
+
+    def source():
+        nonlocal pulled
+        for i in range(50):
+            pulled += 1
+            yield i
+
+    out = []
+    for result in execute(source(), abs, mode="thread", workers=2, ordered=ordered, max_in_flight=3):
+        out.append(result)
+        # never more than the window ahead of what the consumer has received
+        assert pulled - len(out) <= 3
+
+    assert sorted(out) == list(range(50))
+    if ordered:
+        assert out == list(range(50))
+
+
+def test_execute_rejects_empty_window() -> None:
+    with pytest.raises(ValueError):
+        list(execute(range(3), abs, mode="thread", max_in_flight=0))
+
+
+@pytest.mark.parametrize("mode,ordered", [("serial", True), ("thread", True), ("thread", False)])
+def test_execute_continue_replaces_failures_with_on_failure(mode, ordered) -> None:
+    out = list(execute(range(4), _fail_on_two, mode=mode, workers=2, ordered=ordered, policy=ErrorPolicy("continue"), on_failure=lambda item, exc: -item))
+
+    assert sorted(out) == [-2, 0, 1, 3]
+
+
+def test_execute_retry_with_backoff_until_success() -> None:
+    attempts: dict[int, int] = {}
+
+    def flaky(x: int) -> int:
+        attempts[x] = attempts.get(x, 0) + 1
+        if x == 1 and attempts[x] < 3:
+            raise OSError("transient")
+        return x
+
+    out = list(execute(range(3), flaky, mode="thread", workers=2, ordered=True, policy=ErrorPolicy.retry(2, backoff=0.0)))
+
+    assert out == [0, 1, 2]
+    assert attempts[1] == 3
+
+
+def test_execute_timeout_fails_hung_tasks_only() -> None:
+    release = threading.Event()
+
+    def maybe_hang(x: int) -> int:
+        if x == 0:
+            release.wait(5)
+        return x
+
+    failures: list[BaseException] = []
+    try:
+        out = list(execute(range(3), maybe_hang, mode="thread", workers=2, ordered=True, policy=ErrorPolicy("continue", timeout=0.2), on_failure=lambda item, exc: failures.append(exc) or None))
+    finally:
+        release.set()
+
+    assert out == [None, 1, 2]
+    assert isinstance(failures[0], TimeoutError)
+
+
+def test_execute_memory_budget_lets_small_items_overtake_large_ones() -> None:
+    budget = MemoryBudget(100)
+    peak = 0
+    lock = threading.Lock()
+    big_started = threading.Event()
+    smalls_done = threading.Event()
+    finished: list[int] = []
+
+    def task(size: int) -> int:
+        nonlocal peak
+        with lock:
+            peak = max(peak, budget.in_use)
+        if size == 80:
+            big_started.set()
+            smalls_done.wait(5)
+        with lock:
+            finished.append(size)
+            if finished.count(10) == 3:
+                smalls_done.set()
+        return size
+
+    # the second big item cannot fit while the first runs, the small ones behind it can
+    out = list(execute([80, 80, 10, 10, 10], task, mode="thread", workers=4, budget=budget, cost=lambda size: size))
+
+    assert sorted(out) == [10, 10, 10, 80, 80]
+    assert peak <= 100
+    assert finished.index(80) > finished.index(10)
+    assert budget.in_use == 0
+
+
+def test_execute_early_exit_keeps_the_budget_of_running_tasks_until_they_finish() -> None:
+    budget = MemoryBudget(100)
+    pools = WorkerPools()
+    started, release = threading.Event(), threading.Event()
+
+    def work(size: int) -> int:
+        if size == 30:
+            started.set()
+            release.wait(5)
+        return size
+
+    results = execute([10, 30, 20], work, mode="thread", workers=1, max_in_flight=2, budget=budget, cost=lambda size: size, pools=pools)
+    assert next(results) == 10
+    assert started.wait(5)
+    results.close()  # the consumer stops while 30 is running and 20 is queued
+    assert budget.in_use == 30
+
+    release.set()
+    pools.shutdown(wait=True)
+    assert budget.in_use == 0
+
+
+def test_execute_memory_budget_runs_oversized_items_alone() -> None:
+    budget = MemoryBudget(10)
+    out = list(execute([50, 1, 50], abs, mode="thread", workers=2, ordered=True, budget=budget, cost=lambda size: size))
+    assert out == [50, 1, 50]
+    assert budget.in_use == 0
+
+
+def _double(x: int) -> int:
+    return 2 * x
+
+
+def test_execute_staged_chains_stages_on_their_own_pools() -> None:
+    stages = [Stage("read", abs, mode="thread", workers=2), Stage("compute", _double, mode="thread", workers=2)]
+
+    assert list(execute_staged([-1, 2, -3], stages, ordered=True)) == [2, 4, 6]
+
+
+def test_execute_staged_failure_skips_later_stages() -> None:
+    computed: list[int] = []
+
+    def compute(x: int) -> int:
+        computed.append(x)
+        return x
+
+    stages = [Stage("read", _fail_on_two, mode="thread", workers=2), Stage("compute", compute, mode="serial")]
+    out = list(execute_staged(range(4), stages, ordered=True, policy=ErrorPolicy("continue"), on_failure=lambda item, exc: (item, type(exc).__name__)))
+
+    assert out == [0, 1, (2, "ValueError"), 3]
+    assert computed == [0, 1, 3]
+
+
+def _pid(_: int) -> int:
+    import os
+    return os.getpid()
+
+
+def test_worker_pools_are_reused_across_execute_calls() -> None:
+    with WorkerPools() as pools:
+        first = set(execute(range(4), _pid, mode="process", workers=1, pools=pools))
+        second = set(execute(range(4), _pid, mode="process", workers=1, pools=pools))
+        assert first == second  # same warm worker process
+        assert pools.get("process", 1) is pools.get("process", 1)
+        assert pools.get("thread", 1) is not pools.get("process", 1)
+
+    with pytest.raises(RuntimeError):
+        pools.get("thread", 1)
+
+
+def test_warm_cache_builds_once_per_process() -> None:
+    calls: list[int] = []
+
+    def build() -> object:
+        calls.append(1)
+        return object()
+
+    assert warm_cache(("test", "model"), build) is warm_cache(("test", "model"), build)
+    assert len(calls) == 1
+
+
+def test_execute_serial_stops_submitting_once_cancelled() -> None:
+    token = CancelToken()
+    out: list[int] = []
+    for x in execute(range(10), lambda x: x, mode="serial", cancel=token):
+        out.append(x)
+        if x == 2:
+            token.cancel("SIGINT")
+    assert out == [0, 1, 2]
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_execute_cancel_lets_running_tasks_finish_and_drops_queued(ordered) -> None:
+    token = CancelToken()
+    started = threading.Event()
+    release = threading.Event()
+    submitted: list[int] = []
+
+    def work(x: int) -> int:
+        if x == 0:
+            started.set()
+            release.wait(5)
+        return x
+
+    def source():
+        for x in range(100):
+            submitted.append(x)
+            yield x
+
+    def cancel_while_running() -> None:
+        started.wait(5)
+        token.cancel("SIGTERM")
+        release.set()
+
+    threading.Thread(target=cancel_while_running).start()
+    out = list(execute(source(), work, mode="thread", workers=1, max_in_flight=3, ordered=ordered, cancel=token))
+    assert 0 in out  # the running task completed
+    assert len(submitted) <= 3  # nothing was pulled past the window once cancelled
+    assert len(out) < 100
+
+
+def test_schedule_items_largest_first() -> None:
+    sizes = [3, 9, 1, 9, 5]
+    assert schedule_items(sizes, "input", float).__next__() == 3
+    assert list(schedule_items(sizes, "largest_first", float)) == [9, 9, 5, 3, 1]
+    # lazy input: reordered within the lookahead buffer only
+    assert list(schedule_items(iter([1, 2, 3, 9, 5]), "largest_first", float, lookahead=2)) == [3, 9, 5, 2, 1]
+    with pytest.raises(ValueError, match="lookahead"):
+        list(schedule_items(iter([1, 2]), "largest_first", float))
+
+
+def test_execute_largest_first_starts_before_a_lazy_source_is_exhausted() -> None:
+    pulled: list[int] = []
+    seen_at_first_task: list[int] = []
+
+    def source():
+        for x in range(100):
+            pulled.append(x)
+            yield x
+
+    def work(x: int) -> int:
+        if not seen_at_first_task:
+            seen_at_first_task.append(len(pulled))
+        return x
+
+    out = list(execute(source(), work, mode="thread", workers=1, max_in_flight=2, schedule="largest_first", weight=float))
+    assert sorted(out) == list(range(100))
+    assert seen_at_first_task[0] <= 4  # reordered within the in-flight window only
+
+
+def test_execute_largest_first_submits_heaviest_items_first() -> None:
+    started: list[int] = []
+
+    def work(x: int) -> int:
+        started.append(x)
+        return x
+
+    assert sorted(execute([1, 4, 2, 8], work, mode="thread", workers=1, schedule="largest_first", weight=float)) == [1, 2, 4, 8]
+    assert started == [8, 4, 2, 1]
+    started.clear()
+    assert list(execute([1, 4, 2, 8], work, mode="thread", workers=1, ordered=True, schedule="largest_first", weight=float)) == [1, 4, 2, 8]
+
+
+@pytest.mark.parametrize("mode", ["serial", "thread", "process"])
+def test_execute_telemetry_records_every_task(mode) -> None:
+    telemetry: Telemetry[int, int] = Telemetry("square", bytes_in=lambda x: x * 10, bytes_out=lambda r: r)
+    out = sorted(execute([1, 2, 3], _square, mode=mode, workers=2, telemetry=telemetry))
+    assert out == [1, 4, 9]
+
+    records = sorted(telemetry.records, key=lambda r: r.item)
+    assert [r.item for r in records] == ["1", "2", "3"]
+    assert all(r.submit <= r.start <= r.end and r.worker for r in records)  # type: ignore[operator]
+    assert [(r.bytes_in, r.bytes_out) for r in records] == [(10, 1), (20, 4), (30, 9)]
+    summary = telemetry.summary()
+    assert summary["tasks"] == 3 and summary["failed"] == 0
+    assert summary["mode"] == mode and summary["latency_p95_s"] >= summary["latency_p50_s"]
+
+
+def test_execute_telemetry_records_failures_and_writes_json(tmp_path) -> None:
+    import json
+    from fits.workflows.telemetry import write_telemetry
+
+    telemetry: Telemetry[int, int] = Telemetry("fail")
+    out = list(execute([1, 2, 3], _fail_on_two, mode="thread", workers=2, ordered=True, policy=ErrorPolicy("continue"), telemetry=telemetry))
+    assert out == [1, 3]
+    assert [r.error for r in sorted(telemetry.records, key=lambda r: r.item)] == [None, "ValueError: boom", None]
+
+    path = write_telemetry(tmp_path, "convert", [telemetry])
+    data = json.loads(path.read_text())
+    assert data["step"] == "convert"
+    assert data["stages"][0]["summary"]["failed"] == 1
+    assert len(data["stages"][0]["tasks"]) == 3
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from fits.workflows.memory import MemoryBudget, file_size_footprint, parse_memory_size
+
+
+@pytest.mark.parametrize("value,expected", [("48GB", 48 << 30), ("512 MiB", 512 << 20), ("1.5g", int(1.5 * (1 << 30))), ("100", 100), (2048, 2048)])
+def test_parse_memory_size(value, expected) -> None:
+    assert parse_memory_size(value) == expected
+
+
+def test_parse_memory_size_rejects_garbage() -> None:
+    with pytest.raises(ValueError):
+        parse_memory_size("lots")
+
+
+def test_memory_budget_from_setting_none_means_unlimited() -> None:
+    assert MemoryBudget.from_setting(None) is None
+    assert MemoryBudget.from_setting("None") is None
+    assert MemoryBudget.from_setting("1KB").limit == 1024
+
+
+def test_memory_budget_admits_within_limit_or_forced() -> None:
+    budget = MemoryBudget(100)
+
+    assert budget.try_acquire(60)
+    assert not budget.try_acquire(50)
+    assert budget.try_acquire(500, force=True)
+    budget.release(560)
+    assert budget.in_use == 0
+
+
+def test_file_size_footprint(tmp_path: Path) -> None:
+    f = tmp_path / "a.nd2"
+    f.write_bytes(b"x" * 10)
+    assert file_size_footprint(f, 2.5) == 25
+    assert file_size_footprint(tmp_path / "missing.nd2", 2.5) == 0
@@ -1,4 +1,11 @@
-from fits.workflows.registry import REGISTRY
+from dataclasses import replace
+import os
+import subprocess
+import sys
+
+import pytest
+
+from fits.workflows.registry import REGISTRY, StepSpec, load_ref, load_registry
 from fits.environment.constant import STEP_CONVERT, DIST_IO
 from fits.workflows.provenance import StepProfile
 
@@ -19,3 +26,41 @@ def test_registry_settings_model_validates() -> None:
 def test_registry_runner_is_callable() -> None:
     for spec in REGISTRY.values():
         assert callable(spec.runner)
+
+def test_registry_import_does_not_import_step_code() -> None:
+    code = "import sys, fits.workflows.registry; print('fits.workflows.tasks.convert' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)})
+    assert out.stdout.strip() == "False"
+
+def test_load_ref_imports_on_demand() -> None:
+    assert load_ref("fits.workflows.registry:StepSpec") is StepSpec
+    with pytest.raises(ImportError):
+        load_ref("fits.workflows.registry:missing")
+    with pytest.raises(ValueError):
+        load_ref("fits.workflows.registry")
+
+PLUGIN_STEP = StepSpec(name="segment", settings_ref="fits.settings.models:ConvertSettings", output_name="fits_mask.tif",
+                       runner_ref="lab_steps.segment:run_segment", distribution="lab-steps", inputs=frozenset({"fits_array.tif"}))
+
+class _EntryPoint:
+    def __init__(self, name: str, value: object) -> None:
+        self.name, self.value, self._value = name, repr(value), value
+
+    def load(self) -> object:
+        if isinstance(self._value, Exception):
+            raise self._value
+        return self._value
+
+def test_load_registry_adds_entry_point_steps(monkeypatch) -> None:
+    eps = [_EntryPoint("convert", REGISTRY[STEP_CONVERT]), _EntryPoint("segment", PLUGIN_STEP),
+           _EntryPoint("broken", ImportError("no module")), _EntryPoint("other", object()),
+           _EntryPoint("clash", replace(PLUGIN_STEP, name=STEP_CONVERT))]
+    monkeypatch.setattr("fits.workflows.registry.entry_points", lambda group: eps)
+
+    registry = load_registry()
+
+    assert list(registry) == [STEP_CONVERT, "segment"]
+    assert registry[STEP_CONVERT] is REGISTRY[STEP_CONVERT]
+    # The runner of the plugin is not imported until used
+    with pytest.raises(ImportError):
+        registry["segment"].runner